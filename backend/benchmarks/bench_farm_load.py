@@ -0,0 +1,113 @@
+"""
+Benchmark the farms table loaders (ORM vs batched INSERT vs COPY).
+
+Run from the backend directory against a local PostGIS database:
+    python -m benchmarks.bench_farm_load --rows 100000 --force
+
+WARNING: each run TRUNCATEs the farms table of DATABASE_URL, so point it
+at a scratch database.
+"""
+import argparse
+import json
+import sys
+import time
+
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import box
+from sqlalchemy import text
+
+from database import SessionLocal, init_db
+from services import bulk_load, ingest
+
+METHODS = ['orm', 'insert', 'copy']
+
+
+def synthetic_merged(n_rows: int, seed: int = 0) -> gpd.GeoDataFrame:
+    """Synthetic merged pipeline output: farm attributes, polygons and NDVI"""
+    rng = np.random.default_rng(seed)
+    lat = rng.uniform(26.0, 30.0, n_rows)
+    lon = rng.uniform(77.0, 84.0, n_rows)
+    size = rng.uniform(0.0005, 0.002, n_rows)
+    recent = rng.uniform(0.1, 0.9, n_rows)
+    prev = rng.uniform(0.1, 0.9, n_rows)
+    vill = rng.integers(1, 500, n_rows)
+    gdf = gpd.GeoDataFrame({
+        'farm_id': [f'F{i:08d}' for i in range(n_rows)],
+        'Div_Name': 'Division',
+        'Vill_Cd': vill,
+        'Vill_Name': [f'Village {v}' for v in vill],
+        'Vill_Code': vill,
+        'Supervisor Name': 'Supervisor',
+        'Farmer_Name': 'Farmer',
+        'Father_Name': 'Father',
+        'Plot No': rng.integers(1, 2000, n_rows),
+        'Gashti No.': rng.integers(1, 50, n_rows),
+        'Survey Date': '3/15/2024',
+        'Area': rng.uniform(0.1, 5.0, n_rows).round(3),
+        'Shar': rng.integers(0, 3, n_rows),
+        'Varieties': 'Co 0238',
+        'Crop Type': 'Plant',
+        'East': 1, 'West': 2, 'North': 3, 'South': 4,
+        'WKT': '',
+        'recent_date': '2024-03-10',
+        'recent_ndvi': recent,
+        'prev_date': '2024-02-24',
+        'prev_ndvi': prev,
+        'delta': recent - prev,
+    }, geometry=[box(x, y, x + s, y + s) for x, y, s in zip(lon, lat, size)], crs='EPSG:4326')
+    return ingest.apply_harvest_flag(gdf)
+
+
+def run(method: str, merged: gpd.GeoDataFrame) -> dict:
+    db = SessionLocal()
+    try:
+        db.execute(text("TRUNCATE farms RESTART IDENTITY"))
+        db.commit()
+        start = time.perf_counter()
+        if method == 'orm':
+            count = ingest.save_farms(db, merged)
+        else:
+            count, method = bulk_load.load_farms(db, merged, method)
+        db.commit()
+        elapsed = time.perf_counter() - start
+        stored = db.execute(text("SELECT count(*) FROM farms")).scalar()
+    finally:
+        db.close()
+    return {
+        'method': method,
+        'rows': count,
+        'stored': stored,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(bulk_load.rows_per_second(count, elapsed), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark farms table loaders.")
+    parser.add_argument('--rows', type=int, default=100000, help='Synthetic farms to load')
+    parser.add_argument('--methods', default=','.join(METHODS), help='Comma-separated loaders to run')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    parser.add_argument('--force', action='store_true', help='Confirm the farms table may be truncated')
+    args = parser.parse_args()
+
+    if not args.force:
+        print("This benchmark TRUNCATEs the farms table. Re-run with --force on a scratch database.")
+        sys.exit(1)
+
+    init_db()
+    merged = synthetic_merged(args.rows)
+    results = []
+    for method in args.methods.split(','):
+        result = run(method.strip(), merged)
+        results.append(result)
+        print(f"{result['method']:>7}: {result['rows']} rows in {result['seconds']:.2f}s "
+              f"({result['rows_per_sec']:.0f} rows/sec)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'rows': args.rows, 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+End-to-end ingest benchmark: runs ingest.full_pipeline (chunked_pipeline
+with --memory-budget) on synthetic farm CSVs with a stub NDVI CSV (no
+Earth Engine) and reports the stage timings it records, from parsing
+through the NDVI cache lookup, the load, the NDVI history and the staging
+table create/index/swap. With --ndvi-latency or --ndvi-failure-rate, NDVI
+is extracted instead through the synthetic provider, which exercises the
+scheduler, retries and result writer.
+
+Run from the backend directory:
+    python -m benchmarks.bench_ingest --sizes 10000,100000,1000000 --force --out bench.json
+    python -m benchmarks.bench_ingest --sizes 1000000 --memory-budget 256 --force
+    python -m benchmarks.bench_ingest --sizes 50000 --ndvi-latency 0.0005 --ndvi-failure-rate 0.05 --force
+
+Results are JSON (one record per size, stage timings and rows/sec) so
+runs from different versions can be diffed to catch regressions. Without
+--out, stdout carries only the JSON; progress goes to stderr.
+
+WARNING: every run replaces the farms table of DATABASE_URL; use a scratch database.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Optional
+
+from benchmarks import synthetic
+from database import init_db
+from services import bulk_load, ingest, ndvi_providers
+from services.metrics import StageRecorder
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+BENCH_PROVIDER = 'bench'
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+@contextlib.contextmanager
+def ndvi_provider(provider: ndvi_providers.NdviProvider):
+    """Make provider the one the pipeline extracts NDVI with"""
+    ndvi_providers.register_provider(BENCH_PROVIDER, lambda: provider)
+    previous, ndvi_providers.NDVI_PROVIDER = ndvi_providers.NDVI_PROVIDER, BENCH_PROVIDER
+    try:
+        yield provider
+    finally:
+        ndvi_providers.NDVI_PROVIDER = previous
+        del ndvi_providers.PROVIDERS[BENCH_PROVIDER]
+
+
+def bench_size(n_rows: int, data_dir: str, memory_budget_mb: Optional[float] = None,
+               provider: Optional[ndvi_providers.SyntheticProvider] = None) -> dict:
+    paths = synthetic.ensure_dataset(data_dir, n_rows)
+    metrics = StageRecorder()
+    start = time.perf_counter()
+    if provider is not None:
+        with ndvi_provider(provider):
+            n_ok, rejected = ingest.full_pipeline(paths['farms'], None, None, memory_budget_mb=memory_budget_mb,
+                                                  metrics=metrics)
+    else:
+        n_ok, rejected = ingest.full_pipeline(paths['farms'], None, paths['ndvi'], memory_budget_mb=memory_budget_mb,
+                                              metrics=metrics)
+    total = time.perf_counter() - start
+
+    result = {
+        'rows': n_rows,
+        'farms': n_ok,
+        'rejected': rejected,
+        'duplicates': n_rows - n_ok - rejected,
+        'total_seconds': round(total, 4),
+        'rows_per_sec': round(bulk_load.rows_per_second(n_rows, total), 1),
+        'stages': metrics.as_list(),
+    }
+    if provider is not None:
+        result['ndvi_requests'] = provider.requests
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ingest pipeline stages.")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='Comma-separated row counts')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'ingest_bench'),
+                        help='Where synthetic CSVs are generated (and reused)')
+    parser.add_argument('--memory-budget', type=float, help='Stream the CSV in chunks sized to this many MB')
+    parser.add_argument('--force', action='store_true', help='Confirm the farms table may be replaced')
+    parser.add_argument('--ndvi-latency', type=float, help='Extract NDVI with the synthetic provider: seconds per farm')
+    parser.add_argument('--ndvi-failure-rate', type=float, help='Synthetic provider: share of failing requests')
+    parser.add_argument('--out', help='Write JSON results to this file (default: stdout)')
+    args = parser.parse_args(argv)
+    synthetic_ndvi = args.ndvi_latency is not None or args.ndvi_failure_rate is not None
+
+    if not args.force:
+        print("The benchmark replaces the farms table. Re-run with --force on a scratch database.", file=sys.stderr)
+        sys.exit(1)
+    init_db()
+
+    # One warning per rejected row would dominate the timings
+    logging.getLogger(ingest.__name__).setLevel(logging.ERROR)
+
+    report = {
+        'revision': _git_revision(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'loader': bulk_load.DEFAULT_LOADER,
+        'memory_budget_mb': args.memory_budget,
+        'ndvi': {'latency': args.ndvi_latency or 0.0, 'failure_rate': args.ndvi_failure_rate or 0.0}
+        if synthetic_ndvi else 'stub',
+        'results': [],
+    }
+    # Anything the pipeline prints would corrupt the JSON on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        for size in (int(s) for s in args.sizes.split(',')):
+            provider = ndvi_providers.SyntheticProvider(
+                latency=args.ndvi_latency or 0.0, failure_rate=args.ndvi_failure_rate or 0.0
+            ) if synthetic_ndvi else None
+            result = bench_size(size, args.data_dir, args.memory_budget, provider)
+            report['results'].append(result)
+            stages = ', '.join(f"{s['stage']} {s['seconds']:.2f}s" for s in result['stages'])
+            print(f"{size:>8} rows: {result['total_seconds']:.2f}s ({stages})")
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
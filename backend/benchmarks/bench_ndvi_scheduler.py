@@ -0,0 +1,137 @@
+"""
+Benchmark NDVI request scheduling against a fake Earth Engine provider.
+Compares the old static split (fixed threads over pre-assigned chunks,
+errors dropped) with the AdaptiveScheduler. The provider slows down past
+its capacity, answers 429 past its quota, fails a share of requests at
+random and has a tail of slow (large-plot) batches.
+
+Run from the backend directory:
+    python -m benchmarks.bench_ndvi_scheduler --tasks 400 --out sched.json
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+
+from services.ndvi_scheduler import AdaptiveScheduler
+
+
+class FakeNdviProvider:
+    """
+    Stands in for Earth Engine: fetch(task) sleeps for the simulated latency
+    and returns the task, or raises. Latency grows linearly with in-flight
+    requests beyond capacity; beyond quota, requests fail with a 429.
+    """
+
+    def __init__(self, latency=0.02, capacity=8, quota=12, error_rate=0.02,
+                 slow_rate=0.05, slow_factor=8.0, seed=0):
+        self.latency = latency
+        self.capacity = capacity
+        self.quota = quota
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def fetch(self, task):
+        with self._lock:
+            self.in_flight += 1
+            in_flight = self.in_flight
+            roll = self._random.random()
+            slow = self._random.random() < self.slow_rate
+        try:
+            if in_flight > self.quota:
+                time.sleep(self.latency / 4)
+                raise RuntimeError("HttpError 429: Too Many Requests (quota exceeded)")
+            delay = self.latency * max(1.0, in_flight / self.capacity)
+            time.sleep(delay * (self.slow_factor if slow else 1.0))
+            if roll < self.error_rate:
+                raise RuntimeError("Computation timed out.")
+            return task
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def run_static(provider: FakeNdviProvider, tasks, threads: int = 10) -> dict:
+    """The original strategy: np.array_split into fixed chunks, one thread each, no retries"""
+    done = []
+    failed = []
+
+    def worker(chunk):
+        for task in chunk:
+            try:
+                done.append(provider.fetch(task))
+            except Exception:
+                failed.append(task)
+
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in np.array_split(tasks, threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return {'seconds': round(time.perf_counter() - start, 3), 'completed': len(done), 'dropped': len(failed)}
+
+
+def run_adaptive(provider: FakeNdviProvider, tasks, max_workers: int = 16, backoff: float = 0.05) -> dict:
+    scheduler = AdaptiveScheduler(provider.fetch, max_workers=max_workers, base_backoff=backoff, max_backoff=2.0)
+    start = time.perf_counter()
+    results, dropped = scheduler.run(tasks)
+    stats = scheduler.stats
+    return {
+        'seconds': round(time.perf_counter() - start, 3),
+        'completed': sum(1 for r in results if r is not None),
+        'dropped': len(dropped),
+        'requests': stats['requests'],
+        'retries': stats['retries'],
+        'quota_errors': stats['quota_errors'],
+        'peak_concurrency': stats['peak_concurrency'],
+        'final_limit': scheduler.limit,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark NDVI request scheduling with a fake provider.")
+    parser.add_argument('--tasks', type=int, default=400, help='Number of requests (farm batches)')
+    parser.add_argument('--latency', type=float, default=0.02, help='Base request latency in seconds')
+    parser.add_argument('--capacity', type=int, default=8, help='Concurrent requests before latency degrades')
+    parser.add_argument('--quota', type=int, default=12, help='Concurrent requests before 429s')
+    parser.add_argument('--error-rate', type=float, default=0.02, help='Share of requests failing transiently')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='Write JSON results to this file (default: stdout)')
+    args = parser.parse_args()
+
+    tasks = list(range(args.tasks))
+
+    def provider():
+        return FakeNdviProvider(args.latency, args.capacity, args.quota, args.error_rate, seed=args.seed)
+
+    report = {
+        'tasks': args.tasks,
+        'provider': {'latency': args.latency, 'capacity': args.capacity, 'quota': args.quota,
+                     'error_rate': args.error_rate},
+        'static': run_static(provider(), tasks),
+        'adaptive': run_adaptive(provider(), tasks),
+    }
+    for name in ('static', 'adaptive'):
+        result = report[name]
+        print(f"{name:>8}: {result['seconds']:.2f}s, {result['completed']} done, {result['dropped']} dropped",
+              file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Synthetic farm CSVs in the REQUIRED_COLUMNS schema, for benchmarks.
+Files are written in chunks so 1M-row inputs do not need to fit in memory.
+"""
+import os
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from services.ingest import REQUIRED_COLUMNS
+
+# Share of rows that cannot become a polygon, and of repeated farm_ids,
+# roughly what mill exports show
+DEFAULT_BAD_RATE = 0.02
+DEFAULT_DUP_RATE = 0.01
+
+WRITE_CHUNK_ROWS = 100000
+VILLAGES = 400
+# Farm side length in degrees (~20-80 m)
+MIN_SIDE, MAX_SIDE = 0.0002, 0.0007
+
+
+def _farm_chunk(rng: np.random.Generator, start: int, n_rows: int, centers: np.ndarray) -> pd.DataFrame:
+    village = rng.integers(0, len(centers), n_rows)
+    lat0 = centers[village, 0] + rng.normal(0, 0.02, n_rows)
+    lon0 = centers[village, 1] + rng.normal(0, 0.02, n_rows)
+    side = rng.uniform(MIN_SIDE, MAX_SIDE, n_rows)
+    skew = rng.uniform(-0.2, 0.2, (n_rows, 4)) * side[:, None]
+
+    df = pd.DataFrame({
+        'Div_Name': 'Division ' + (village % 8).astype(str),
+        'Vill_Cd': village + 1000,
+        'Vill_Name': 'Village ' + village.astype(str),
+        'Vill_Code': village + 1000,
+        'Supervisor Name': 'Supervisor ' + (village % 40).astype(str),
+        'farm_id': [f'F{i:09d}' for i in range(start, start + n_rows)],
+        'Farmer_Name': 'Farmer',
+        'Father_Name': 'Father',
+        'Plot No': rng.integers(1, 3000, n_rows),
+        'Gashti No.': rng.integers(1, 60, n_rows),
+        'Survey Date': [f'{m}/{d}/2024' for m, d in zip(rng.integers(1, 13, n_rows), rng.integers(1, 29, n_rows))],
+        'Area': (side * 111000) ** 2 / 4047,
+        'Shar': rng.integers(0, 3, n_rows),
+        'Varieties': rng.choice(['Co 0238', 'CoS 13235', 'Co 0118'], n_rows),
+        'Crop Type': rng.choice(['Plant', 'Ratoon'], n_rows),
+        'East': rng.integers(1, 200, n_rows),
+        'West': rng.integers(1, 200, n_rows),
+        'North': rng.integers(1, 200, n_rows),
+        'South': rng.integers(1, 200, n_rows),
+        # Corners go round the plot: SW, SE, NE, NW
+        'Lang1': lat0 + skew[:, 0], 'Long1': lon0,
+        'Lang2': lat0 + skew[:, 1], 'Long2': lon0 + side,
+        'Lang3': lat0 + side + skew[:, 2], 'Long3': lon0 + side,
+        'Lang4': lat0 + side + skew[:, 3], 'Long4': lon0,
+        'WKT': '',
+    })
+    return df.astype({c: object for c in ('Lang1', 'Lang2', 'Lang3', 'Lang4')})
+
+
+def _spoil(rng: np.random.Generator, df: pd.DataFrame, bad: np.ndarray) -> None:
+    """Make the rows flagged in bad unusable, in the ways real exports are"""
+    kind = rng.integers(0, 3, bad.sum())
+    rows = df.index[bad]
+    # Two corners missing
+    df.loc[rows[kind == 0], ['Lang3', 'Long3', 'Lang4', 'Long4']] = np.nan
+    # Unparseable coordinates
+    df.loc[rows[kind == 1], ['Lang2', 'Lang3']] = 'N/A'
+    # Self-intersecting "bowtie" (corners 3 and 4 swapped)
+    swapped = rows[kind == 2]
+    df.loc[swapped, ['Lang3', 'Long3', 'Lang4', 'Long4']] = df.loc[swapped, ['Lang4', 'Long4', 'Lang3', 'Long3']].to_numpy()
+
+
+def generate_farm_csv(path: str, n_rows: int, bad_rate: float = DEFAULT_BAD_RATE,
+                      dup_rate: float = DEFAULT_DUP_RATE, seed: int = 0) -> Dict[str, int]:
+    """
+    Write n_rows synthetic farms to path. About bad_rate of the rows have
+    unusable corners and dup_rate repeat an earlier (good) farm_id.
+    Returns the exact counts: rows, bad, duplicates and expected valid farms.
+    """
+    rng = np.random.default_rng(seed)
+    centers = np.column_stack([rng.uniform(26.0, 30.0, VILLAGES), rng.uniform(77.0, 84.0, VILLAGES)])
+    stats = {'rows': 0, 'bad': 0, 'duplicates': 0}
+    next_id = 0
+    header = True
+    with open(path, 'w', newline='') as f:
+        while stats['rows'] < n_rows:
+            size = min(WRITE_CHUNK_ROWS, n_rows - stats['rows'])
+            n_dup = int(rng.binomial(size, dup_rate)) if size > 1 else 0
+            base = _farm_chunk(rng, next_id, size - n_dup, centers)
+            next_id += len(base)
+            bad = rng.random(len(base)) < bad_rate
+            _spoil(rng, base, bad)
+            good_rows = base.index[~bad]
+            dups = base.loc[rng.choice(good_rows, min(n_dup, len(good_rows)))] if len(good_rows) else base.iloc[:0]
+            chunk = pd.concat([base, dups], ignore_index=True)[REQUIRED_COLUMNS]
+            chunk.to_csv(f, header=header, index=False)
+            header = False
+            stats['rows'] += len(chunk)
+            stats['bad'] += int(bad.sum())
+            stats['duplicates'] += len(dups)
+            if len(chunk) < size:
+                break
+    stats['valid'] = stats['rows'] - stats['bad'] - stats['duplicates']
+    return stats
+
+
+def generate_ndvi_csv(farm_csv_path: str, path: str, seed: int = 0) -> int:
+    """
+    Write a stub NDVI extraction result (the ndvi_extraction.py CSV
+    schema) for every farm_id of farm_csv_path. Returns the row count.
+    """
+    rng = np.random.default_rng(seed)
+    header = True
+    count = 0
+    with open(path, 'w', newline='') as f:
+        for chunk in pd.read_csv(farm_csv_path, usecols=['farm_id'], chunksize=WRITE_CHUNK_ROWS):
+            ids = chunk['farm_id'].drop_duplicates()
+            recent = rng.uniform(0.1, 0.9, len(ids))
+            prev = rng.uniform(0.1, 0.9, len(ids))
+            pd.DataFrame({
+                'farm_id': ids.to_numpy(),
+                'recent_date': '2024-03-10',
+                'recent_ndvi': recent,
+                'prev_date': '2024-02-24',
+                'prev_ndvi': prev,
+                'delta': recent - prev,
+            }).to_csv(f, header=header, index=False)
+            header = False
+            count += len(ids)
+    return count
+
+
+def ensure_dataset(directory: str, n_rows: int, seed: int = 0) -> Dict[str, str]:
+    """Generate (or reuse) the farm and NDVI CSVs for n_rows under directory"""
+    os.makedirs(directory, exist_ok=True)
+    farms = os.path.join(directory, f'farms_{n_rows}.csv')
+    ndvi = os.path.join(directory, f'ndvi_{n_rows}.csv')
+    if not os.path.exists(farms):
+        generate_farm_csv(farms, n_rows, seed=seed)
+    if not os.path.exists(ndvi):
+        generate_ndvi_csv(farms, ndvi, seed=seed)
+    return {'farms': farms, 'ndvi': ndvi}
@@ -2,7 +2,7 @@
 Database configuration and session management
 Using PostgreSQL with PostGIS extension for geospatial data
 """
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, text
+from sqlalchemy import create_engine, Column, Integer, String, Float, Date, DateTime, Index, REAL, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from geoalchemy2 import Geometry
@@ -56,6 +56,14 @@ class Farm(Base):
     
     # Geometry stored as PostGIS POLYGON
     geometry = Column(Geometry('POLYGON', srid=4326))
+    # Derived at ingest (see services/farm_geometry.py): simplified copies
+    # for the low/mid/high map zoom tiers, bounding box (GiST-indexed for
+    # viewport filters) and centroid (served at the lowest zooms)
+    geometry_low = Column(Geometry('GEOMETRY', srid=4326, spatial_index=False))
+    geometry_mid = Column(Geometry('GEOMETRY', srid=4326, spatial_index=False))
+    geometry_high = Column(Geometry('GEOMETRY', srid=4326, spatial_index=False))
+    bbox = Column(Geometry('GEOMETRY', srid=4326))
+    centroid = Column(Geometry('POINT', srid=4326, spatial_index=False))
     
     # NDVI data
     recent_date = Column(String)
@@ -64,11 +72,65 @@ class Farm(Base):
     prev_ndvi = Column(Float)
     delta = Column(Float)
     harvest_flag = Column(Integer, default=0)
+
+    # Hash of attributes + geometry, used by incremental ingest
+    content_hash = Column(String)
     
     # Timestamps
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+# Earth Engine NDVI results keyed by polygon and date window, so unchanged
+# farms are not re-extracted on every upload (see services/ndvi_cache.py)
+class NdviCache(Base):
+    __tablename__ = "ndvi_cache"
+
+    geometry_hash = Column(String, primary_key=True)
+    window_start = Column(Date, primary_key=True)
+    window_end = Column(Date, primary_key=True)
+
+    recent_date = Column(String)
+    recent_ndvi = Column(Float)
+    prev_date = Column(String)
+    prev_ndvi = Column(Float)
+    delta = Column(Float)
+
+    cached_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+# One row per farm and Sentinel-2 acquisition, kept across ingests so NDVI
+# can be charted over seasons. Range-partitioned by year of acquired_on;
+# partitions are created on demand (see services/ndvi_history.py).
+class NdviObservation(Base):
+    __tablename__ = "ndvi_observations"
+    __table_args__ = (
+        Index("ix_ndvi_observations_vill_cd_acquired_on", "vill_cd", "acquired_on"),
+        {"postgresql_partition_by": "RANGE (acquired_on)"},
+    )
+
+    farm_id = Column(String, primary_key=True)
+    acquired_on = Column(Date, primary_key=True)
+    vill_cd = Column(Integer)
+    ndvi = Column(REAL)
+    cloud_free = Column(REAL)  # Share of the plot's pixels not masked as cloud, 0-1
+
+# Columns added after the initial schema. create_all() does not alter
+# existing tables, so init_db adds them to farms (and to the archive of
+# removed farms, if one exists) when missing.
+SCHEMA_UPGRADES = [
+    ("content_hash", "VARCHAR"),
+    ("geometry_low", "geometry(Geometry, 4326)"),
+    ("geometry_mid", "geometry(Geometry, 4326)"),
+    ("geometry_high", "geometry(Geometry, 4326)"),
+    ("bbox", "geometry(Geometry, 4326)"),
+    ("centroid", "geometry(Point, 4326)"),
+]
+
+# Indexes on SCHEMA_UPGRADES columns, which create_all() only builds for a
+# new farms table
+SCHEMA_UPGRADE_INDEXES = [
+    ("idx_farms_bbox", "farms USING gist (bbox)"),
+]
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -94,6 +156,14 @@ def init_db():
     # Create all tables
     Base.metadata.create_all(bind=engine)
 
+    with engine.connect() as conn:
+        for column, ddl_type in SCHEMA_UPGRADES:
+            for table in ("farms", "farms_archive"):
+                conn.execute(text(f"ALTER TABLE IF EXISTS {table} ADD COLUMN IF NOT EXISTS {column} {ddl_type}"))
+        for name, definition in SCHEMA_UPGRADE_INDEXES:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}"))
+        conn.commit()
+
 # Utility function to convert coordinates to WKT
 def coords_to_wkt(coords: list) -> str:
     """
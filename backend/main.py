@@ -11,6 +11,7 @@ import os
 
 from routers import upload
 from routers import farms
+from routers import ndvi
 from routers import stats
 from routers import charts_geojson as charts
 from routers import harvest_chart_api as harvest_chart
@@ -61,7 +62,7 @@ async def health_check():
 # Include routers
 app.include_router(upload.router, prefix="/api", tags=["Uploads"])
 app.include_router(farms.router, prefix="/api/farms", tags=["Farms"])
-# app.include_router(ndvi.router, prefix="/api/ndvi", tags=["NDVI"])
+app.include_router(ndvi.router, prefix="/api/ndvi", tags=["NDVI"])
 app.include_router(stats.router, prefix="/api/stats", tags=["Statistics"])
 app.include_router(charts.router, prefix="/api/charts", tags=["Charts"])
 app.include_router(harvest_chart.router, prefix="/api/harvest_chart", tags=["HarvestChart"])
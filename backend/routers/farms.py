@@ -3,50 +3,36 @@
 Farm management endpoints
 """
 
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import Optional
-from geoalchemy2.functions import ST_AsGeoJSON, ST_Intersects, ST_MakeEnvelope, ST_Simplify, ST_Transform
+from typing import List, Optional
+from datetime import date
+from geoalchemy2.functions import ST_MakeEnvelope, ST_Transform
 from database import get_db, Farm
+from services import farm_geojson, farm_geometry, farm_pagination, farm_tiles, ndvi_history
 import json
 
 router = APIRouter()
 
-def farm_to_geojson_feature(farm: Farm, geom_json: str) -> dict:
-    """Convert a Farm model to GeoJSON feature"""
+def farm_to_geojson_feature(farm, geom_json: str, fields: Optional[List[str]] = None) -> dict:
+    """
+    Convert a Farm model (or a row of its columns) to GeoJSON feature with
+    the given properties (default all, see farm_geojson.PROPERTY_COLUMNS)
+    """
+    fields = list(farm_geojson.PROPERTY_COLUMNS) if fields is None else fields
     return {
         "type": "Feature",
         "geometry": json.loads(geom_json),
-        "properties": {
-            "farm_id": farm.farm_id,
-            "Div_Name": farm.div_name,
-            "Vill_Cd": farm.vill_cd,
-            "Vill_Name": farm.vill_name,
-            "Vill_Code": farm.vill_code,
-            "Supervisor Name": farm.supervisor_name,
-            "Farmer_Name": farm.farmer_name,
-            "Father_Name": farm.father_name,
-            "Plot No": farm.plot_no,
-            "Gashti No.": farm.gashti_no,
-            "Survey Date": farm.survey_date,
-            "Area": farm.area,
-            "Shar": farm.shar,
-            "Varieties": farm.varieties,
-            "Crop Type": farm.crop_type,
-            "East": farm.east,
-            "West": farm.west,
-            "North": farm.north,
-            "South": farm.south,
-            "WKT": farm.wkt,
-            "recent_date": farm.recent_date,
-            "recent_ndvi": farm.recent_ndvi,
-            "prev_date": farm.prev_date,
-            "prev_ndvi": farm.prev_ndvi,
-            "delta": farm.delta,
-            "harvest_flag": farm.harvest_flag
-        }
+        "properties": {name: getattr(farm, farm_geojson.PROPERTY_COLUMNS[name]) for name in fields}
     }
 
+def parse_fields(fields: Optional[str]) -> List[str]:
+    try:
+        return farm_geojson.parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("")
 def list_farms(
     bbox: Optional[str] = Query(None, description="Bounding box: minx,miny,maxx,maxy"),
@@ -54,88 +40,149 @@ def list_farms(
     zoom: Optional[int] = Query(None, description="Map zoom level for geometry simplification"),
     month: Optional[str] = Query(None, description="Filter by survey month (1-12)"),
     year: Optional[str] = Query(None, description="Filter by survey year (e.g., 2024)"),
-    page: int = 1,
-    page_size: int = 1000,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(1000, ge=1),
+    cursor: Optional[str] = Query(None, description="metadata.next of the previous page (replaces page)"),
+    count: str = Query(farm_pagination.FARMS_COUNT_MODE, description="Total count: exact, estimated or cached"),
+    stream: Optional[bool] = Query(None, description="Build the GeoJSON in PostGIS and stream it (default FARMS_STREAM_GEOJSON)"),
+    fields: Optional[str] = Query(None, description="Comma-separated properties to return (default all)"),
+    precision: int = Query(farm_geojson.DEFAULT_PRECISION, ge=0, le=farm_geojson.MAX_PRECISION, description="Coordinate decimal places"),
     db: Session = Depends(get_db)
 ):
     """Get list of farms with optional filters and geometry simplification"""
+    fields = parse_fields(fields)
+    if count not in farm_pagination.COUNT_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid count mode. Use one of: {', '.join(farm_pagination.COUNT_MODES)}")
     
-    # Calculate simplification tolerance based on zoom level
-    # Higher zoom = more detail, lower tolerance
-    # Zoom levels: 1-5 (very far), 6-10 (far), 11-13 (medium), 14+ (close)
-    tolerance = 0
-    if zoom is not None:
-        if zoom < 6:
-            tolerance = 0.001  # Heavily simplify for far zoom
-        elif zoom < 11:
-            tolerance = 0.0005  # Moderate simplification
-        elif zoom < 14:
-            tolerance = 0.0001  # Light simplification
-        # else: no simplification for close zoom
-    
-    # Build geometry selection with optional simplification
-    if tolerance > 0:
-        geom_expr = ST_AsGeoJSON(ST_Simplify(Farm.geometry, tolerance, True))
-    else:
-        geom_expr = ST_AsGeoJSON(Farm.geometry)
+    # Geometry for the zoom level: the centroid or a tier precomputed at
+    # ingest (see services/farm_geometry.py), the full polygon when zoomed
+    # in or no zoom
+    geometry = farm_geometry.geometry_for_zoom(zoom)
     
-    query = db.query(Farm, geom_expr.label('geom_json'))
+    filters = []
     
     # Filter by village
     if village:
-        query = query.filter(Farm.vill_name == village)
+        filters.append(Farm.vill_name == village)
     
     # Filter by survey date (month and/or year)
     # Survey date format in DB: "M/D/YYYY" or "MM/DD/YYYY"
     if month and month != "all":
         # Filter by month (handles both single and double digit months)
-        query = query.filter(
+        filters.append(
             (Farm.survey_date.like(f"{month}/%")) | 
             (Farm.survey_date.like(f"{month.zfill(2)}/%"))
         )
     
     if year and year != "all":
         # Filter by year (last 4 characters should be the year)
-        query = query.filter(Farm.survey_date.like(f"%/{year}"))
+        filters.append(Farm.survey_date.like(f"%/{year}"))
     
-    # Filter by bounding box (viewport-based loading)
+    # Filter by bounding box (viewport-based loading): the stored bbox
+    # first, the full polygon only where it is served
     if bbox:
         try:
             minx, miny, maxx, maxy = map(float, bbox.split(','))
             bbox_geom = ST_MakeEnvelope(minx, miny, maxx, maxy, 4326)
-            query = query.filter(ST_Intersects(Farm.geometry, bbox_geom))
+            filters.append(farm_geometry.viewport_filter(bbox_geom, zoom))
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid bbox format. Use: minx,miny,maxx,maxy")
     
-    # Get total count for pagination metadata
-    total_count = query.count()
+    # Get total count for pagination metadata (viewport counts are never cached)
+    count = farm_pagination.count_mode_for(count, viewport=bool(bbox))
+    signature = json.dumps([village, month, year])
+    total_count = farm_pagination.count_rows(db, db.query(Farm.id).filter(*filters), count, signature)
+    
+    metadata = {
+        "total": total_count,
+        "count_mode": count,
+        "page": None if cursor else page,
+        "page_size": page_size,
+        "total_pages": (total_count + page_size - 1) // page_size
+    }
+    
+    # Pagination: keyset on id after the cursor, else by page number
+    if cursor:
+        try:
+            filters.append(Farm.id > farm_pagination.decode_cursor(cursor))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+    offset = 0 if cursor else (page - 1) * page_size
+    
+    # Fast path: features built by PostGIS, streamed from a server-side cursor
+    if farm_geojson.FARMS_STREAM_GEOJSON if stream is None else stream:
+        statement = farm_geojson.feature_select(geometry, filters, page_size + 1, offset, fields, precision)
+        return StreamingResponse(
+            farm_geojson.stream_feature_collection(statement, page_size, metadata),
+            media_type="application/geo+json"
+        )
     
-    # Pagination
-    offset = (page - 1) * page_size
-    results = query.offset(offset).limit(page_size).all()
+    # Only the requested columns are selected
+    query = db.query(
+        Farm.id, *farm_geojson.property_columns(fields),
+        farm_geojson.geometry_json(geometry, precision).label('geom_json')
+    ).filter(*filters).order_by(Farm.id)
+    results = query.offset(offset).limit(page_size + 1).all()
+    has_more = len(results) > page_size
+    results = results[:page_size]
     
-    features = [farm_to_geojson_feature(farm, geom_json) for farm, geom_json in results]
+    features = [farm_to_geojson_feature(row, row.geom_json, fields) for row in results]
+    metadata["next"] = farm_pagination.encode_cursor(results[-1].id) if has_more else None
     
     return {
         "type": "FeatureCollection",
         "features": features,
-        "metadata": {
-            "total": total_count,
-            "page": page,
-            "page_size": page_size,
-            "total_pages": (total_count + page_size - 1) // page_size
-        }
+        "metadata": metadata
     }
 
+@router.get("/tiles/{z}/{x}/{y}.mvt")
+def get_farm_tile(z: int, x: int, y: int, db: Session = Depends(get_db)):
+    """Farm polygons (centroids at low zoom) of one z/x/y tile as a Mapbox Vector Tile (farm_id, ndvi, harvest_flag)"""
+    if not farm_tiles.valid_tile(z, x, y):
+        raise HTTPException(status_code=404, detail="Tile out of range.")
+    return Response(content=farm_tiles.get_tile(db, z, x, y), media_type=farm_tiles.MEDIA_TYPE)
+
 @router.get("/{farm_id}")
-def get_farm(farm_id: str, db: Session = Depends(get_db)):
+def get_farm(
+    farm_id: str,
+    fields: Optional[str] = Query(None, description="Comma-separated properties to return (default all)"),
+    precision: int = Query(farm_geojson.DEFAULT_PRECISION, ge=0, le=farm_geojson.MAX_PRECISION, description="Coordinate decimal places"),
+    db: Session = Depends(get_db)
+):
     """Get a single farm by ID"""
-    result = db.query(Farm, ST_AsGeoJSON(Farm.geometry).label('geom_json')).filter(
+    fields = parse_fields(fields)
+    result = db.query(
+        *farm_geojson.property_columns(fields),
+        farm_geojson.geometry_json(Farm.geometry, precision).label('geom_json')
+    ).filter(
         Farm.farm_id == farm_id
     ).first()
     
     if not result:
         raise HTTPException(status_code=404, detail="Farm not found.")
     
-    farm, geom_json = result
-    return farm_to_geojson_feature(farm, geom_json)
+    return farm_to_geojson_feature(result, result.geom_json, fields)
+
+@router.get("/{farm_id}/ndvi")
+def get_farm_ndvi(
+    farm_id: str,
+    start: Optional[date] = Query(None, description="First acquisition date (YYYY-MM-DD)"),
+    end: Optional[date] = Query(None, description="Last acquisition date (YYYY-MM-DD)"),
+    max_points: int = Query(ndvi_history.NDVI_SERIES_MAX_POINTS, ge=1, le=2000, description="Longer series are averaged into this many time buckets"),
+    db: Session = Depends(get_db)
+):
+    """NDVI time series of a farm from the observation history"""
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end.")
+    points = ndvi_history.series(db, farm_id, start, end, max_points)
+    if not points and not db.query(Farm.id).filter(Farm.farm_id == farm_id).first():
+        raise HTTPException(status_code=404, detail="Farm not found.")
+    observations = sum(point['observations'] for point in points)
+    return {
+        "farm_id": farm_id,
+        "start": start,
+        "end": end,
+        "observations": observations,
+        "downsampled": observations > len(points),
+        "points": points
+    }
@@ -8,6 +8,7 @@ import pandas as pd
 
 from database import get_db, Farm
 from models import NDVIData, NDVIResponse
+from services import bulk_load, farm_cache, ingest
 
 router = APIRouter()
 
@@ -44,62 +45,68 @@ async def update_farm_ndvi(
         raise HTTPException(status_code=404, detail="Farm not found")
     
     # Update NDVI values
+    farm.recent_date = ndvi_data.recent_date.date().isoformat()
     farm.recent_ndvi = ndvi_data.recent_ndvi
+    farm.prev_date = ndvi_data.prev_date.date().isoformat()
     farm.prev_ndvi = ndvi_data.prev_ndvi
-    farm.ndvi_delta = ndvi_data.delta
+    farm.delta = ndvi_data.delta
     
     # Calculate harvest flag
-    farm.harvest = 1 if calculate_harvest_flag(
+    farm.harvest_flag = 1 if calculate_harvest_flag(
         ndvi_data.recent_ndvi,
         ndvi_data.prev_ndvi
     ) else 0
+    # The next incremental upload rewrites the farm from its CSV
+    farm.content_hash = None
     
     db.commit()
+    farm_cache.invalidate_farm_caches()
     
     return {
         "message": "NDVI updated successfully",
         "farm_id": farm_id,
-        "harvest_ready": farm.harvest == 1
+        "harvest_ready": farm.harvest_flag == 1
     }
 
+def ndvi_update_frame(ndvi_list: List[NDVIData]) -> pd.DataFrame:
+    """
+    bulk_load.update_ndvi rows for a bulk payload: one per farm (the last
+    entry wins), harvest flag recomputed and content_hash cleared
+    """
+    updates = pd.DataFrame(
+        [item.model_dump(exclude={"harvest"}) for item in ndvi_list],
+        columns=["farm_id", "recent_date", "recent_ndvi", "prev_date", "prev_ndvi", "delta"],
+    ).drop_duplicates("farm_id", keep="last")
+    for column in ("recent_date", "prev_date"):
+        updates[column] = pd.to_datetime(updates[column]).dt.strftime("%Y-%m-%d")
+    updates = ingest.apply_harvest_flag(updates)
+    updates["content_hash"] = None
+    return updates[["farm_id"] + bulk_load.NDVI_UPDATE_FIELDS + ["content_hash"]].reset_index(drop=True)
+
 @router.post("/bulk-update")
-async def bulk_update_ndvi(
+def bulk_update_ndvi(
     ndvi_list: List[NDVIData],
     db: Session = Depends(get_db)
 ):
-    """Bulk update NDVI data from CSV processing"""
-    updated = 0
-    errors = []
-    
-    for ndvi_data in ndvi_list:
-        try:
-            farm = db.query(Farm).filter(
-                Farm.farm_id == ndvi_data.farm_id
-            ).first()
-            
-            if not farm:
-                errors.append(f"Farm {ndvi_data.farm_id} not found")
-                continue
-            
-            farm.recent_ndvi = ndvi_data.recent_ndvi
-            farm.prev_ndvi = ndvi_data.prev_ndvi
-            farm.ndvi_delta = ndvi_data.delta
-            farm.harvest = 1 if calculate_harvest_flag(
-                ndvi_data.recent_ndvi,
-                ndvi_data.prev_ndvi
-            ) else 0
-            
-            updated += 1
-            
-        except Exception as e:
-            errors.append(f"Error updating {ndvi_data.farm_id}: {str(e)}")
-    
-    db.commit()
+    """
+    Bulk update NDVI data from CSV processing: the payload is loaded into a
+    temp table and applied with one set-based UPDATE. Farm IDs without a
+    farm are returned in not_found.
+    """
+    updates = ndvi_update_frame(ndvi_list)
+    not_found = []
+    try:
+        updated = bulk_load.update_ndvi(db, updates, bulk_load.DEFAULT_LOADER, not_found=not_found)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    farm_cache.invalidate_farm_caches()
     
     return {
         "message": f"Updated {updated} farms",
         "updated": updated,
-        "errors": errors
+        "not_found": not_found
     }
 
 @router.get("/{farm_id}", response_model=NDVIResponse)
@@ -114,7 +121,7 @@ async def get_farm_ndvi(farm_id: str, db: Session = Depends(get_db)):
         "farm_id": farm.farm_id,
         "recent_ndvi": farm.recent_ndvi or 0,
         "prev_ndvi": farm.prev_ndvi or 0,
-        "delta": farm.ndvi_delta or 0,
-        "harvest_ready": farm.harvest == 1,
+        "delta": farm.delta or 0,
+        "harvest_ready": farm.harvest_flag == 1,
         "health_status": calculate_health_status(farm.recent_ndvi or 0)
     }
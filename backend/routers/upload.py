@@ -1,6 +1,7 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Query
 from tasks import submit_job, get_job
 from services import ingest
+from typing import Optional
 import os
 
 router = APIRouter()
@@ -8,34 +9,64 @@ router = APIRouter()
 
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), '../../data')
 
+# Stream uploads in chunks that fit this budget (MB); unset loads the CSV whole
+INGEST_MEMORY_BUDGET_MB = float(os.getenv("INGEST_MEMORY_BUDGET_MB", "0")) or None
+
+# Load polygons first and write NDVI onto them as it is extracted (replace mode only)
+INGEST_STREAM_NDVI = os.getenv("INGEST_STREAM_NDVI", "false").lower() in ("1", "true", "yes")
+
 @router.post("/upload-csv")
-def upload_csv(file: UploadFile = File(...)):
+def upload_csv(
+    file: UploadFile = File(...),
+    mode: str = Query("replace", description="replace: reload all farms; incremental: upsert changed farms only"),
+    missing: str = Query("delete", description="Incremental mode: delete or archive farms absent from the upload"),
+    stream_ndvi: Optional[bool] = Query(None, description="Load farms before NDVI extraction finishes (replace mode, default INGEST_STREAM_NDVI)")
+):
     # Ensure the upload directory exists at runtime
     os.makedirs(UPLOAD_DIR, exist_ok=True)
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Only CSV files are allowed.")
+    if mode not in ("replace", "incremental"):
+        raise HTTPException(status_code=400, detail="mode must be 'replace' or 'incremental'.")
+    if missing not in ("delete", "archive"):
+        raise HTTPException(status_code=400, detail="missing must be 'delete' or 'archive'.")
+    can_stream = mode == "replace" and not INGEST_MEMORY_BUDGET_MB
+    if stream_ndvi and not can_stream:
+        raise HTTPException(status_code=400, detail="stream_ndvi needs mode 'replace' and no memory budget.")
+    if stream_ndvi is None:
+        stream_ndvi = INGEST_STREAM_NDVI and can_stream
     file_path = os.path.join(UPLOAD_DIR, file.filename)
     with open(file_path, 'wb') as f:
         f.write(file.file.read())
-    job_id = submit_job(run_ingest_job, file_path)
+    job_id = submit_job(run_ingest_job, file_path, mode, missing, stream_ndvi)
     return {"job_id": job_id}
 
-def run_ingest_job(job, file_path):
+def run_ingest_job(job, file_path, mode="replace", missing="delete", stream_ndvi=False):
     # Temporary processing files
-    geojson_path = os.path.join(UPLOAD_DIR, 'farms_temp.geojson')
-    ndvi_csv_path = os.path.join(UPLOAD_DIR, 'ndvi_temp.csv')
     log_path = os.path.join(UPLOAD_DIR, 'ingest.log')
+    # NDVI progress, one manifest per set of farms (ndvi_checkpoint_<fingerprint>.jsonl);
+    # a retried upload of the same farms resumes from it
+    ndvi_checkpoint_path = os.path.join(UPLOAD_DIR, 'ndvi_checkpoint.jsonl')
+    # Stage metrics of every job, one JSON object per line
+    job.metrics.log_path = os.path.join(UPLOAD_DIR, 'ingest_metrics.jsonl')
 
     try:
         job.log("Starting data ingestion pipeline")
-        job.log(f"Processing file: {file_path}")
+        job.log(f"Processing file: {file_path} (mode: {mode})")
         
         n_ok, n_rej = ingest.full_pipeline(
             file_path,
-            geojson_path,
-            ndvi_csv_path,
+            None,  # Polygons stay in memory between stages
+            None,  # NDVI is extracted in-process, nothing precomputed
             None,  # No final geojson needed
-            log_path
+            log_path,
+            memory_budget_mb=INGEST_MEMORY_BUDGET_MB,
+            mode=mode,
+            missing=missing,
+            metrics=job.metrics,
+            ndvi_checkpoint_path=ndvi_checkpoint_path,
+            stream_ndvi=stream_ndvi,
+            progress=job.set_progress
         )
         job.log(f"Rows processed: {n_ok}, rejected: {n_rej}")
         job.log(f"Data saved to PostGIS database")
@@ -51,7 +82,7 @@ def run_ingest_job(job, file_path):
                             job.log(line)
         
         # Clean up temporary files
-        for temp_file in [file_path, geojson_path, ndvi_csv_path]:
+        for temp_file in [file_path]:
             try:
                 if os.path.exists(temp_file):
                     os.remove(temp_file)
@@ -85,5 +116,7 @@ def get_job_status(job_id: str):
         "job_id": job.job_id,
         "status": job.status,
         "logs": job.logs,
-        "result_file": job.result_file
+        "result_file": job.result_file,
+        "progress": job.progress,
+        "stages": job.metrics.as_list()
     }
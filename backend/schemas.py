@@ -42,3 +42,5 @@ class JobStatus(BaseModel):
     status: str
     logs: Optional[List[str]] = None
     result_file: Optional[str] = None
+    stages: Optional[List[dict]] = None
+    progress: Optional[dict] = None
@@ -0,0 +1,438 @@
+"""
+Bulk loading of pipeline output into the farms table.
+Rows are streamed into PostgreSQL with COPY, falling back to batched
+multi-row INSERTs when the database driver does not support COPY.
+"""
+import hashlib
+import io
+import os
+import re
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+import shapely
+from geoalchemy2 import WKBElement
+from sqlalchemy import Float, Integer, MetaData, text
+
+from database import Farm
+from services import farm_geometry
+
+# Farm column -> pipeline (CSV) column
+FARM_FIELD_MAP = {
+    'farm_id': 'farm_id',
+    'div_name': 'Div_Name',
+    'vill_cd': 'Vill_Cd',
+    'vill_name': 'Vill_Name',
+    'vill_code': 'Vill_Code',
+    'supervisor_name': 'Supervisor Name',
+    'farmer_name': 'Farmer_Name',
+    'father_name': 'Father_Name',
+    'plot_no': 'Plot No',
+    'gashti_no': 'Gashti No.',
+    'survey_date': 'Survey Date',
+    'area': 'Area',
+    'shar': 'Shar',
+    'varieties': 'Varieties',
+    'crop_type': 'Crop Type',
+    'east': 'East',
+    'west': 'West',
+    'north': 'North',
+    'south': 'South',
+    'wkt': 'WKT',
+    'recent_date': 'recent_date',
+    'recent_ndvi': 'recent_ndvi',
+    'prev_date': 'prev_date',
+    'prev_ndvi': 'prev_ndvi',
+    'delta': 'delta',
+    'harvest_flag': 'harvest_flag',
+}
+
+# Loader used by the ingest pipeline: "copy", "insert" or "orm"
+DEFAULT_LOADER = os.getenv("INGEST_LOADER", "copy")
+
+# Removed farms are moved here when incremental ingest archives them
+ARCHIVE_TABLE = 'farms_archive'
+# farm_ids of an incremental upload, to find the farms missing from it
+KEEP_IDS_TABLE = 'farms_keep_ids'
+# farm_ids loaded so far by a chunked upload: dedup across chunks, and
+# the keep ids of an incremental one (one table per job, see job_table_name)
+UPLOAD_IDS_TABLE = 'farms_upload_ids'
+
+# Full reloads are written to a table of this prefix (one per job, see
+# job_table_name) and swapped in once complete
+STAGING_TABLE = 'farms_staging'
+# How long the swap may wait for readers to release the farms table
+SWAP_LOCK_TIMEOUT = os.getenv("INGEST_SWAP_LOCK_TIMEOUT", "60s")
+
+# Columns set by streaming NDVI updates, and their temp table
+NDVI_UPDATE_FIELDS = ['recent_date', 'recent_ndvi', 'prev_date', 'prev_ndvi', 'delta', 'harvest_flag']
+NDVI_UPDATE_TABLE = 'farms_ndvi_update'
+
+COPY_BUFFER_ROWS = 20000
+INSERT_BATCH_ROWS = 1000
+
+
+def _coerce(values: pd.Series, column) -> pd.Series:
+    """Coerce a pipeline column to the type of its farms column"""
+    if isinstance(column.type, Integer):
+        return pd.to_numeric(values, errors='coerce').round().astype('Int64')
+    if isinstance(column.type, Float):
+        return pd.to_numeric(values, errors='coerce')
+    return values.where(values.notnull(), None).map(lambda v: v if v is None else str(v))
+
+
+def farm_records(merged: pd.DataFrame, derived: bool = True) -> pd.DataFrame:
+    """
+    Convert merged pipeline rows into farms table records: database
+    column names, coerced types, hex EWKB geometry (plus the derived
+    farm_geometry columns unless derived is False) and timestamps.
+    """
+    columns = Farm.__table__.c
+    records = pd.DataFrame(index=merged.index)
+    for field, source in FARM_FIELD_MAP.items():
+        values = merged[source] if source in merged.columns else pd.Series(None, index=merged.index, dtype=object)
+        records[field] = _coerce(values, columns[field])
+    records['harvest_flag'] = records['harvest_flag'].fillna(0)
+
+    geoms = shapely.set_srid(np.asarray(merged.geometry.values, dtype=object), 4326)
+    records['geometry'] = shapely.to_wkb(geoms, hex=True, include_srid=True)
+    if derived:
+        for column, values in farm_geometry.derived_geometries(geoms).items():
+            records[column] = shapely.to_wkb(shapely.set_srid(values, 4326), hex=True, include_srid=True)
+    records['content_hash'] = content_hashes(records)
+    now = datetime.utcnow()
+    records['created_at'] = now
+    records['updated_at'] = now
+    return records.reset_index(drop=True)
+
+
+def content_hashes(records: pd.DataFrame) -> pd.Series:
+    """
+    MD5 of each record's attributes and geometry. Values are rendered as
+    text with nulls as empty strings, so the hash only depends on content
+    and not on how pandas happened to type a column. Derived geometries
+    are left out: they follow from the geometry.
+    """
+    if records.empty:
+        return pd.Series([], index=records.index, dtype=object)
+    skipped = {'content_hash', 'created_at', 'updated_at', *farm_geometry.DERIVED_COLUMNS}
+    hashed = [c for c in records.columns if c not in skipped]
+    values = records[hashed].astype(object)
+    text_rows = values.where(values.notnull(), '').astype(str).agg('\x1f'.join, axis=1)
+    return text_rows.map(lambda row: hashlib.md5(row.encode('utf-8')).hexdigest())
+
+
+def ndvi_updates(records: pd.DataFrame, ndvi: pd.DataFrame) -> pd.DataFrame:
+    """
+    Apply NDVI results (pipeline columns: farm_id, NDVI fields and
+    harvest_flag) to farm_records output indexed by farm_id, in place, and
+    re-hash the touched rows. Returns their update_ndvi rows; results for
+    farms not in records are ignored.
+    """
+    columns = Farm.__table__.c
+    ndvi = ndvi[ndvi['farm_id'].isin(records.index)]
+    ids = ndvi['farm_id'].to_numpy()
+    for field in NDVI_UPDATE_FIELDS:
+        values = _coerce(ndvi[FARM_FIELD_MAP[field]].reset_index(drop=True), columns[field])
+        records.loc[ids, field] = values.fillna(0).to_numpy() if field == 'harvest_flag' else values.to_numpy()
+    records.loc[ids, 'content_hash'] = content_hashes(records.loc[ids]).to_numpy()
+    return records.loc[ids, ['farm_id'] + NDVI_UPDATE_FIELDS + ['content_hash']].reset_index(drop=True)
+
+
+def update_ndvi(db, updates: pd.DataFrame, method: str = 'copy', not_found: Optional[list] = None) -> int:
+    """
+    Set the columns of updates (ndvi_updates output: the NDVI columns,
+    harvest_flag and content_hash) on existing farms with one set-based
+    UPDATE through a temp table. If not_found is a list, the farm_ids of
+    updates without a farm are appended to it. Does not commit. Returns
+    the number of farms updated.
+    """
+    if updates.empty:
+        return 0
+    fields = [c for c in updates.columns if c != 'farm_id']
+    column_list = ', '.join(['farm_id'] + fields)
+    db.execute(text(f"DROP TABLE IF EXISTS {NDVI_UPDATE_TABLE}"))
+    db.execute(text(
+        f"CREATE TEMP TABLE {NDVI_UPDATE_TABLE} ON COMMIT DROP AS SELECT {column_list} FROM farms WITH NO DATA"
+    ))
+    if method == 'copy' and supports_copy(db):
+        copy_farms(db, updates[['farm_id'] + fields], NDVI_UPDATE_TABLE)
+    else:
+        rows = updates.astype(object)
+        db.execute(
+            text(f"INSERT INTO {NDVI_UPDATE_TABLE} ({column_list}) VALUES ({', '.join(':' + c for c in updates.columns)})"),
+            rows.where(rows.notnull(), None).to_dict('records'),
+        )
+    assignments = ', '.join(f'{c} = u.{c}' for c in fields)
+    result = db.execute(text(
+        f"UPDATE farms f SET {assignments}, updated_at = now() FROM {NDVI_UPDATE_TABLE} u WHERE f.farm_id = u.farm_id"
+    ))
+    if not_found is not None:
+        not_found.extend(row[0] for row in db.execute(text(
+            f"SELECT u.farm_id FROM {NDVI_UPDATE_TABLE} u "
+            "WHERE NOT EXISTS (SELECT 1 FROM farms f WHERE f.farm_id = u.farm_id)"
+        )).fetchall())
+    db.execute(text(f"DROP TABLE {NDVI_UPDATE_TABLE}"))
+    return result.rowcount
+
+
+def _raw_connection(db):
+    """Return the DBAPI connection behind a Session (inside its transaction)"""
+    return db.connection().connection.dbapi_connection
+
+
+def supports_copy(db) -> bool:
+    cursor = _raw_connection(db).cursor()
+    try:
+        return hasattr(cursor, 'copy_expert') or hasattr(cursor, 'copy')
+    finally:
+        cursor.close()
+
+
+def copy_farms(db, records: pd.DataFrame, table: str = 'farms') -> int:
+    """Stream records into table with COPY ... FROM STDIN (CSV)"""
+    columns = ', '.join(f'"{c}"' for c in records.columns)
+    sql = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)"
+    cursor = _raw_connection(db).cursor()
+    try:
+        for start in range(0, len(records), COPY_BUFFER_ROWS):
+            buf = io.StringIO()
+            records.iloc[start:start + COPY_BUFFER_ROWS].to_csv(buf, header=False, index=False)
+            if hasattr(cursor, 'copy_expert'):
+                # psycopg2
+                buf.seek(0)
+                cursor.copy_expert(sql, buf)
+            else:
+                # psycopg 3
+                with cursor.copy(sql) as copy:
+                    copy.write(buf.getvalue())
+    finally:
+        cursor.close()
+    return len(records)
+
+
+def _table(name: str):
+    if name == Farm.__tablename__:
+        return Farm.__table__
+    return Farm.__table__.to_metadata(MetaData(), name=name)
+
+
+def insert_farms(db, records: pd.DataFrame, table: str = 'farms', batch_size: int = INSERT_BATCH_ROWS) -> int:
+    """Insert records with batched multi-row INSERT statements"""
+    target = _table(table)
+    for start in range(0, len(records), batch_size):
+        batch = records.iloc[start:start + batch_size].astype(object)
+        rows = batch.where(batch.notnull(), None).to_dict('records')
+        geometry_columns = [c for c in ['geometry'] + farm_geometry.DERIVED_COLUMNS if c in batch.columns]
+        for row in rows:
+            for column in geometry_columns:
+                row[column] = WKBElement(row[column], srid=4326, extended=True)
+        db.execute(target.insert(), rows)
+    return len(records)
+
+
+def load_farms(db, merged: pd.DataFrame, method: str = 'copy', table: str = 'farms') -> Tuple[int, str]:
+    """
+    Load merged pipeline rows into table without committing.
+    Uses COPY when asked for and supported, else batched INSERTs.
+    Returns (rows loaded, method used).
+    """
+    records = farm_records(merged)
+    if method == 'copy' and supports_copy(db):
+        return copy_farms(db, records, table), 'copy'
+    return insert_farms(db, records, table), 'insert'
+
+
+def _write_records(db, records: pd.DataFrame, table: str, method: str) -> int:
+    if method == 'copy' and supports_copy(db):
+        return copy_farms(db, records, table)
+    return insert_farms(db, records, table)
+
+
+def stored_hashes(db, farm_ids: Iterable[str]) -> Dict[str, str]:
+    """Return {farm_id: content_hash} for the given farms that already exist"""
+    rows = db.execute(
+        text("SELECT farm_id, content_hash FROM farms WHERE farm_id = ANY(:ids)"),
+        {'ids': list(farm_ids)},
+    )
+    return {farm_id: content_hash for farm_id, content_hash in rows}
+
+
+def upsert_farms(db, merged: pd.DataFrame, method: str = 'copy') -> Dict[str, int]:
+    """
+    Insert new farms and update farms whose content hash changed, leaving
+    unchanged farms untouched. Does not commit.
+    Returns counts of inserted, updated and unchanged farms.
+    """
+    records = farm_records(merged)
+    stored = stored_hashes(db, records['farm_id'])
+    existing = records['farm_id'].isin(stored.keys())
+    changed = existing & (records['content_hash'] != records['farm_id'].map(stored))
+
+    inserted = records.loc[~existing]
+    if len(inserted):
+        _write_records(db, inserted, 'farms', method)
+
+    updated = records.loc[changed].drop(columns=['created_at'])
+    if len(updated):
+        # Only the written columns: a copied id default would draw (and
+        # waste) farms_id_seq values for every staged row
+        column_list = ', '.join(f'"{c}"' for c in updated.columns)
+        db.execute(text("DROP TABLE IF EXISTS farms_upsert"))
+        db.execute(text(f"CREATE TEMP TABLE farms_upsert ON COMMIT DROP AS SELECT {column_list} FROM farms WITH NO DATA"))
+        _write_records(db, updated, 'farms_upsert', method)
+        assignments = ', '.join(f'"{c}" = s."{c}"' for c in updated.columns if c != 'farm_id')
+        db.execute(text(f"UPDATE farms f SET {assignments} FROM farms_upsert s WHERE f.farm_id = s.farm_id"))
+        db.execute(text("DROP TABLE farms_upsert"))
+
+    return {
+        'inserted': len(inserted),
+        'updated': len(updated),
+        'unchanged': int(existing.sum()) - len(updated),
+    }
+
+
+def remove_missing_farms(db, keep_ids: Optional[Iterable[str]], archive: bool = False, method: str = 'copy',
+                         keep_table: str = KEEP_IDS_TABLE) -> int:
+    """
+    Delete farms whose farm_id is not in keep_ids, first copying them to
+    farms_archive when archive is set. keep_ids are loaded into a temp
+    table (COPY with method 'copy' where available) and the farms missing
+    from it are found with one anti-join per statement. With keep_ids
+    None, the ids are read from keep_table as it is (e.g. the
+    UPLOAD_IDS_TABLE of a chunked upload). Does not commit. Returns the
+    count.
+    """
+    if keep_ids is not None:
+        keep = pd.DataFrame({'farm_id': sorted(set(keep_ids))})
+        db.execute(text(f"DROP TABLE IF EXISTS {keep_table}"))
+        db.execute(text(f"CREATE TEMP TABLE {keep_table} ON COMMIT DROP AS SELECT farm_id FROM farms WITH NO DATA"))
+        if method == 'copy' and supports_copy(db):
+            copy_farms(db, keep, keep_table)
+        elif len(keep):
+            db.execute(text(f"INSERT INTO {keep_table} (farm_id) VALUES (:farm_id)"), keep.to_dict('records'))
+    db.execute(text(f"ANALYZE {keep_table}"))
+    missing = f"NOT EXISTS (SELECT 1 FROM {keep_table} k WHERE k.farm_id = f.farm_id)"
+    if archive:
+        db.execute(text(f"CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} (LIKE farms INCLUDING DEFAULTS)"))
+        db.execute(text(f"ALTER TABLE {ARCHIVE_TABLE} ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP DEFAULT now()"))
+        columns = ', '.join(f'"{c.name}"' for c in Farm.__table__.c)
+        db.execute(text(f"INSERT INTO {ARCHIVE_TABLE} ({columns}) SELECT {columns} FROM farms f WHERE {missing}"))
+    result = db.execute(text(f"DELETE FROM farms f WHERE {missing}"))
+    if keep_ids is not None:
+        db.execute(text(f"DROP TABLE {keep_table}"))
+    return result.rowcount
+
+
+def create_upload_ids_table(db, table: str = UPLOAD_IDS_TABLE) -> None:
+    """
+    (Re)create the table of farm_ids a chunked upload has loaded. It is a
+    plain (unlogged) table, not a temp one: the upload commits per chunk
+    and may not get the same connection back.
+    """
+    db.execute(text(f"DROP TABLE IF EXISTS {table}"))
+    db.execute(text(f"CREATE UNLOGGED TABLE {table} (farm_id VARCHAR PRIMARY KEY)"))
+
+
+def claim_farm_ids(db, farm_ids: Iterable[str], table: str = UPLOAD_IDS_TABLE) -> Set[str]:
+    """
+    Add farm_ids to the upload's table and return those it did not hold
+    yet, so a farm loaded by an earlier chunk wins over later duplicates.
+    Does not commit: the claim is undone with the chunk if its load fails.
+    """
+    ids = [str(farm_id) for farm_id in farm_ids]
+    if not ids:
+        return set()
+    result = db.execute(text(
+        f"INSERT INTO {table} (farm_id) SELECT unnest(CAST(:ids AS varchar[])) "
+        "ON CONFLICT DO NOTHING RETURNING farm_id"
+    ), {'ids': ids})
+    return set(result.scalars().all())
+
+
+def job_table_name(prefix: str) -> str:
+    """A name of prefix unique to one ingest job, so concurrent jobs never share a work table"""
+    return f"{prefix}_{uuid.uuid4().hex[:12]}"
+
+
+def drop_job_table(db, table: str) -> None:
+    db.execute(text(f"DROP TABLE IF EXISTS {table}"))
+
+
+def rows_per_second(count: int, elapsed: float) -> float:
+    return count / elapsed if elapsed > 0 else float(count)
+
+
+def create_staging_table(db, table: str = 'farms', staging: str = STAGING_TABLE) -> None:
+    """
+    (Re)create an empty staging copy of table with the same columns and
+    defaults but no indexes, so bulk loads into it stay cheap.
+    """
+    db.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+    db.execute(text(f"CREATE TABLE {staging} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+
+
+def _staging_index_name(name: str, table: str, staging: str) -> str:
+    # Suffixed like the staging table, so the indexes of concurrent reloads
+    # don't collide; PostgreSQL identifiers are limited to 63 bytes
+    suffix = staging[len(table) + 1:] if staging.startswith(f"{table}_") else staging
+    return f"{name[:61 - len(suffix)]}__{suffix}"
+
+
+def _table_indexes(db, table: str) -> Tuple[List[Tuple[str, str]], str]:
+    """Return ([(index name, definition)] excluding the primary key, primary key name)"""
+    pkey = db.execute(text(
+        "SELECT conname FROM pg_constraint "
+        "WHERE conrelid = CAST(:table AS regclass) AND contype = 'p'"
+    ), {'table': table}).scalar()
+    rows = db.execute(text(
+        "SELECT indexname, indexdef FROM pg_indexes "
+        "WHERE schemaname = current_schema() AND tablename = :table"
+    ), {'table': table}).all()
+    return [(name, definition) for name, definition in rows if name != pkey], pkey
+
+
+def build_staging_indexes(db, table: str = 'farms', staging: str = STAGING_TABLE) -> int:
+    """
+    Recreate the primary key and every index of table on the loaded
+    staging table, under temporary names. Returns the number built.
+    """
+    indexes, pkey = _table_indexes(db, table)
+    if pkey:
+        db.execute(text(f"ALTER TABLE {staging} ADD CONSTRAINT {_staging_index_name(pkey, table, staging)} PRIMARY KEY (id)"))
+    for name, definition in indexes:
+        staged = re.sub(
+            rf"INDEX {re.escape(name)} ON (\S+\.)?{re.escape(table)} ",
+            lambda m: f"INDEX {_staging_index_name(name, table, staging)} ON {m.group(1) or ''}{staging} ",
+            definition,
+            count=1,
+        )
+        db.execute(text(staged))
+    db.execute(text(f"ANALYZE {staging}"))
+    return len(indexes) + (1 if pkey else 0)
+
+
+def swap_staging_table(db, table: str = 'farms', staging: str = STAGING_TABLE) -> None:
+    """
+    Atomically replace table with the staging table and commit.
+    Readers see either the old or the new dataset, never a partial one.
+    """
+    indexes, pkey = _table_indexes(db, table)
+    sequence = db.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {'table': table}).scalar()
+
+    db.execute(text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"))
+    db.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+    db.execute(text(f"ALTER TABLE {table} RENAME TO {table}_old"))
+    db.execute(text(f"ALTER TABLE {staging} RENAME TO {table}"))
+    if sequence:
+        # The id default is shared; keep the sequence alive when the old table goes
+        db.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+    db.execute(text(f"DROP TABLE {table}_old"))
+    if pkey:
+        db.execute(text(f"ALTER TABLE {table} RENAME CONSTRAINT {_staging_index_name(pkey, table, staging)} TO {pkey}"))
+    for name, _ in indexes:
+        db.execute(text(f"ALTER INDEX {_staging_index_name(name, table, staging)} RENAME TO {name}"))
+    db.commit()
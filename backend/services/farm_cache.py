@@ -0,0 +1,118 @@
+"""
+Caches of data derived from the farms table.
+Every change to farms starts a new cache generation: invalidate_farm_caches()
+writes a new id to FARM_TILE_CACHE_DIR/GENERATION, which all server
+processes read, so nothing cached under an older generation is served
+afterwards. It is called whenever an ingest or NDVI update commits.
+
+Vector tiles are stored on disk under FARM_TILE_CACHE_DIR/<generation>/
+<z>/<x>/<y>.mvt (old generations are deleted). Row counts of farm
+listings are kept in memory per filter signature and generation.
+"""
+import os
+import shutil
+import threading
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+
+FARM_TILE_CACHE_DIR = os.getenv(
+    "FARM_TILE_CACHE_DIR", os.path.join(os.path.dirname(__file__), '../../data/tile_cache')
+)
+# Set to false to render every tile from the database
+FARM_TILE_CACHE = os.getenv("FARM_TILE_CACHE", "true").lower() not in ('0', 'false', 'no')
+
+GENERATION_FILE = 'GENERATION'
+# Cached counts kept per process; the oldest are dropped beyond this many
+COUNT_CACHE_SIZE = 1024
+
+_counts: Dict[Tuple[str, str], int] = {}
+_counts_lock = threading.Lock()
+
+
+def _generation_path(root: str) -> str:
+    return os.path.join(root, GENERATION_FILE)
+
+
+def current_generation(root: Optional[str] = None) -> str:
+    """The current cache generation, started on first use"""
+    root = root or FARM_TILE_CACHE_DIR
+    try:
+        with open(_generation_path(root)) as f:
+            generation = f.read().strip()
+        if generation:
+            return generation
+    except FileNotFoundError:
+        pass
+    return new_generation(root)
+
+
+def new_generation(root: Optional[str] = None) -> str:
+    """Switch to a fresh generation and delete the tiles of all others"""
+    root = root or FARM_TILE_CACHE_DIR
+    os.makedirs(root, exist_ok=True)
+    generation = uuid.uuid4().hex
+    tmp_path = f"{_generation_path(root)}.{generation}"
+    with open(tmp_path, 'w') as f:
+        f.write(generation)
+    os.replace(tmp_path, _generation_path(root))
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name != generation and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+    return generation
+
+
+def tile_path(z: int, x: int, y: int, generation: str, root: Optional[str] = None) -> str:
+    return os.path.join(root or FARM_TILE_CACHE_DIR, generation, str(z), str(x), f"{y}.mvt")
+
+
+def read_tile(z: int, x: int, y: int, generation: str, root: Optional[str] = None) -> Optional[bytes]:
+    """Cached tile bytes, or None if the tile is not cached (or being deleted)"""
+    try:
+        with open(tile_path(z, x, y, generation, root), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def write_tile(z: int, x: int, y: int, generation: str, data: bytes, root: Optional[str] = None) -> bool:
+    """
+    Store a tile atomically (concurrent readers see the old or the new
+    file, never half of one). Returns False if it could not be stored,
+    e.g. because new_generation deleted the directory meanwhile.
+    """
+    path = tile_path(z, x, y, generation, root)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def cached_count(signature: str, count: Callable[[], int]) -> int:
+    """The count for signature in the current generation, running count() on a miss"""
+    key = (current_generation(), signature)
+    with _counts_lock:
+        if key in _counts:
+            return _counts[key]
+    value = count()
+    with _counts_lock:
+        while len(_counts) >= COUNT_CACHE_SIZE:
+            _counts.pop(next(iter(_counts)))
+        _counts[key] = value
+    return value
+
+
+def invalidate_farm_caches() -> None:
+    """Drop everything cached from the farms table; call after committing farm changes"""
+    new_generation()
+    with _counts_lock:
+        _counts.clear()
@@ -0,0 +1,152 @@
+"""
+GeoJSON of farms built by PostgreSQL.
+Features are assembled with json_build_object in the query and streamed
+to the client from a server-side cursor, so no Farm objects are hydrated
+and the response never sits in memory whole. Output matches
+routers/farms.farm_to_geojson_feature. Both take the same fields=
+projection (GeoJSON property names, see PROPERTY_COLUMNS) and
+coordinate precision (ST_AsGeoJSON maxdecimaldigits), applied in the SQL
+select so unused columns are never read.
+"""
+import itertools
+import json
+import os
+from typing import Callable, Iterator, List, Optional
+
+from sqlalchemy import Text, cast, func, literal_column, select
+from sqlalchemy.dialects.postgresql import JSON
+from geoalchemy2.functions import ST_AsGeoJSON
+
+from database import Farm, engine
+from services import farm_pagination
+
+# GeoJSON property name -> farms column, in feature order
+PROPERTY_COLUMNS = {
+    "farm_id": "farm_id",
+    "Div_Name": "div_name",
+    "Vill_Cd": "vill_cd",
+    "Vill_Name": "vill_name",
+    "Vill_Code": "vill_code",
+    "Supervisor Name": "supervisor_name",
+    "Farmer_Name": "farmer_name",
+    "Father_Name": "father_name",
+    "Plot No": "plot_no",
+    "Gashti No.": "gashti_no",
+    "Survey Date": "survey_date",
+    "Area": "area",
+    "Shar": "shar",
+    "Varieties": "varieties",
+    "Crop Type": "crop_type",
+    "East": "east",
+    "West": "west",
+    "North": "north",
+    "South": "south",
+    "WKT": "wkt",
+    "recent_date": "recent_date",
+    "recent_ndvi": "recent_ndvi",
+    "prev_date": "prev_date",
+    "prev_ndvi": "prev_ndvi",
+    "delta": "delta",
+    "harvest_flag": "harvest_flag",
+}
+
+# Coordinate decimal places: ST_AsGeoJSON's default, and the most allowed
+DEFAULT_PRECISION = 9
+MAX_PRECISION = 15
+
+# Whether GET /api/farms streams PostGIS-built GeoJSON unless ?stream= says otherwise
+FARMS_STREAM_GEOJSON = os.getenv("FARMS_STREAM_GEOJSON", "true").lower() not in ('0', 'false', 'no')
+# Rows fetched from the server-side cursor (and written to the client) at a time
+FARMS_STREAM_BATCH_ROWS = int(os.getenv("FARMS_STREAM_BATCH_ROWS", "1000"))
+
+
+def _sql_string(value: str):
+    return literal_column("'" + value.replace("'", "''") + "'")
+
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """
+    Property names of a comma-separated fields= value, in PROPERTY_COLUMNS
+    order (all of them if fields is empty). ValueError on unknown names.
+    """
+    if not fields:
+        return list(PROPERTY_COLUMNS)
+    wanted = {name.strip() for name in fields.split(',') if name.strip()}
+    unknown = wanted - PROPERTY_COLUMNS.keys()
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return [name for name in PROPERTY_COLUMNS if name in wanted]
+
+
+def property_columns(fields: List[str]) -> list:
+    """Farm columns of the given property names"""
+    return [getattr(Farm, PROPERTY_COLUMNS[name]) for name in fields]
+
+
+def geometry_json(geometry, precision: int = DEFAULT_PRECISION):
+    """ST_AsGeoJSON of geometry rounded to precision decimal places"""
+    return ST_AsGeoJSON(geometry, precision)
+
+
+def feature_json(geometry, fields: Optional[List[str]] = None, precision: int = DEFAULT_PRECISION):
+    """SQL expression of one farm's GeoJSON Feature (as text) with geometry as its shape"""
+    fields = list(PROPERTY_COLUMNS) if fields is None else fields
+    properties = []
+    for name, column in zip(fields, property_columns(fields)):
+        properties += [_sql_string(name), column]
+    return cast(func.json_build_object(
+        _sql_string('type'), _sql_string('Feature'),
+        _sql_string('geometry'), cast(geometry_json(geometry, precision), JSON),
+        _sql_string('properties'), func.json_build_object(*properties),
+    ), Text)
+
+
+def feature_select(geometry, filters, limit: int, offset: int = 0, fields: Optional[List[str]] = None,
+                   precision: int = DEFAULT_PRECISION):
+    """(id, feature text) of the farms matching filters in id order, limit rows from offset"""
+    statement = select(Farm.id, feature_json(geometry, fields, precision)).where(*filters).order_by(Farm.id).limit(limit)
+    return statement.offset(offset) if offset else statement
+
+
+def stream_feature_collection(statement, page_size: int, metadata: dict,
+                              connect: Optional[Callable] = None) -> Iterator[bytes]:
+    """
+    FeatureCollection bytes for the rows of statement (feature_select with
+    limit page_size + 1), read through a server-side cursor on a connection
+    of its own. metadata is written last, with 'next' set to the cursor of
+    the following page if there is one.
+
+    The query is run and its first partition fetched before this returns,
+    so database errors are raised here, before a response has started;
+    only the rest is read as the returned iterator is consumed.
+    """
+    connection = (connect or engine.connect)()
+    try:
+        result = connection.execution_options(stream_results=True, yield_per=FARMS_STREAM_BATCH_ROWS).execute(statement)
+        partitions = result.partitions()
+        first = next(partitions, [])
+    except Exception:
+        connection.close()
+        raise
+    return _write_feature_collection(connection, first, partitions, page_size, metadata)
+
+
+def _write_feature_collection(connection, first, partitions, page_size: int, metadata: dict) -> Iterator[bytes]:
+    try:
+        yield b'{"type": "FeatureCollection", "features": ['
+        sent = 0
+        last_id = None
+        has_more = False
+        for rows in itertools.chain([first], partitions):
+            page = rows[:page_size - sent]
+            if page:
+                yield (b',' if sent else b'') + ','.join(feature for _, feature in page).encode()
+                sent += len(page)
+                last_id = page[-1][0]
+            if len(rows) > len(page):
+                has_more = True
+                break
+        metadata["next"] = farm_pagination.encode_cursor(last_id) if has_more else None
+        yield b'], "metadata": ' + json.dumps(metadata).encode() + b'}'
+    finally:
+        connection.close()
@@ -0,0 +1,174 @@
+"""
+Precomputed farm geometries.
+Besides the full polygon, every farm stores one simplified copy per map
+zoom tier, its bounding box and its centroid, computed once at ingest
+(farm_records / farm_from_row) instead of with ST_Simplify on every
+request. Tiers are set with FARM_GEOMETRY_TIERS as
+"<below zoom>:<tolerance in degrees>" for the low, mid and high tier:
+below the first zoom the low tier is served, and so on; from the last
+zoom up the full geometry. Below FARM_CENTROID_ZOOM farms are served as
+their centroid, and viewports are filtered on the bounding box so the
+full polygon is only read where it is served. Farms loaded before the
+columns existed, or after the tiers changed, are filled in by running
+(from backend/):
+
+    python -m services.farm_geometry [--all] [--batch-rows 5000]
+"""
+import argparse
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+import shapely
+from sqlalchemy import and_, case, func, literal_column, or_, text
+from sqlalchemy.dialects import postgresql
+from geoalchemy2.functions import ST_Centroid, ST_Intersects, ST_IsEmpty, ST_Simplify
+
+from database import Farm
+
+
+class GeometryTier(NamedTuple):
+    column: str
+    below_zoom: int
+    tolerance: float
+
+
+TIER_COLUMNS = ['geometry_low', 'geometry_mid', 'geometry_high']
+DERIVED_COLUMNS = TIER_COLUMNS + ['bbox', 'centroid']
+
+FARM_GEOMETRY_TIERS = os.getenv("FARM_GEOMETRY_TIERS", "6:0.001,11:0.0005,14:0.0001")
+FARM_CENTROID_ZOOM = int(os.getenv("FARM_CENTROID_ZOOM", "4"))
+BACKFILL_BATCH_ROWS = 5000
+
+
+def parse_tiers(spec: str) -> List[GeometryTier]:
+    """Tiers of a FARM_GEOMETRY_TIERS value; ValueError unless it has one increasing zoom per tier column"""
+    pairs = [item.split(':') for item in spec.split(',')]
+    if len(pairs) != len(TIER_COLUMNS):
+        raise ValueError(f"FARM_GEOMETRY_TIERS needs {len(TIER_COLUMNS)} tiers: {spec}")
+    try:
+        tiers = [GeometryTier(column, int(zoom), float(tolerance))
+                 for column, (zoom, tolerance) in zip(TIER_COLUMNS, pairs)]
+    except ValueError:
+        raise ValueError(f"Invalid FARM_GEOMETRY_TIERS: {spec} (expected e.g. 6:0.001,11:0.0005,14:0.0001)")
+    zooms = [tier.below_zoom for tier in tiers]
+    if zooms != sorted(set(zooms)):
+        raise ValueError(f"FARM_GEOMETRY_TIERS zooms must increase: {spec}")
+    return tiers
+
+
+TIERS = parse_tiers(FARM_GEOMETRY_TIERS)
+
+
+def tier_for_zoom(zoom: Optional[int], tiers: List[GeometryTier] = TIERS) -> Optional[GeometryTier]:
+    """The tier served at zoom, None for the full geometry (no zoom given, or zoomed in past the last tier)"""
+    if zoom is None:
+        return None
+    return next((tier for tier in tiers if zoom < tier.below_zoom), None)
+
+
+def simplified(geometry, tolerance: float):
+    """
+    SQL of derived_geometries' simplification: plain Douglas-Peucker
+    (ST_Simplify), keeping the geometry as is where it would collapse
+    """
+    simple = ST_Simplify(geometry, tolerance)
+    return case((func.coalesce(ST_IsEmpty(simple), True), geometry), else_=simple)
+
+
+def serves_centroid(zoom: Optional[int]) -> bool:
+    """Whether farms are served as their centroid at zoom (below FARM_CENTROID_ZOOM)"""
+    return zoom is not None and zoom < FARM_CENTROID_ZOOM
+
+
+def geometry_for_zoom(zoom: Optional[int]):
+    """
+    SQL expression of the farm geometry to serve at zoom: the centroid or
+    the tier column, computed on the fly only for farms not backfilled yet
+    """
+    if serves_centroid(zoom):
+        return func.coalesce(Farm.centroid, ST_Centroid(Farm.geometry))
+    tier = tier_for_zoom(zoom)
+    if tier is None:
+        return Farm.geometry
+    return func.coalesce(getattr(Farm, tier.column), simplified(Farm.geometry, tier.tolerance))
+
+
+def viewport_filter(envelope, zoom: Optional[int]):
+    """
+    SQL condition of the farms in envelope. The stored bbox is tested with
+    && (GiST index, no polygon read); only where the full geometry is
+    served are its candidates tested exactly with ST_Intersects. Farms not
+    backfilled yet fall back to the geometry.
+    """
+    overlaps = or_(Farm.bbox.op('&&')(envelope), and_(Farm.bbox.is_(None), Farm.geometry.op('&&')(envelope)))
+    if serves_centroid(zoom) or tier_for_zoom(zoom) is not None:
+        return overlaps
+    return and_(overlaps, ST_Intersects(Farm.geometry, envelope))
+
+
+def derived_geometries(geoms: np.ndarray, tiers: List[GeometryTier] = TIERS) -> Dict[str, np.ndarray]:
+    """
+    DERIVED_COLUMNS -> shapely geometries for an array of farm polygons.
+    Tiers are plain Douglas-Peucker, keeping the polygon as is where it
+    would collapse (the same as simplified() in SQL).
+    """
+    derived = {}
+    for tier in tiers:
+        simple = shapely.simplify(geoms, tier.tolerance, preserve_topology=False)
+        derived[tier.column] = np.where(shapely.is_empty(simple), geoms, simple)
+    derived['bbox'] = shapely.envelope(geoms)
+    derived['centroid'] = shapely.centroid(geoms)
+    return derived
+
+
+def backfill(db, recompute: bool = False, batch_rows: int = BACKFILL_BATCH_ROWS,
+             tiers: List[GeometryTier] = TIERS) -> int:
+    """
+    Compute the derived columns in PostGIS for farms missing any of them
+    (every farm if recompute), batch_rows ids per committed UPDATE, with
+    the same simplification as derived_geometries. Returns farms updated.
+    """
+    first, last = db.execute(text("SELECT min(id), max(id) FROM farms")).one()
+    if first is None:
+        return 0
+    assignments = ', '.join(
+        f"{tier.column} = " + str(simplified(literal_column('geometry'), tier.tolerance).compile(
+            dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+        for tier in tiers
+    ) + ", bbox = ST_Envelope(geometry), centroid = ST_Centroid(geometry)"
+    missing = '' if recompute else ' AND (' + ' OR '.join(f"{c} IS NULL" for c in DERIVED_COLUMNS) + ')'
+    updated = 0
+    for start in range(first, last + 1, batch_rows):
+        result = db.execute(
+            text(f"UPDATE farms SET {assignments} WHERE id >= :start AND id < :end{missing}"),
+            {'start': start, 'end': start + batch_rows},
+        )
+        db.commit()
+        updated += result.rowcount
+    return updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill in the precomputed geometry columns of farms.")
+    parser.add_argument('--all', action='store_true', help='Recompute every farm (e.g. after changing FARM_GEOMETRY_TIERS)')
+    parser.add_argument('--batch-rows', type=int, default=BACKFILL_BATCH_ROWS, help='Farms per committed UPDATE')
+    args = parser.parse_args(argv)
+
+    from database import SessionLocal, init_db
+    from services import farm_cache
+    init_db()
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        updated = backfill(db, recompute=args.all, batch_rows=args.batch_rows)
+    finally:
+        db.close()
+    farm_cache.invalidate_farm_caches()
+    print(f"Updated {updated} farms in {time.perf_counter() - start:.1f}s "
+          f"(tiers: {', '.join(f'{t.column} below zoom {t.below_zoom}, {t.tolerance}' for t in TIERS)})")
+
+
+if __name__ == "__main__":
+    main()
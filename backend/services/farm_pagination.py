@@ -0,0 +1,68 @@
+"""
+Keyset pagination and row counts for farm listings.
+Pages are read in id order after the last id of the previous page, so
+every page costs one index range scan however deep it is. The cursor
+handed to clients is an opaque base64 token. Totals can be counted
+exactly, estimated from the planner, or counted once per filter
+signature and served from farm_cache until farms change.
+"""
+import base64
+import binascii
+import json
+import os
+from typing import Optional
+
+from services import farm_cache
+
+COUNT_MODES = ('exact', 'estimated', 'cached')
+FARMS_COUNT_MODE = os.getenv("FARMS_COUNT_MODE", "cached")
+
+
+def encode_cursor(last_id: int) -> str:
+    """Opaque token for the page after the row with id last_id"""
+    return base64.urlsafe_b64encode(json.dumps({'after': last_id}).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> int:
+    """The id encoded in a cursor token; ValueError if it is not one"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        after = data['after']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise ValueError(f"Invalid cursor: {token}")
+    if not isinstance(after, int) or isinstance(after, bool):
+        raise ValueError(f"Invalid cursor: {token}")
+    return after
+
+
+def estimated_count(db, query) -> int:
+    """Rows the planner expects query to return (EXPLAIN, the query is not run)"""
+    compiled = query.statement.compile(dialect=db.get_bind().dialect)
+    plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_mode_for(mode: str, viewport: bool) -> str:
+    """
+    The count mode to use for a listing: 'cached' falls back to
+    'estimated' for viewport (bbox) filters, whose signatures change with
+    every pan and would only churn the count cache
+    """
+    return 'estimated' if mode == 'cached' and viewport else mode
+
+
+def count_rows(db, query, mode: str = FARMS_COUNT_MODE, signature: Optional[str] = None) -> int:
+    """
+    Number of rows of query: 'exact' runs COUNT(*), 'estimated' asks the
+    planner and 'cached' runs COUNT(*) once per signature until the next
+    farm_cache.invalidate_farm_caches().
+    """
+    if mode not in COUNT_MODES:
+        raise ValueError(f"Unknown count mode: {mode} (use {', '.join(COUNT_MODES)})")
+    if mode == 'estimated':
+        return estimated_count(db, query)
+    if mode == 'cached' and signature is not None:
+        return farm_cache.cached_count(signature, query.count)
+    return query.count()
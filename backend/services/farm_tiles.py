@@ -0,0 +1,72 @@
+"""
+Mapbox Vector Tiles of farm polygons.
+Tiles are rendered by PostGIS (ST_AsMVTGeom / ST_AsMVT, web mercator
+z/x/y) from the farm_geometry tier of their zoom (farm centroids, as
+points, below FARM_TILE_MIN_ZOOM), with only the attributes the map
+styles by, and cached on disk by farm_cache until the next ingest.
+"""
+import os
+
+from sqlalchemy import text
+
+from services import farm_cache, farm_geometry
+
+TILE_LAYER = 'farms'
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+# Tiles below this zoom carry each farm's centroid instead of its polygon
+# (a whole district of polygons per tile)
+FARM_TILE_MIN_ZOOM = int(os.getenv("FARM_TILE_MIN_ZOOM", "10"))
+FARM_TILE_MAX_ZOOM = int(os.getenv("FARM_TILE_MAX_ZOOM", "22"))
+MEDIA_TYPE = 'application/vnd.mapbox-vector-tile'
+
+
+def tile_sql(z: int):
+    """
+    Tile query for zoom z, reading the centroid or geometry tier of that
+    zoom; farms are found by their stored bbox (the geometry if not
+    backfilled yet)
+    """
+    tier = farm_geometry.tier_for_zoom(z)
+    if z < FARM_TILE_MIN_ZOOM:
+        geometry = "COALESCE(f.centroid, ST_Centroid(f.geometry))"
+    else:
+        geometry = f"COALESCE(f.{tier.column}, f.geometry)" if tier else "f.geometry"
+    return text(
+        "WITH bounds AS (SELECT geom, ST_Transform(ST_Expand(geom, :margin), 4326) AS search "
+        "FROM ST_TileEnvelope(:z, :x, :y) AS geom), "
+        "tile AS ("
+        f"SELECT ST_AsMVTGeom(ST_Transform({geometry}, 3857), b.geom, :extent, :buffer, true) AS geom, "
+        "f.farm_id, f.recent_ndvi AS ndvi, f.harvest_flag "
+        "FROM farms f CROSS JOIN bounds b "
+        "WHERE f.bbox && b.search OR f.bbox IS NULL AND f.geometry && b.search"
+        ") "
+        f"SELECT ST_AsMVT(tile, '{TILE_LAYER}', :extent, 'geom') FROM tile WHERE geom IS NOT NULL"
+    )
+
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    """Whether z/x/y is a tile of the served zoom range"""
+    return 0 <= z <= FARM_TILE_MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def render_tile(db, z: int, x: int, y: int) -> bytes:
+    """One tile straight from the farms table (empty bytes if no farm touches it)"""
+    # Tile width in mercator metres times the buffer share of the extent
+    margin = 40075016.68557849 / 2 ** z * TILE_BUFFER / TILE_EXTENT
+    data = db.execute(tile_sql(z), {
+        'z': z, 'x': x, 'y': y, 'extent': TILE_EXTENT, 'buffer': TILE_BUFFER, 'margin': margin,
+    }).scalar()
+    return bytes(data) if data else b''
+
+
+def get_tile(db, z: int, x: int, y: int) -> bytes:
+    """A tile from the disk cache, rendered and cached on a miss"""
+    if not farm_cache.FARM_TILE_CACHE:
+        return render_tile(db, z, x, y)
+    generation = farm_cache.current_generation()
+    data = farm_cache.read_tile(z, x, y, generation)
+    if data is None:
+        data = render_tile(db, z, x, y)
+        farm_cache.write_tile(z, x, y, generation, data)
+    return data
@@ -1,153 +1,263 @@
-from typing import List, Tuple, Optional
+from typing import Callable, List, Tuple, Optional
 import os
+import time
 from database import SessionLocal, Farm
 from geoalchemy2.shape import from_shape
+from services import bulk_load, farm_cache, farm_geometry, ndvi_cache, ndvi_history, ndvi_providers
+from services.metrics import StageRecorder
 
-def full_pipeline(csv_path: str, geojson_path: str, ndvi_csv_path: str, final_geojson_path: Optional[str] = None, log_path: Optional[str] = None) -> Tuple[int, int]:
+def full_pipeline(csv_path: str, spill_path: Optional[str], ndvi_csv_path: Optional[str], final_geojson_path: Optional[str] = None, log_path: Optional[str] = None, memory_budget_mb: Optional[float] = None, mode: str = 'replace', missing: str = 'delete', metrics: Optional[StageRecorder] = None, ndvi_checkpoint_path: Optional[str] = None, stream_ndvi: bool = False, progress: Optional[Callable[[int, int], None]] = None) -> Tuple[int, int]:
     """
     Full pipeline: CSV -> Database (PostGIS)
-    1. Convert CSV to GeoJSON (polygons, temporary)
-    2. Call NDVI extraction (external script)
+    1. Convert CSV to farm polygons (in-memory GeoDataFrame)
+    2. NDVI extraction (in-process Earth Engine engine, cache misses only)
     3. Merge NDVI results
     4. Apply harvest flag
     5. Save to PostGIS database
     All data is now stored in PostgreSQL/PostGIS - no file dependencies
+
+    If ndvi_csv_path names an existing file of NDVI results, it is used
+    instead of extracting; otherwise results stay in memory. With
+    ndvi_checkpoint_path, extraction progress is checkpointed there so a
+    rerun of a failed job resumes instead of starting over.
+
+    Polygons are handed between stages in memory. If spill_path is given
+    they are written there as GeoParquet (requires pyarrow) while NDVI
+    extraction runs and read back afterwards, instead of staying resident.
+
+    When memory_budget_mb is set the CSV is streamed in chunks sized to
+    that budget instead of being loaded whole (see chunked_pipeline).
+
+    mode='replace' swaps in the upload as the complete farms table.
+    mode='incremental' only inserts new farms and updates farms whose
+    content hash changed; farms absent from the upload are deleted, or
+    moved to farms_archive when missing='archive'.
+
+    With stream_ndvi (replace mode, no memory budget) the farms are loaded
+    with cached NDVI only, and NDVI extracted for the cache misses is then
+    written onto them batch by batch as results arrive, so polygons are
+    served while extraction is still running. progress(done, total) is
+    called with the number of farms whose NDVI is final.
+
+    Timing, row counts and peak memory of each stage are recorded on
+    metrics (a StageRecorder), when given.
     """
-    import subprocess
-    # Step 1: CSV to GeoJSON (temporary)
-    n_ok, n_rej = csv_to_geojson(csv_path, geojson_path, log_path)
-
-    # Step 2: NDVI extraction (call external script)
-    if not os.path.exists(ndvi_csv_path):
-        ndvi_script = os.path.join(os.path.dirname(__file__), 'ndvi_extraction.py')
-        if not os.path.exists(ndvi_script):
-            raise FileNotFoundError(f"NDVI extraction script not found: {ndvi_script}")
-        
-        # Log the command being executed
-        if log_path:
-            with open(log_path, 'a') as f:
-                f.write(f"Running NDVI extraction script: {ndvi_script}\n")
-                f.write(f"Input CSV: {csv_path}\n")
-                f.write(f"Output CSV: {ndvi_csv_path}\n")
-        
-        # Check if EE_PROJECT_ID is set
-        ee_project = os.environ.get("EE_PROJECT_ID")
-        if not ee_project:
-            error_msg = "EE_PROJECT_ID environment variable is not set. Earth Engine authentication required."
-            if log_path:
-                with open(log_path, 'a') as f:
-                    f.write(f"ERROR: {error_msg}\n")
-            raise RuntimeError(error_msg)
-        
-        if log_path:
-            with open(log_path, 'a') as f:
-                f.write(f"EE_PROJECT_ID: {ee_project}\n")
-        
-        # Run the NDVI extraction script
-        result = subprocess.run([
-            "python", ndvi_script, csv_path, ndvi_csv_path
-        ], capture_output=True, text=True, env=os.environ.copy())
-        
-        # Log the results
-        if log_path:
-            with open(log_path, 'a') as f:
-                f.write(f"\nNDVI extraction return code: {result.returncode}\n")
-                if result.stdout:
-                    f.write(f"NDVI extraction stdout:\n{result.stdout}\n")
-                if result.stderr:
-                    f.write(f"NDVI extraction stderr:\n{result.stderr}\n")
-        
-        if result.returncode != 0:
-            error_detail = result.stderr if result.stderr else "No error details available"
-            raise RuntimeError(f"NDVI extraction failed with code {result.returncode}: {error_detail}")
+    _check_ingest_mode(mode, missing)
+    if stream_ndvi and (mode != 'replace' or memory_budget_mb):
+        raise ValueError("Streaming NDVI requires mode='replace' and no memory budget")
+    metrics = metrics or StageRecorder()
+    if memory_budget_mb:
+        return chunked_pipeline(csv_path, ndvi_csv_path, memory_budget_mb, log_path, mode, missing, metrics, ndvi_checkpoint_path)
+
+    # Step 1: CSV to polygons
+    with metrics.stage('parse') as stage:
+        df = read_farms_csv(csv_path)
+        stage.rows_out = len(df)
+    with metrics.stage('polygonize', rows_in=len(df)) as stage:
+        gdf, n_rej = frame_to_geodataframe(df)
+        stage.rows_out = n_ok = len(gdf)
+    del df
+    if log_path:
+        with open(log_path, 'w') as f:
+            f.write(f"Rejected rows: {n_rej}\n")
+    polygons = pd.DataFrame({'farm_id': gdf['farm_id'], 'geometry': gdf.geometry.values})
+    if spill_path:
+        gdf.to_parquet(spill_path)
+        del gdf
+
+    # Step 2: NDVI extraction (in-process, cache misses only); when
+    # streaming, only the cache lookup happens before the load
+    precomputed = bool(ndvi_csv_path and os.path.exists(ndvi_csv_path))
+    stream_ndvi = stream_ndvi and not precomputed
+    if precomputed:
+        with metrics.stage('ndvi_extraction') as stage:
+            ndvi = load_ndvi_results(ndvi_csv_path)
+            stage.rows_out = len(ndvi)
+    else:
+        with metrics.stage('ndvi_cache', rows_in=n_ok) as stage:
+            hashes = farm_geometry_hashes(polygons['farm_id'], polygons['geometry'])
+            ndvi, misses = lookup_cached_ndvi(hashes, log_path)
+            stage.rows_out = len(ndvi)
+        if not stream_ndvi:
+            with metrics.stage('ndvi_extraction', rows_in=len(misses)) as stage:
+                fresh = extract_ndvi_misses(misses, farms=polygons, log_path=log_path, checkpoint_path=ndvi_checkpoint_path)
+                stage.rows_out = len(fresh)
+            ndvi = concat_ndvi([ndvi, fresh])
+    if not stream_ndvi:
+        del polygons
 
     # Step 3: Merge NDVI results
-    gdf = gpd.read_file(geojson_path)
-    ndvi = pd.read_csv(ndvi_csv_path)
-    # Deduplicate NDVI results by farm_id (keep first)
-    if 'farm_id' in ndvi.columns:
-        ndvi = ndvi.drop_duplicates(subset='farm_id', keep='first').reset_index(drop=True)
-    merged = gdf.merge(ndvi, on="farm_id", how="left")
+    with metrics.stage('ndvi_merge', rows_in=n_ok) as stage:
+        if spill_path:
+            gdf = gpd.read_parquet(spill_path)
+        merged = merge_ndvi(gdf, ndvi)
+        stage.rows_out = len(merged)
 
     # Step 4: Apply harvest flag
-    merged["harvest_flag"] = ((merged["recent_ndvi"] < 0.5) & (merged["recent_ndvi"] < merged["prev_ndvi"])).astype(int)
+    with metrics.stage('harvest_flag', rows_in=len(merged)) as stage:
+        apply_harvest_flag(merged)
+        stage.rows_out = len(merged)
 
     # Step 5: Save to PostGIS database
     db = SessionLocal()
+    table = None
     try:
-        # Clear all existing data (like the old file deletion behavior)
-        if log_path:
-            with open(log_path, 'a') as f:
-                f.write("Clearing existing farm data from database...\n")
-        
-        deleted_count = db.query(Farm).delete()
-        db.commit()
-        
-        if log_path:
-            with open(log_path, 'a') as f:
-                f.write(f"Deleted {deleted_count} existing farms\n")
-        
-        # Insert new data
-        saved_count = 0
-        for idx, row in merged.iterrows():
-            farm_id = str(row['farm_id'])
-            
-            # Create new farm (no need to check for existing since we cleared all)
-            farm = Farm(
-                farm_id=farm_id,
-                div_name=row.get('Div_Name'),
-                vill_cd=row.get('Vill_Cd'),
-                vill_name=row.get('Vill_Name'),
-                vill_code=row.get('Vill_Code'),
-                supervisor_name=row.get('Supervisor Name'),
-                farmer_name=row.get('Farmer_Name'),
-                father_name=row.get('Father_Name'),
-                plot_no=row.get('Plot No'),
-                gashti_no=row.get('Gashti No.'),
-                survey_date=row.get('Survey Date'),
-                area=row.get('Area'),
-                shar=row.get('Shar'),
-                varieties=row.get('Varieties'),
-                crop_type=row.get('Crop Type'),
-                east=row.get('East'),
-                west=row.get('West'),
-                north=row.get('North'),
-                south=row.get('South'),
-                wkt=row.get('WKT'),
-                geometry=from_shape(row.geometry, srid=4326),
-                recent_date=row.get('recent_date'),
-                recent_ndvi=row.get('recent_ndvi'),
-                prev_date=row.get('prev_date'),
-                prev_ndvi=row.get('prev_ndvi'),
-                delta=row.get('delta'),
-                harvest_flag=int(row.get('harvest_flag', 0))
-            )
-            db.add(farm)
-            
-            saved_count += 1
-            
-            # Commit in batches
-            if saved_count % 50 == 0:
+        if mode == 'incremental':
+            with metrics.stage('db_load', rows_in=len(merged)) as stage:
+                counts = upsert_farms(db, merged, log_path)
+                stage.rows_out = counts['inserted'] + counts['updated']
+            with metrics.stage('ndvi_history', rows_in=len(merged)) as stage:
+                stage.rows_out = record_ndvi_history(db, merged, log_path)
+                db.commit()
+            with metrics.stage('db_finalize'):
+                finish_incremental(db, merged['farm_id'], counts, missing, log_path)
+        else:
+            with metrics.stage('db_staging'):
+                table = begin_farm_reload(db, log_path)
+            with metrics.stage('db_load', rows_in=len(merged)) as stage:
+                saved_count = stage.rows_out = store_farms(db, merged, log_path, table=table)
+            with metrics.stage('ndvi_history', rows_in=len(merged)) as stage:
+                stage.rows_out = record_ndvi_history(db, merged, log_path)
+                db.commit()
+            finish_farm_reload(db, table, log_path, metrics)
+            _append_log(log_path, f"Saved {saved_count} farms to PostGIS database")
+    except Exception as e:
+        db.rollback()
+        _append_log(log_path, f"Error saving to database: {e}")
+        drop_job_tables(db, [table], log_path)
+        raise
+    finally:
+        db.close()
+
+    # Step 6: Streaming only - extract the cache misses onto the loaded farms
+    if stream_ndvi:
+        done = n_ok - len(misses)
+        if progress:
+            progress(done, n_ok)
+        with metrics.stage('ndvi_extraction', rows_in=len(misses)) as stage:
+            on_flush = ndvi_stream_updater(merged, done, n_ok, log_path, progress)
+            try:
+                fresh = extract_ndvi_misses(misses, farms=polygons, log_path=log_path,
+                                            checkpoint_path=ndvi_checkpoint_path, on_flush=on_flush)
+            finally:
+                # Once for the whole stream, including the batches of a failed one
+                farm_cache.invalidate_farm_caches()
+            stage.rows_out = len(fresh)
+    elif progress:
+        progress(n_ok, n_ok)
+
+    return n_ok, n_rej
+
+
+def chunked_pipeline(csv_path: str, ndvi_csv_path: Optional[str], memory_budget_mb: float, log_path: Optional[str] = None, mode: str = 'replace', missing: str = 'delete', metrics: Optional[StageRecorder] = None, ndvi_checkpoint_path: Optional[str] = None) -> Tuple[int, int]:
+    """
+    Bounded-memory variant of full_pipeline.
+    The CSV is read in chunks sized from memory_budget_mb and each chunk is
+    carried through polygon building, NDVI (cache lookup and extraction of
+    its misses), merge, harvest flagging and the database insert before
+    the next one is read. farm_id dedup spans chunks through the upload's
+    table of loaded ids (bulk_load.claim_farm_ids), which is also the keep
+    list of an incremental upload, so no per-farm state is held in memory
+    across chunks. Stage metrics are summed over the chunks.
+    """
+    metrics = metrics or StageRecorder()
+    if log_path:
+        open(log_path, 'w').close()
+
+    col_map = resolve_columns(pd.read_csv(csv_path, nrows=0).columns)
+    chunk_rows = chunk_rows_for_budget(csv_path, memory_budget_mb, log_path=log_path)
+    _append_log(log_path, f"Streaming ingest: {chunk_rows} rows per chunk ({memory_budget_mb} MB budget)")
+
+    precomputed = None
+    if ndvi_csv_path and os.path.exists(ndvi_csv_path):
+        with metrics.stage('ndvi_extraction') as stage:
+            precomputed = load_ndvi_results(ndvi_csv_path)
+            stage.rows_out = len(precomputed)
+
+    n_ok = n_rej = 0
+    counts = {}
+    db = SessionLocal()
+    table = None
+    upload_ids = bulk_load.job_table_name(bulk_load.UPLOAD_IDS_TABLE)
+    try:
+        with metrics.stage('db_staging'):
+            table = begin_farm_reload(db, log_path) if mode == 'replace' else None
+            bulk_load.create_upload_ids_table(db, upload_ids)
+            db.commit()
+        reader = pd.read_csv(csv_path, chunksize=chunk_rows)
+        while True:
+            with metrics.stage('parse') as stage:
+                chunk = next(reader, None)
+                if chunk is not None:
+                    stage.rows_in = len(chunk)
+                    chunk = dedupe_farms(prepare_columns(chunk, col_map))
+                    stage.rows_out = len(chunk)
+            if chunk is None:
+                break
+            with metrics.stage('polygonize', rows_in=len(chunk)) as stage:
+                gdf, rejected = frame_to_geodataframe(chunk)
+                # Farms already loaded from an earlier chunk keep that row
+                gdf = gdf[gdf['farm_id'].astype(str).isin(bulk_load.claim_farm_ids(db, gdf['farm_id'], upload_ids))]
+                stage.rows_out = len(gdf)
+            n_rej += rejected
+            if gdf.empty:
+                db.commit()
+                continue
+            if precomputed is None:
+                with metrics.stage('ndvi_cache', rows_in=len(gdf)) as stage:
+                    polygons = pd.DataFrame({'farm_id': gdf['farm_id'], 'geometry': gdf.geometry.values})
+                    hashes = farm_geometry_hashes(polygons['farm_id'], polygons['geometry'])
+                    cached, misses = lookup_cached_ndvi(hashes, log_path)
+                    stage.rows_out = len(cached)
+                with metrics.stage('ndvi_extraction', rows_in=len(misses)) as stage:
+                    fresh = extract_ndvi_misses(misses, polygons, log_path, ndvi_checkpoint_path)
+                    stage.rows_out = len(fresh)
+                ndvi = concat_ndvi([cached, fresh])
+            else:
+                ndvi = precomputed
+            with metrics.stage('ndvi_merge', rows_in=len(gdf)) as stage:
+                merged = merge_ndvi(gdf, ndvi)
+                stage.rows_out = len(merged)
+            with metrics.stage('harvest_flag', rows_in=len(merged)) as stage:
+                apply_harvest_flag(merged)
+                stage.rows_out = len(merged)
+            with metrics.stage('db_load', rows_in=len(merged)) as stage:
+                if mode == 'incremental':
+                    chunk_counts = upsert_farms(db, merged, log_path)
+                    for key, value in chunk_counts.items():
+                        counts[key] = counts.get(key, 0) + value
+                    stage.rows_out = chunk_counts['inserted'] + chunk_counts['updated']
+                    n_ok += len(merged)
+                else:
+                    stage.rows_out = store_farms(db, merged, log_path, table=table)
+                    n_ok += stage.rows_out
+            with metrics.stage('ndvi_history', rows_in=len(merged)) as stage:
+                stage.rows_out = record_ndvi_history(db, merged, log_path)
                 db.commit()
-        
+        _append_log(log_path, f"Rejected rows: {n_rej}")
+        if mode == 'incremental':
+            with metrics.stage('db_finalize'):
+                finish_incremental(db, None, counts, missing, log_path, keep_table=upload_ids)
+        else:
+            finish_farm_reload(db, table, log_path, metrics)
+            _append_log(log_path, f"Saved {n_ok} farms to PostGIS database")
+        bulk_load.drop_job_table(db, upload_ids)
         db.commit()
-        
-        if log_path:
-            with open(log_path, 'a') as f:
-                f.write(f"Saved {saved_count} farms to PostGIS database\n")
-        
     except Exception as e:
         db.rollback()
-        if log_path:
-            with open(log_path, 'a') as f:
-                f.write(f"Error saving to database: {e}\n")
+        _append_log(log_path, f"Error saving to database: {e}")
+        drop_job_tables(db, [table, upload_ids], log_path)
         raise
     finally:
         db.close()
-    
+
     return n_ok, n_rej
+
+
 import pandas as pd
 import geopandas as gpd
+import numpy as np
+import shapely
 from shapely.geometry import Polygon
 import logging
 from typing import List, Tuple, Optional
@@ -160,6 +270,8 @@ REQUIRED_COLUMNS = [
     'Lang1', 'Long1', 'Lang2', 'Long2', 'Lang3', 'Long3', 'Lang4', 'Long4', 'WKT'
 ]
 
+CORNER_COLUMNS = ['Lang1', 'Long1', 'Lang2', 'Long2', 'Lang3', 'Long3', 'Lang4', 'Long4']
+
 logger = logging.getLogger(__name__)
 
 
@@ -192,15 +304,79 @@ def row_to_polygon(row) -> Optional[Polygon]:
         return None
 
 
-def csv_to_geojson(csv_path: str, geojson_path: str, log_path: Optional[str] = None) -> Tuple[int, int]:
+def _corner_array(df: pd.DataFrame, prefix: str) -> np.ndarray:
+    """Return an (n, 4) float array of one corner axis; unparseable values become NaN"""
+    columns = []
+    for i in range(1, 5):
+        col = f'{prefix}{i}'
+        if col in df.columns:
+            columns.append(pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float))
+        else:
+            columns.append(np.full(len(df), np.nan))
+    return np.column_stack(columns) if len(df) else np.empty((0, 4))
+
+
+def polygons_from_frame(df: pd.DataFrame) -> np.ndarray:
+    """
+    Vectorized row_to_polygon over a whole DataFrame.
+    Returns an object array holding a Polygon, or None for rejected rows,
+    with the same 3-corner fallback, auto-closing and validity rules.
+    """
+    n = len(df)
+    result = np.full(n, None, dtype=object)
+    if n == 0:
+        return result
+
+    lat = _corner_array(df, 'Lang')
+    lon = _corner_array(df, 'Long')
+    present = ~np.isnan(lat) & ~np.isnan(lon)
+
+    # Move the usable corners to the front of each row, keeping their order
+    order = np.argsort(~present, axis=1, kind='stable')
+    xs = np.take_along_axis(lon, order, axis=1)
+    ys = np.take_along_axis(lat, order, axis=1)
+    count = present.sum(axis=1)
+
+    # A ring needs 4 coordinates once closed, so an already-closed
+    # 3-corner row (2 distinct points) is rejected just like Polygon() would
+    last = np.clip(count - 1, 0, 3)
+    rows = np.arange(n)
+    closed = (xs[:, 0] == xs[rows, last]) & (ys[:, 0] == ys[rows, last])
+    candidate = (count >= 3) & (count + ~closed >= 4)
+    if not candidate.any():
+        return result
+
+    keep = np.arange(4) < count[candidate, None]
+    coords = np.stack([xs[candidate], ys[candidate]], axis=-1)[keep]
+    indices = np.repeat(np.arange(candidate.sum()), count[candidate])
+    # linearrings closes any ring whose first and last points differ
+    polygons = shapely.polygons(shapely.linearrings(coords, indices=indices))
+    valid = shapely.is_valid(polygons)
+
+    result[np.flatnonzero(candidate)[valid]] = polygons[valid]
+    return result
+
 
+# Bytes per parsed CSV row are multiplied by this to cover the polygon
+# objects, the merged frame and the ORM objects built from each chunk
+CHUNK_MEMORY_OVERHEAD = 6
+MIN_CHUNK_ROWS = 1000
+
+
+def _append_log(log_path: Optional[str], msg: str) -> None:
+    if log_path:
+        with open(log_path, 'a') as f:
+            f.write(f"{msg}\n")
+
+
+def resolve_columns(columns) -> dict:
+    """
+    Map each of REQUIRED_COLUMNS to a column of the CSV, tolerating case,
+    spacing and small typos. Raises ValueError if any column is missing.
+    """
     import difflib
-    df = pd.read_csv(csv_path)
-    # Keep only the first occurrence of each unique farm_id
-    if 'farm_id' in df.columns:
-        df = df.drop_duplicates(subset='farm_id', keep='first').reset_index(drop=True)
     # Normalize columns: strip, lower, remove extra spaces
-    norm_map = {c: c.strip().lower().replace(' ', '') for c in df.columns}
+    norm_map = {c: c.strip().lower().replace(' ', '') for c in columns}
     required_norm = {c: c.strip().lower().replace(' ', '') for c in REQUIRED_COLUMNS}
     col_map = {}
     for req, req_norm in required_norm.items():
@@ -220,26 +396,434 @@ def csv_to_geojson(csv_path: str, geojson_path: str, log_path: Optional[str] = N
     missing_cols = [req for req, orig in col_map.items() if orig is None]
     if missing_cols:
         raise ValueError(f"Missing columns: {missing_cols}")
-    # Rename columns in df to match required names
-    df = df.rename(columns={v: k for k, v in col_map.items() if v is not None})
-
-    features = []
-    rejected = 0
-    for idx, row in df.iterrows():
-        poly = row_to_polygon(row)
-        if poly is None:
-            logger.warning(f"Row {idx} rejected: insufficient or invalid corners.")
-            rejected += 1
+    return col_map
+
+
+def prepare_columns(df: pd.DataFrame, col_map: dict) -> pd.DataFrame:
+    """Rename CSV columns to the REQUIRED_COLUMNS names"""
+    return df.rename(columns={v: k for k, v in col_map.items() if v is not None})
+
+
+def dedupe_farms(df: pd.DataFrame, seen_ids: Optional[set] = None) -> pd.DataFrame:
+    """
+    Keep only the first occurrence of each farm_id.
+    When seen_ids is given, ids already seen in earlier chunks are dropped
+    too and the ids of this chunk are added to it.
+    """
+    keys = df['farm_id'].astype(str)
+    keep = ~keys.duplicated(keep='first')
+    if seen_ids is not None:
+        keep &= ~keys.isin(seen_ids)
+        seen_ids.update(keys[keep])
+    return df.loc[keep]
+
+
+def frame_to_geodataframe(df: pd.DataFrame) -> Tuple[gpd.GeoDataFrame, int]:
+    """Build farm polygons for a prepared frame; returns (GeoDataFrame, rejected rows)"""
+    polygons = polygons_from_frame(df)
+    ok = ~shapely.is_missing(polygons)
+    for idx in np.flatnonzero(~ok):
+        logger.warning(f"Row {df.index[idx]} rejected: insufficient or invalid corners.")
+    props = df.loc[ok].drop(columns=CORNER_COLUMNS, errors='ignore').reset_index(drop=True)
+    gdf = gpd.GeoDataFrame(props, geometry=list(polygons[ok]), crs='EPSG:4326')
+    return gdf, int((~ok).sum())
+
+
+def chunk_rows_for_budget(csv_path: str, memory_budget_mb: float, sample_rows: int = 1000, log_path: Optional[str] = None) -> int:
+    """
+    Estimate how many CSV rows fit in memory_budget_mb from a sample of
+    the file. Never fewer than MIN_CHUNK_ROWS: a budget too small for that
+    is exceeded, with a warning.
+    """
+    sample = pd.read_csv(csv_path, nrows=sample_rows)
+    if sample.empty:
+        return MIN_CHUNK_ROWS
+    bytes_per_row = sample.memory_usage(deep=True).sum() / len(sample)
+    rows = int(memory_budget_mb * 1024 * 1024 / (bytes_per_row * CHUNK_MEMORY_OVERHEAD))
+    if rows < MIN_CHUNK_ROWS:
+        needed_mb = MIN_CHUNK_ROWS * bytes_per_row * CHUNK_MEMORY_OVERHEAD / (1024 * 1024)
+        msg = (f"WARNING: memory budget of {memory_budget_mb} MB fits only {rows} rows per chunk; "
+               f"using {MIN_CHUNK_ROWS} rows (about {needed_mb:.1f} MB)")
+        logger.warning(msg)
+        _append_log(log_path, msg)
+    return max(rows, MIN_CHUNK_ROWS)
+
+
+def run_ndvi_extraction(farms: pd.DataFrame, log_path: Optional[str] = None, checkpoint_path: Optional[str] = None, on_flush: Optional[Callable[[List[dict], List[str]], None]] = None, provider: Optional[ndvi_providers.NdviProvider] = None) -> pd.DataFrame:
+    """
+    NDVI for a frame of farms (farm_id plus corner columns or polygons)
+    from provider (default: ndvi_providers.NDVI_PROVIDER), resumable from
+    checkpoint_path if the provider supports it. on_flush(rows, empty ids)
+    is called for each batch of results as it is written. The provider's
+    progress reports go to log_path (the module logger without one).
+    """
+    provider = provider or ndvi_providers.get_provider()
+    _append_log(log_path, f"Extracting NDVI for {len(farms)} farms with {provider.describe()}")
+    if 'geometry' not in farms.columns:
+        farms = farms.assign(geometry=polygons_from_frame(farms))
+    try:
+        provider.check()
+        log = (lambda message: _append_log(log_path, message)) if log_path else None
+        ndvi = provider.extract(farms, checkpoint_path=checkpoint_path, on_flush=on_flush, log=log)
+    except Exception as e:
+        _append_log(log_path, f"ERROR: NDVI extraction failed: {e}")
+        raise
+    _append_log(log_path, f"NDVI extraction returned results for {len(ndvi)} farms")
+    return ndvi
+
+
+def farm_geometry_hashes(farm_ids: pd.Series, polygons) -> pd.Series:
+    """Canonical geometry hash of each farm polygon (see ndvi_cache), indexed by str farm_id"""
+    return pd.Series(ndvi_cache.geometry_hashes(polygons), index=farm_ids.astype(str).to_numpy(), dtype=object)
+
+
+def lookup_cached_ndvi(hashes: pd.Series, log_path: Optional[str] = None) -> Tuple[pd.DataFrame, pd.Series]:
+    """
+    Split the farms of hashes (farm_geometry_hashes output) into cache hits
+    and misses for the current date window. Returns (NDVI results of the
+    hits with farm_id, hashes of the misses). Expired entries are evicted
+    first; if the cache is unavailable every farm is a miss.
+    """
+    window = ndvi_cache.cache_window()
+    db = SessionLocal()
+    try:
+        evicted = ndvi_cache.evict_expired(db)
+        cached = ndvi_cache.lookup(db, hashes.unique(), window)
+        db.commit()
+        if evicted:
+            _append_log(log_path, f"NDVI cache: evicted {evicted} expired entries")
+    except Exception as e:
+        db.rollback()
+        _append_log(log_path, f"NDVI cache unavailable, extracting every farm: {e}")
+        cached = pd.DataFrame(columns=ndvi_cache.NDVI_COLUMNS)
+    finally:
+        db.close()
+
+    hit = hashes.isin(cached.index)
+    n_hit = int(hit.sum())
+    hit_rate = n_hit / len(hashes) if len(hashes) else 0.0
+    hits = cached.loc[hashes[hit].to_numpy()].reset_index(drop=True).assign(farm_id=hashes.index[hit.to_numpy()])
+    # Negative entries: farms known to have no NDVI (cloudy) in this window
+    cloudy = hits['recent_ndvi'].isna()
+    _append_log(log_path, f"NDVI cache: {n_hit} hits, {len(hashes) - n_hit} misses ({hit_rate:.1%} hit rate)"
+                          + (f", {int(cloudy.sum())} hits without NDVI" if cloudy.any() else ""))
+    return concat_ndvi([hits[~cloudy]]), hashes[~hit]
+
+
+def extract_ndvi_misses(misses: pd.Series, farms: pd.DataFrame, log_path: Optional[str] = None, checkpoint_path: Optional[str] = None, on_flush: Optional[Callable[[List[dict], List[str]], None]] = None) -> pd.DataFrame:
+    """
+    Extract NDVI for the cache misses of lookup_cached_ndvi, taken from
+    farms (farm_id plus geometry or corner columns), and store the results
+    in ndvi_cache, with farms the provider reported without NDVI (cloudy)
+    as entries of NULL NDVI. Returns the results with farm_id as str.
+    """
+    if not len(misses):
+        return concat_ndvi([])
+    miss_farms = farms[farms['farm_id'].astype(str).isin(set(misses.index))]
+    provider = ndvi_providers.get_provider()
+    cloudy = []
+
+    def record_flush(rows: List[dict], empty: List[str]) -> None:
+        cloudy.extend(empty)
+        if on_flush is not None:
+            on_flush(rows, empty)
+
+    fresh = run_ndvi_extraction(miss_farms, log_path, checkpoint_path, record_flush, provider)
+    fresh = fresh.assign(farm_id=fresh['farm_id'].astype(str))
+    if not provider.cacheable:
+        return fresh
+    negative = pd.DataFrame({'farm_id': pd.Series(cloudy, dtype=object).astype(str)}).assign(
+        **{column: None for column in ndvi_cache.NDVI_COLUMNS})
+    entries = concat_ndvi([fresh, negative])
+    db = SessionLocal()
+    try:
+        ndvi_cache.store(db, entries.assign(geometry_hash=entries['farm_id'].map(misses)), ndvi_cache.cache_window())
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        _append_log(log_path, f"Could not update NDVI cache: {e}")
+    finally:
+        db.close()
+    return fresh
+
+
+def extract_ndvi_cached(hashes: pd.Series, farms: pd.DataFrame, log_path: Optional[str] = None, checkpoint_path: Optional[str] = None) -> pd.DataFrame:
+    """
+    NDVI results for the farms of hashes (farm_geometry_hashes output).
+    Farms whose polygon and date window are in ndvi_cache are served from
+    it; only the misses are extracted, taken from farms (farm_id plus
+    geometry or corner columns), and their results are cached.
+    """
+    cached, misses = lookup_cached_ndvi(hashes, log_path)
+    fresh = extract_ndvi_misses(misses, farms, log_path, checkpoint_path)
+    return concat_ndvi([cached, fresh])
+
+
+def concat_ndvi(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenate NDVI result frames into farm_id + ndvi_cache.NDVI_COLUMNS,
+    keeping the cloud-free fractions if a provider reported them
+    """
+    frames = [frame for frame in frames if len(frame)]
+    columns = ['farm_id'] + ndvi_cache.NDVI_COLUMNS
+    columns += [c for _, _, c in ndvi_history.ACQUISITIONS if any(c in frame.columns for frame in frames)]
+    return pd.concat(frames, ignore_index=True)[columns] if frames else pd.DataFrame(columns=columns)
+
+
+def ndvi_stream_updater(merged: pd.DataFrame, done: int, total: int, log_path: Optional[str] = None, progress: Optional[Callable[[int, int], None]] = None) -> Callable[[List[dict], List[str]], None]:
+    """
+    on_flush callback for streaming NDVI into farms already loaded from
+    merged: each batch of results is harvest-flagged and applied with one
+    set-based UPDATE (bulk_load.update_ndvi) and recorded in the NDVI
+    history, in its own transaction. Only the batch's farms are converted
+    to records (without derived geometries) to re-hash them. done
+    of total farms are final beforehand (e.g. cache hits); the running
+    count is logged and passed to progress after every batch. Farm caches
+    are left to the caller to invalidate once the stream ends.
+    """
+    positions = pd.Series(np.arange(len(merged)), index=merged['farm_id'].astype(str).to_numpy())
+    state = {'done': done}
+
+    def on_flush(rows: List[dict], empty: List[str]) -> None:
+        if rows:
+            batch = pd.DataFrame(rows)
+            batch = apply_harvest_flag(batch.assign(farm_id=batch['farm_id'].astype(str)))
+            farms = merged.iloc[positions.reindex(batch['farm_id']).dropna().astype(int)]
+            records = bulk_load.farm_records(farms, derived=False).set_index('farm_id', drop=False)
+            updates = bulk_load.ndvi_updates(records, batch)
+            batch['Vill_Cd'] = records['vill_cd'].reindex(batch['farm_id']).to_numpy()
+            db = SessionLocal()
+            try:
+                bulk_load.update_ndvi(db, updates, bulk_load.DEFAULT_LOADER)
+                ndvi_history.store(db, ndvi_history.observations(batch))
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+        state['done'] += len(rows) + len(empty)
+        _append_log(log_path, f"NDVI streamed: {state['done']}/{total} farms")
+        if progress:
+            progress(state['done'], total)
+
+    return on_flush
+
+
+def record_ndvi_history(db, merged: pd.DataFrame, log_path: Optional[str] = None) -> int:
+    """Add the acquisitions behind merged's NDVI to ndvi_observations. Does not commit."""
+    count = ndvi_history.store(db, ndvi_history.observations(merged))
+    _append_log(log_path, f"Recorded {count} NDVI observations")
+    return count
+
+
+def load_ndvi_results(ndvi_csv_path: str) -> pd.DataFrame:
+    """Read the NDVI extraction output, deduplicated by farm_id (keep first)"""
+    ndvi = pd.read_csv(ndvi_csv_path)
+    if 'farm_id' in ndvi.columns:
+        ndvi = ndvi.drop_duplicates(subset='farm_id', keep='first').reset_index(drop=True)
+    return ndvi
+
+
+def merge_ndvi(gdf: gpd.GeoDataFrame, ndvi: pd.DataFrame) -> gpd.GeoDataFrame:
+    """Left-join NDVI results onto the farm polygons by farm_id"""
+    gdf = gdf.assign(farm_id=gdf['farm_id'].astype(str))
+    ndvi = ndvi.assign(farm_id=ndvi['farm_id'].astype(str))
+    return gdf.merge(ndvi, on="farm_id", how="left")
+
+
+def apply_harvest_flag(merged: pd.DataFrame) -> pd.DataFrame:
+    """Harvest = 1 if recent_ndvi < 0.5 and recent_ndvi < prev_ndvi"""
+    merged["harvest_flag"] = ((merged["recent_ndvi"] < 0.5) & (merged["recent_ndvi"] < merged["prev_ndvi"])).astype(int)
+    return merged
+
+
+def clear_farms(db, log_path: Optional[str] = None) -> int:
+    """Delete all existing farms (like the old file deletion behavior)"""
+    _append_log(log_path, "Clearing existing farm data from database...")
+    deleted_count = db.query(Farm).delete()
+    db.commit()
+    _append_log(log_path, f"Deleted {deleted_count} existing farms")
+    return deleted_count
+
+
+def farm_from_row(row) -> Farm:
+    """Build a Farm ORM object from a merged pipeline row"""
+    return Farm(
+        farm_id=str(row['farm_id']),
+        div_name=row.get('Div_Name'),
+        vill_cd=row.get('Vill_Cd'),
+        vill_name=row.get('Vill_Name'),
+        vill_code=row.get('Vill_Code'),
+        supervisor_name=row.get('Supervisor Name'),
+        farmer_name=row.get('Farmer_Name'),
+        father_name=row.get('Father_Name'),
+        plot_no=row.get('Plot No'),
+        gashti_no=row.get('Gashti No.'),
+        survey_date=row.get('Survey Date'),
+        area=row.get('Area'),
+        shar=row.get('Shar'),
+        varieties=row.get('Varieties'),
+        crop_type=row.get('Crop Type'),
+        east=row.get('East'),
+        west=row.get('West'),
+        north=row.get('North'),
+        south=row.get('South'),
+        wkt=row.get('WKT'),
+        geometry=from_shape(row.geometry, srid=4326),
+        **{column: from_shape(derived[0], srid=4326)
+           for column, derived in farm_geometry.derived_geometries(np.array([row.geometry], dtype=object)).items()},
+        recent_date=row.get('recent_date'),
+        recent_ndvi=row.get('recent_ndvi'),
+        prev_date=row.get('prev_date'),
+        prev_ndvi=row.get('prev_ndvi'),
+        delta=row.get('delta'),
+        harvest_flag=int(row.get('harvest_flag', 0))
+    )
+
+
+def save_farms(db, merged: pd.DataFrame, batch_size: int = 50) -> int:
+    """Insert merged rows through the ORM, committing in batches"""
+    saved_count = 0
+    for idx, row in merged.iterrows():
+        db.add(farm_from_row(row))
+        saved_count += 1
+        # Commit in batches
+        if saved_count % batch_size == 0:
+            db.commit()
+    db.commit()
+    return saved_count
+
+
+def begin_farm_reload(db, log_path: Optional[str] = None) -> str:
+    """
+    Prepare a full reload of the farms table and return the table to load into.
+    Bulk loaders write to a fresh staging table of this job (concurrent
+    reloads each get their own) so the live table stays untouched until
+    finish_farm_reload swaps it in; the ORM loader falls back to clearing
+    the live table first.
+    """
+    if bulk_load.DEFAULT_LOADER == 'orm':
+        clear_farms(db, log_path)
+        return Farm.__tablename__
+    staging = bulk_load.job_table_name(bulk_load.STAGING_TABLE)
+    bulk_load.create_staging_table(db, staging=staging)
+    db.commit()
+    _append_log(log_path, f"Loading into staging table {staging}")
+    return staging
+
+
+def finish_farm_reload(db, table: str, log_path: Optional[str] = None, metrics: Optional[StageRecorder] = None) -> None:
+    """
+    Index the loaded staging table and atomically swap it in for farms,
+    recording the db_index and db_swap stages on metrics, when given
+    """
+    if table == Farm.__tablename__:
+        farm_cache.invalidate_farm_caches()
+        return
+    metrics = metrics or StageRecorder()
+    start = time.perf_counter()
+    with metrics.stage('db_index') as stage:
+        stage.rows_out = n_indexes = bulk_load.build_staging_indexes(db, staging=table)
+        db.commit()
+    _append_log(log_path, f"Built {n_indexes} indexes on {table} in {time.perf_counter() - start:.2f}s")
+    with metrics.stage('db_swap'):
+        bulk_load.swap_staging_table(db, staging=table)
+    _append_log(log_path, f"Swapped {table} in as {Farm.__tablename__}")
+    farm_cache.invalidate_farm_caches()
+
+
+def drop_job_tables(db, tables: List[Optional[str]], log_path: Optional[str] = None) -> None:
+    """
+    Drop the work tables (staging, upload ids) of a failed job, which are
+    per job and would otherwise be left behind. The live farms table and
+    None entries are skipped; failures are logged, not raised.
+    """
+    for table in tables:
+        if table in (None, Farm.__tablename__):
             continue
-        props = row.to_dict()
-        for k in ['Lang1','Long1','Lang2','Long2','Lang3','Long3','Lang4','Long4']:
-            props.pop(k, None)
-        props['geometry'] = poly
-        features.append(props)
+        try:
+            bulk_load.drop_job_table(db, table)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            _append_log(log_path, f"Could not drop {table}: {e}")
+
+
+def store_farms(db, merged: pd.DataFrame, log_path: Optional[str] = None, method: Optional[str] = None, table: str = 'farms') -> int:
+    """
+    Write merged rows to table with the configured loader
+    (bulk_load.DEFAULT_LOADER) and log the throughput.
+    """
+    method = method or bulk_load.DEFAULT_LOADER
+    start = time.perf_counter()
+    if method == 'orm':
+        count = save_farms(db, merged)
+    else:
+        count, method = bulk_load.load_farms(db, merged, method, table)
+    elapsed = time.perf_counter() - start
+    _append_log(log_path, f"Loaded {count} farms via {method} in {elapsed:.2f}s "
+                          f"({bulk_load.rows_per_second(count, elapsed):.0f} rows/sec)")
+    return count
+
+
+def _check_ingest_mode(mode: str, missing: str) -> None:
+    if mode not in ('replace', 'incremental'):
+        raise ValueError(f"Unknown ingest mode: {mode}")
+    if missing not in ('delete', 'archive'):
+        raise ValueError(f"Unknown handling for missing farms: {missing}")
+
+
+def upsert_farms(db, merged: pd.DataFrame, log_path: Optional[str] = None) -> dict:
+    """Incrementally apply merged rows to farms; returns inserted/updated/unchanged counts"""
+    start = time.perf_counter()
+    method = 'insert' if bulk_load.DEFAULT_LOADER == 'orm' else bulk_load.DEFAULT_LOADER
+    counts = bulk_load.upsert_farms(db, merged, method)
+    elapsed = time.perf_counter() - start
+    _append_log(log_path, f"Upserted {len(merged)} farms in {elapsed:.2f}s "
+                          f"({bulk_load.rows_per_second(len(merged), elapsed):.0f} rows/sec)")
+    return counts
 
-    gdf = gpd.GeoDataFrame(features, geometry='geometry', crs='EPSG:4326')
+
+def finish_incremental(db, upload_ids, counts: dict, missing: str = 'delete', log_path: Optional[str] = None,
+                       keep_table: str = bulk_load.KEEP_IDS_TABLE) -> dict:
+    """
+    Remove (or archive) farms absent from the upload, commit and log the
+    counts. upload_ids None means keep_table already holds the upload's ids.
+    """
+    method = 'insert' if bulk_load.DEFAULT_LOADER == 'orm' else bulk_load.DEFAULT_LOADER
+    keep_ids = None if upload_ids is None else (str(i) for i in upload_ids)
+    removed = bulk_load.remove_missing_farms(db, keep_ids, archive=(missing == 'archive'), method=method,
+                                             keep_table=keep_table)
+    db.commit()
+    farm_cache.invalidate_farm_caches()
+    counts = {
+        'inserted': counts.get('inserted', 0),
+        'updated': counts.get('updated', 0),
+        'unchanged': counts.get('unchanged', 0),
+        'archived' if missing == 'archive' else 'deleted': removed,
+    }
+    _append_log(log_path, "Incremental ingest: " + ", ".join(f"{k} {v}" for k, v in counts.items()))
+    return counts
+
+
+def read_farms_csv(csv_path: str) -> pd.DataFrame:
+    """Read a farm CSV with columns mapped to REQUIRED_COLUMNS and farm_id deduplicated"""
+    df = pd.read_csv(csv_path)
+    df = prepare_columns(df, resolve_columns(df.columns))
+    return dedupe_farms(df)
+
+
+def load_farm_polygons(csv_path: str) -> Tuple[gpd.GeoDataFrame, int]:
+    """Read a farm CSV into a GeoDataFrame of polygons; returns (GeoDataFrame, rejected rows)"""
+    return frame_to_geodataframe(read_farms_csv(csv_path))
+
+
+def csv_to_geojson(csv_path: str, geojson_path: str, log_path: Optional[str] = None) -> Tuple[int, int]:
+    """Write the farm polygons of a CSV to a GeoJSON file (used by scripts/process_local_csv.py)"""
+    gdf, rejected = load_farm_polygons(csv_path)
     gdf.to_file(geojson_path, driver='GeoJSON')
     if log_path:
         with open(log_path, 'w') as f:
             f.write(f"Rejected rows: {rejected}\n")
-    return len(features), rejected
+    return len(gdf), rejected
@@ -0,0 +1,162 @@
+"""
+Per-stage timing and throughput metrics for ingest jobs.
+Each stage records start/end time, rows in/out, rows/sec and the peak
+resident memory seen while it ran.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, from /proc where available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _max_rss_bytes() -> Optional[int]:
+    """Process high-water mark of the RSS, None where getrusage is missing"""
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _PeakRssSampler:
+    """Background thread tracking the highest RSS until stopped"""
+
+    def __init__(self):
+        self.peak = current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = None
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            rss = current_rss_bytes()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+    def stop(self) -> Optional[int]:
+        if self._thread is None:
+            # No /proc: fall back to the process high-water mark
+            return _max_rss_bytes()
+        self._stop.set()
+        self._thread.join()
+        rss = current_rss_bytes()
+        return max(self.peak, rss or 0)
+
+
+class StageMetric:
+    """Metrics of one stage; set rows_out (and rows_in if unknown up front) while it runs"""
+
+    def __init__(self, name: str, rows_in: Optional[int] = None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.started_at = None
+        self.finished_at = None
+        self.seconds = 0.0
+        self.peak_rss_bytes = None
+
+    def merge(self, other: 'StageMetric') -> None:
+        """Fold a later run of the same stage (e.g. the next chunk) into this one"""
+        self.rows_in = _add(self.rows_in, other.rows_in)
+        self.rows_out = _add(self.rows_out, other.rows_out)
+        self.finished_at = other.finished_at
+        self.seconds += other.seconds
+        self.peak_rss_bytes = max(self.peak_rss_bytes or 0, other.peak_rss_bytes or 0)
+
+    @property
+    def rows_per_sec(self) -> Optional[float]:
+        rows = self.rows_in if self.rows_in is not None else self.rows_out
+        if rows is None:
+            return None
+        return rows / self.seconds if self.seconds > 0 else float(rows)
+
+    def to_dict(self) -> dict:
+        return {
+            'stage': self.name,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'seconds': round(self.seconds, 4),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_per_sec': round(self.rows_per_sec, 1) if self.rows_per_sec is not None else None,
+            'peak_rss_mb': round(self.peak_rss_bytes / (1024 * 1024), 1) if self.peak_rss_bytes else None,
+        }
+
+
+def _add(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a + b
+
+
+class StageRecorder:
+    """
+    Records StageMetrics for one job. Stages with the same name (one per
+    chunk in streaming mode) are aggregated. Finished stages are appended
+    as JSON lines to log_path, if set, for trend analysis.
+    """
+
+    def __init__(self, job_id: Optional[str] = None, log_path: Optional[str] = None):
+        self.job_id = job_id
+        self.log_path = log_path
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None):
+        metric = StageMetric(name, rows_in)
+        metric.started_at = datetime.utcnow()
+        sampler = _PeakRssSampler()
+        start = time.perf_counter()
+        try:
+            yield metric
+        finally:
+            metric.seconds = time.perf_counter() - start
+            metric.finished_at = datetime.utcnow()
+            metric.peak_rss_bytes = sampler.stop()
+            self._record(metric)
+
+    def _record(self, metric: StageMetric) -> None:
+        with self._lock:
+            if metric.name in self._stages:
+                self._stages[metric.name].merge(metric)
+            else:
+                self._stages[metric.name] = metric
+        if self.log_path:
+            entry = {'job_id': self.job_id, **metric.to_dict()}
+            try:
+                with open(self.log_path, 'a') as f:
+                    f.write(json.dumps(entry) + '\n')
+            except OSError as e:
+                logger.warning(f"Could not write stage metrics to {self.log_path}: {e}")
+
+    def as_list(self) -> List[dict]:
+        with self._lock:
+            return [metric.to_dict() for metric in self._stages.values()]
@@ -0,0 +1,98 @@
+"""
+Persistent cache of Earth Engine NDVI results.
+Entries are keyed by a canonical hash of the farm polygon plus the date
+window the NDVI was computed over, so a re-upload of unchanged plots on
+the same day skips Earth Engine. Farms without NDVI in the window
+(cloudy) are cached too, with NULL NDVI, so they are not re-requested
+either. Entries older than NDVI_CACHE_TTL_HOURS are evicted.
+"""
+import hashlib
+import os
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import shapely
+from sqlalchemy import text
+
+NDVI_CACHE_TTL_HOURS = float(os.getenv("NDVI_CACHE_TTL_HOURS", "24"))
+# Must match the days_window ndvi_extraction.py computes NDVI over
+NDVI_DAYS_WINDOW = 15
+# Coordinates are snapped to this grid (degrees, ~1 cm) before hashing so
+# float noise from CSV round-trips does not change the key
+HASH_GRID_SIZE = 1e-7
+
+NDVI_COLUMNS = ['recent_date', 'recent_ndvi', 'prev_date', 'prev_ndvi', 'delta']
+
+
+def geometry_hashes(geometries) -> np.ndarray:
+    """
+    SHA-1 of each polygon's canonical form: snapped to HASH_GRID_SIZE and
+    normalized (ring start and orientation), so the same plot hashes the
+    same whichever corner the CSV lists first.
+    """
+    geoms = shapely.normalize(shapely.set_precision(np.asarray(geometries, dtype=object), HASH_GRID_SIZE))
+    return np.array([hashlib.sha1(wkb).hexdigest() for wkb in shapely.to_wkb(geoms)], dtype=object)
+
+
+def cache_window(days_window: int = NDVI_DAYS_WINDOW, today: Optional[date] = None) -> Tuple[date, date]:
+    """(start, end) dates of the previous + recent NDVI windows ending today (UTC)"""
+    end = today or datetime.utcnow().date()
+    return end - timedelta(days=2 * days_window), end
+
+
+def evict_expired(db, ttl_hours: float = NDVI_CACHE_TTL_HOURS) -> int:
+    """Delete entries older than ttl_hours; returns the number removed. Does not commit."""
+    cutoff = datetime.utcnow() - timedelta(hours=ttl_hours)
+    result = db.execute(text("DELETE FROM ndvi_cache WHERE cached_at < :cutoff"), {'cutoff': cutoff})
+    return result.rowcount
+
+
+def lookup(db, hashes: Iterable[str], window: Tuple[date, date]) -> pd.DataFrame:
+    """Cached NDVI for the given geometry hashes and window, indexed by geometry_hash"""
+    rows = db.execute(
+        text(
+            "SELECT geometry_hash, recent_date, recent_ndvi, prev_date, prev_ndvi, delta "
+            "FROM ndvi_cache WHERE geometry_hash = ANY(:hashes) "
+            "AND window_start = :start AND window_end = :end"
+        ),
+        {'hashes': list(hashes), 'start': window[0], 'end': window[1]},
+    ).fetchall()
+    return pd.DataFrame(rows, columns=['geometry_hash'] + NDVI_COLUMNS).set_index('geometry_hash')
+
+
+def store(db, results: pd.DataFrame, window: Tuple[date, date]) -> int:
+    """
+    Upsert NDVI results (NDVI_COLUMNS plus geometry_hash) for window;
+    rows with null NDVI are stored as negative entries. Returns the number
+    of entries written. Does not commit.
+    """
+    results = results.dropna(subset=['geometry_hash']).drop_duplicates('geometry_hash')
+    if results.empty:
+        return 0
+    now = datetime.utcnow()
+    params = [
+        {
+            'geometry_hash': row['geometry_hash'],
+            'start': window[0],
+            'end': window[1],
+            **{col: (None if pd.isna(row[col]) else row[col]) for col in NDVI_COLUMNS},
+            'cached_at': now,
+        }
+        for row in results[['geometry_hash'] + NDVI_COLUMNS].to_dict('records')
+    ]
+    db.execute(
+        text(
+            "INSERT INTO ndvi_cache (geometry_hash, window_start, window_end, recent_date, recent_ndvi, "
+            "prev_date, prev_ndvi, delta, cached_at) "
+            "VALUES (:geometry_hash, :start, :end, :recent_date, :recent_ndvi, :prev_date, :prev_ndvi, "
+            ":delta, :cached_at) "
+            "ON CONFLICT (geometry_hash, window_start, window_end) DO UPDATE SET "
+            "recent_date = EXCLUDED.recent_date, recent_ndvi = EXCLUDED.recent_ndvi, "
+            "prev_date = EXCLUDED.prev_date, prev_ndvi = EXCLUDED.prev_ndvi, "
+            "delta = EXCLUDED.delta, cached_at = EXCLUDED.cached_at"
+        ),
+        params,
+    )
+    return len(params)
@@ -0,0 +1,177 @@
+"""
+Buffered result writing and checkpointing for NDVI extraction.
+A single ResultWriter thread drains a queue of results and writes them in
+batches; each flushed batch is also appended to a Checkpoint manifest so
+a restarted job can skip the farms already done.
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List, Optional, Set, Tuple
+
+import pandas as pd
+import shapely
+
+OUTPUT_COLUMNS = ['farm_id', 'recent_date', 'recent_ndvi', 'prev_date', 'prev_ndvi', 'delta']
+
+WRITER_BATCH_ROWS = int(os.getenv("NDVI_WRITER_BATCH_ROWS", "500"))
+WRITER_FLUSH_SECONDS = 2.0
+
+_STOP = object()
+
+
+def source_fingerprint(df: pd.DataFrame, window_key: str = '') -> str:
+    """
+    SHA-1 over the farm_ids and geometries (polygons or corner columns) of
+    df plus window_key (e.g. the extraction date), identifying one
+    extraction run's input
+    """
+    if 'geometry' in df.columns:
+        shapes = pd.Series(shapely.to_wkb(df['geometry'].to_numpy(dtype=object), hex=True), index=df.index)
+    else:
+        corners = [c for c in df.columns if c.startswith(('Lang', 'Long'))]
+        shapes = df[sorted(corners)].astype(str).agg(','.join, axis=1)
+    digest = hashlib.sha1(window_key.encode())
+    digest.update(pd.util.hash_pandas_object(
+        pd.DataFrame({'farm_id': df['farm_id'].astype(str), 'shape': shapes.astype(str)}), index=False
+    ).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def manifest_path(path: str, fingerprint: str) -> str:
+    """
+    The manifest of one extraction source next to path, e.g.
+    data/ndvi_checkpoint.jsonl -> data/ndvi_checkpoint_<fingerprint>.jsonl,
+    so concurrent jobs over different farms never share a file
+    """
+    stem, ext = os.path.splitext(path)
+    return f"{stem}_{fingerprint[:16]}{ext}"
+
+
+class Checkpoint:
+    """
+    JSON-lines manifest: a header line with the source fingerprint, then
+    one line per flushed batch with its result rows and the ids of farms
+    finished without NDVI. A manifest for a different fingerprint is reset.
+    """
+
+    def __init__(self, path: str, fingerprint: str):
+        self.path = path
+        self.fingerprint = fingerprint
+
+    def load(self) -> Tuple[List[dict], Set[str]]:
+        """Return (result rows, ids of every finished farm) and open the manifest for appending"""
+        rows, done = [], set()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                lines = f.read().splitlines()
+            header = json.loads(lines[0]) if lines else {}
+            if header.get('fingerprint') == self.fingerprint:
+                for line in lines[1:]:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn last line from a crash mid-write
+                    rows.extend(entry['rows'])
+                    done.update(entry['empty'])
+                done.update(str(row['farm_id']) for row in rows)
+                return rows, done
+        with open(self.path, 'w') as f:
+            f.write(json.dumps({'fingerprint': self.fingerprint, 'created_at': datetime.utcnow().isoformat()}) + '\n')
+        return rows, done
+
+    def append(self, rows: List[dict], empty: List[str]) -> None:
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'rows': rows, 'empty': empty}, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def remove(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ResultWriter:
+    """
+    Single writer thread. Extraction threads call add() / add_empty(); rows
+    are written to output (a list of row dicts or a CSV path) in batches of
+    batch_rows or every flush_seconds, passed to on_flush(rows, empty ids)
+    if given, then recorded in the checkpoint. The first failed write is
+    passed to on_error (e.g. to cancel the extraction) and re-raised by
+    close(); later batches are dropped.
+    """
+
+    def __init__(self, output, checkpoint: Optional[Checkpoint] = None,
+                 batch_rows: int = WRITER_BATCH_ROWS, flush_seconds: float = WRITER_FLUSH_SECONDS,
+                 on_flush: Optional[Callable[[List[dict], List[str]], None]] = None,
+                 on_error: Optional[Callable[[BaseException], None]] = None):
+        self.output = output
+        self.checkpoint = checkpoint
+        self.on_flush = on_flush
+        self.on_error = on_error
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_seconds
+        self.count = 0
+        self.error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, farm_id, res: dict) -> None:
+        """Queue one NDVI result (recent/prev date and value); delta is computed here"""
+        row = {'farm_id': farm_id, **res, 'delta': res['recent_ndvi'] - res['prev_ndvi']}
+        self._queue.put(('row', row))
+
+    def add_empty(self, farm_id) -> None:
+        """Mark a farm finished without NDVI (e.g. cloudy) so a resume skips it"""
+        self._queue.put(('empty', str(farm_id)))
+
+    def close(self) -> int:
+        """Flush, stop the thread and return the number of rows written; re-raises a write error"""
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.count
+
+    def _run(self) -> None:
+        rows, empty = [], []
+        deadline = time.monotonic() + self.flush_seconds
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._flush(rows, empty)
+                return
+            if item is not None:
+                kind, value = item
+                (rows if kind == 'row' else empty).append(value)
+            if len(rows) + len(empty) >= self.batch_rows or time.monotonic() >= deadline:
+                self._flush(rows, empty)
+                rows, empty = [], []
+                deadline = time.monotonic() + self.flush_seconds
+
+    def _flush(self, rows: List[dict], empty: List[str]) -> None:
+        if (not rows and not empty) or self.error is not None:
+            return
+        try:
+            if isinstance(self.output, list):
+                self.output.extend(rows)
+            elif rows:
+                pd.DataFrame(rows, columns=OUTPUT_COLUMNS).to_csv(self.output, mode='a', header=False, index=False)
+            if self.on_flush is not None:
+                self.on_flush(rows, empty)
+            if self.checkpoint is not None:
+                self.checkpoint.append(rows, empty)
+            self.count += len(rows)
+        except Exception as e:
+            # Keep draining so extraction threads never block; close() re-raises
+            self.error = e
+            if self.on_error is not None:
+                self.on_error(e)
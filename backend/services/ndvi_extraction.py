@@ -1,63 +1,91 @@
 # This file was moved from the project root to backend/services.
 import ee
+import functools
+import logging
 import pandas as pd
 import sys
 import os
+import threading
 import numpy as np
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import shapely
+try:
+    from services.ndvi_checkpoint import Checkpoint, ResultWriter, manifest_path, source_fingerprint
+    from services.ndvi_scheduler import AdaptiveScheduler, NDVI_MAX_ATTEMPTS, NDVI_MAX_WORKERS
+except ImportError:  # run as a script from services/
+    from ndvi_checkpoint import Checkpoint, ResultWriter, manifest_path, source_fingerprint
+    from ndvi_scheduler import AdaptiveScheduler, NDVI_MAX_ATTEMPTS, NDVI_MAX_WORKERS
 
-# Usage: python ndvi_extraction.py input_csv output_csv
-if len(sys.argv) != 3:
-    print("Usage: python ndvi_extraction.py input_csv output_csv")
-    sys.exit(1)
+logger = logging.getLogger(__name__)
 
-input_csv = sys.argv[1]
-output_csv = sys.argv[2]
+# Usage: python ndvi_extraction.py input_csv output_csv [batch_size]
+# or in-process: extract_ndvi(farms) -> DataFrame
 
-# Initialize Earth Engine
-project_id = os.environ.get("EE_PROJECT_ID")
-if not project_id:
-    print(f"ERROR: EE_PROJECT_ID environment variable is not set", file=sys.stderr)
-    print(f"Please set the EE_PROJECT_ID environment variable to your Earth Engine project ID", file=sys.stderr)
-    sys.exit(1)
+# Farms sent to Earth Engine per reduceRegions call; 1 uses the per-farm path
+DEFAULT_BATCH_SIZE = int(os.environ.get("NDVI_BATCH_SIZE", "200"))
+# Grid cell (degrees) used to cluster neighbouring farms; farms in one cell
+# share a composite. 0.5 deg is well inside a 110 km Sentinel-2 tile.
+CLUSTER_CELL_DEGREES = float(os.environ.get("NDVI_CLUSTER_DEGREES", "0.5"))
 
-print(f"Initializing Earth Engine with project: {project_id}")
+OUTPUT_COLUMNS = "farm_id,recent_date,recent_ndvi,prev_date,prev_ndvi,delta"
 
-# Try service account authentication first (for production/Render)
-service_account_key = os.environ.get("EE_SERVICE_ACCOUNT_KEY")
-service_account_email = os.environ.get("EE_SERVICE_ACCOUNT")
+# Earth Engine is initialized once per process and shared by every job
+_ee_lock = threading.Lock()
+_ee_initialized = False
 
-try:
-    if service_account_key and service_account_email:
-        # Service account authentication (production)
-        print(f"Authenticating with service account: {service_account_email}")
-        import json
-        import tempfile
-        
-        # Write the service account key to a temporary file
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-            f.write(service_account_key)
-            key_file = f.name
-        
-        try:
-            credentials = ee.ServiceAccountCredentials(service_account_email, key_file)
-            ee.Initialize(credentials, project=project_id)
-            print(f"Earth Engine initialized successfully with service account")
-        finally:
-            # Clean up the temporary key file
-            if os.path.exists(key_file):
-                os.remove(key_file)
-    else:
-        # Default authentication (local development)
-        print("Using default Earth Engine authentication")
-        ee.Initialize(project=project_id)
-        print(f"Earth Engine initialized successfully")
-except Exception as e:
-    print(f"ERROR: Earth Engine initialization failed: {e}", file=sys.stderr)
-    if not service_account_key or not service_account_email:
-        print(f"HINT: For production deployment, set EE_SERVICE_ACCOUNT and EE_SERVICE_ACCOUNT_KEY environment variables", file=sys.stderr)
-        print(f"For local development, run 'earthengine authenticate' first", file=sys.stderr)
-    sys.exit(1)
+
+def initialize_earth_engine():
+    """Authenticate and initialize Earth Engine; raises RuntimeError on failure"""
+    project_id = os.environ.get("EE_PROJECT_ID")
+    if not project_id:
+        print(f"ERROR: EE_PROJECT_ID environment variable is not set", file=sys.stderr)
+        print(f"Please set the EE_PROJECT_ID environment variable to your Earth Engine project ID", file=sys.stderr)
+        raise RuntimeError("EE_PROJECT_ID environment variable is not set")
+
+    print(f"Initializing Earth Engine with project: {project_id}")
+
+    # Try service account authentication first (for production/Render)
+    service_account_key = os.environ.get("EE_SERVICE_ACCOUNT_KEY")
+    service_account_email = os.environ.get("EE_SERVICE_ACCOUNT")
+
+    try:
+        if service_account_key and service_account_email:
+            # Service account authentication (production)
+            print(f"Authenticating with service account: {service_account_email}")
+            import json
+            import tempfile
+
+            # Write the service account key to a temporary file
+            with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
+                f.write(service_account_key)
+                key_file = f.name
+
+            try:
+                credentials = ee.ServiceAccountCredentials(service_account_email, key_file)
+                ee.Initialize(credentials, project=project_id)
+                print(f"Earth Engine initialized successfully with service account")
+            finally:
+                # Clean up the temporary key file
+                if os.path.exists(key_file):
+                    os.remove(key_file)
+        else:
+            # Default authentication (local development)
+            print("Using default Earth Engine authentication")
+            ee.Initialize(project=project_id)
+            print(f"Earth Engine initialized successfully")
+    except Exception as e:
+        print(f"ERROR: Earth Engine initialization failed: {e}", file=sys.stderr)
+        if not service_account_key or not service_account_email:
+            print(f"HINT: For production deployment, set EE_SERVICE_ACCOUNT and EE_SERVICE_ACCOUNT_KEY environment variables", file=sys.stderr)
+            print(f"For local development, run 'earthengine authenticate' first", file=sys.stderr)
+        raise RuntimeError(f"Earth Engine initialization failed: {e}")
+
+def ensure_initialized():
+    """Initialize Earth Engine on first use; later calls reuse the session"""
+    global _ee_initialized
+    with _ee_lock:
+        if not _ee_initialized:
+            initialize_earth_engine()
+            _ee_initialized = True
 
 def mask_s2_clouds(image):
     scl = image.select('SCL')
@@ -65,6 +93,9 @@ def mask_s2_clouds(image):
     return image.updateMask(mask)
 
 def row_to_geometry(row):
+    polygon = row.get('geometry')
+    if polygon is not None and not pd.isna(polygon):
+        return ee.Geometry.Polygon([[list(c) for c in polygon.exterior.coords]])
     pts = []
     for i in (1, 2, 3, 4):
         lat = row.get(f'Lang{i}')
@@ -82,67 +113,283 @@ def add_ndvi(img):
     ndvi = img.normalizedDifference(['B8', 'B4']).rename('NDVI')
     return img.addBands(ndvi)
 
-def get_recent_and_previous_ndvi(geometry, days_window=15):
+def date_windows(days_window=15):
+    """Return (prev_start, recent_start, now) ISO strings for the two NDVI windows"""
     import datetime
     now = datetime.datetime.now(datetime.UTC)
     recent_start = now - datetime.timedelta(days=days_window)
     prev_start = now - datetime.timedelta(days=2 * days_window)
-    s2 = (ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED")
-          .filterBounds(geometry)
-          .filterDate(prev_start.isoformat(), now.isoformat())
-          .map(mask_s2_clouds)
-          .map(add_ndvi))
-    recent_img = s2.filterDate(recent_start.isoformat(), now.isoformat()).median()
-    prev_img   = s2.filterDate(prev_start.isoformat(), recent_start.isoformat()).median()
-    recent_mean = recent_img.select('NDVI').reduceRegion(
+    return prev_start.isoformat(), recent_start.isoformat(), now.isoformat()
+
+def masked_ndvi_collection(region, start, end):
+    """Cloud-masked Sentinel-2 collection with an NDVI band over region"""
+    return (ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED")
+            .filterBounds(region)
+            .filterDate(start, end)
+            .map(mask_s2_clouds)
+            .map(add_ndvi))
+
+def latest_date(collection):
+    """Server-side 'YYYY-MM-dd' of the newest image in collection, or null if it is empty"""
+    return ee.Algorithms.If(
+        collection.size().gt(0),
+        ee.Date(collection.aggregate_max('system:time_start')).format('YYYY-MM-dd'),
+        None
+    )
+
+def get_recent_and_previous_ndvi(geometry, days_window=15):
+    """
+    Mean NDVI of geometry over the recent and previous windows, fetched in
+    one getInfo. Dates are the newest acquisition in each window's
+    collection (a median composite has no system:time_start of its own).
+    """
+    prev_start, recent_start, now = date_windows(days_window)
+    s2 = masked_ndvi_collection(geometry, prev_start, now)
+    recent = s2.filterDate(recent_start, now)
+    prev = s2.filterDate(prev_start, recent_start)
+    recent_mean = recent.median().select('NDVI').reduceRegion(
         reducer=ee.Reducer.mean(),
         geometry=geometry,
         scale=10,
         bestEffort=True
     ).get('NDVI')
-    prev_mean = prev_img.select('NDVI').reduceRegion(
+    prev_mean = prev.median().select('NDVI').reduceRegion(
         reducer=ee.Reducer.mean(),
         geometry=geometry,
         scale=10,
         bestEffort=True
     ).get('NDVI')
-    def get_date(image):
-        try:
-            return ee.Date(image.get('system:time_start')).format('YYYY-MM-dd').getInfo()
-        except:
-            return None
-    return {
-        "recent_date": get_date(recent_img),
-        "recent_ndvi": recent_mean.getInfo() if recent_mean else None,
-        "prev_date": get_date(prev_img),
-        "prev_ndvi": prev_mean.getInfo() if prev_mean else None
-    }
-
-def process_chunk(chunk, thread_id, output_csv):
-    local_count = 0
-    for _, row in chunk.iterrows():
-        farm_id = row.get("farm_id")
-        geom = row_to_geometry(row)
-        if geom is None:
-            print(f"[Thread {thread_id}] ⚠ Invalid geometry for farm {farm_id}")
-            continue
-        try:
-            res = get_recent_and_previous_ndvi(geom)
-        except Exception as e:
-            print(f"[Thread {thread_id}] ❌ Error for farm {farm_id}: {e}")
-            continue
-        if not res["recent_ndvi"] or not res["prev_ndvi"]:
-            print(f"[Thread {thread_id}] ⚠ No NDVI for {farm_id} (cloudy?)")
+    info = ee.Dictionary({
+        "recent_date": latest_date(recent),
+        "recent_ndvi": recent_mean,
+        "prev_date": latest_date(prev),
+        "prev_ndvi": prev_mean,
+    }).getInfo()
+    return {key: info.get(key) for key in ("recent_date", "recent_ndvi", "prev_date", "prev_ndvi")}
+
+def corner_arrays(df):
+    """
+    (lat, lon) float arrays with one column per corner; unparseable corners
+    are NaN. For frames of shapely polygons the bounding box corners are used.
+    """
+    if 'geometry' in df.columns:
+        bounds = shapely.bounds(np.asarray(df['geometry'], dtype=object))
+        return bounds[:, [1, 3]], bounds[:, [0, 2]]
+    lat = np.column_stack([pd.to_numeric(df[f'Lang{i}'], errors='coerce') for i in (1, 2, 3, 4)])
+    lon = np.column_stack([pd.to_numeric(df[f'Long{i}'], errors='coerce') for i in (1, 2, 3, 4)])
+    return lat.astype(float), lon.astype(float)
+
+def assign_clusters(df, cell_degrees=CLUSTER_CELL_DEGREES):
+    """Grid-cell key of each farm's corner centroid, e.g. '56:160'; None without corners"""
+    lat, lon = corner_arrays(df)
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+    n = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        row = np.floor(np.where(valid, lat, 0).sum(axis=1) / n / cell_degrees)
+        col = np.floor(np.where(valid, lon, 0).sum(axis=1) / n / cell_degrees)
+    keys = [None if np.isnan(r) or np.isnan(c) else f"{int(r)}:{int(c)}" for r, c in zip(row, col)]
+    return pd.Series(keys, index=df.index, dtype=object)
+
+def cluster_region(df):
+    """ee.Geometry.Rectangle covering every corner of the farms in df"""
+    lat, lon = corner_arrays(df)
+    return ee.Geometry.Rectangle([float(np.nanmin(lon)), float(np.nanmin(lat)),
+                                  float(np.nanmax(lon)), float(np.nanmax(lat))])
+
+def build_composite(region, days_window=15):
+    """
+    Two-band (recent_ndvi, prev_ndvi) masked median composite over region,
+    plus the server-side latest acquisition date of each window. Built once
+    per cluster and reduced for every batch of its farms.
+    """
+    prev_start, recent_start, now = date_windows(days_window)
+    s2 = masked_ndvi_collection(region, prev_start, now)
+    recent = s2.filterDate(recent_start, now)
+    prev = s2.filterDate(prev_start, recent_start)
+    composite = (recent.median().select('NDVI').rename('recent_ndvi')
+                 .addBands(prev.median().select('NDVI').rename('prev_ndvi')))
+    return composite, latest_date(recent), latest_date(prev)
+
+def get_ndvi_batch(farms, days_window=15, composite=None):
+    """
+    NDVI for a batch of farms in one Earth Engine request.
+    farms is a list of (farm_id, ee.Geometry); composite is a
+    build_composite() result shared by the batch's cluster, or None to
+    build one over the batch. Every farm is reduced with reduceRegions.
+    Returns {farm_id: result dict}; the dates are the newest acquisition
+    in each window over the composite's area.
+    """
+    fc = ee.FeatureCollection([
+        ee.Feature(geom, {'farm_id': str(farm_id)}) for farm_id, geom in farms
+    ])
+    image, recent_date, prev_date = composite or build_composite(fc, days_window)
+    reduced = image.reduceRegions(
+        collection=fc,
+        reducer=ee.Reducer.mean(),
+        scale=10
+    )
+    info = ee.Dictionary({
+        'features': reduced.select(['farm_id', 'recent_ndvi', 'prev_ndvi'], None, False),
+        'recent_date': recent_date,
+        'prev_date': prev_date,
+    }).getInfo()
+    results = {}
+    for feature in info['features']['features']:
+        props = feature.get('properties', {})
+        results[props['farm_id']] = {
+            "recent_date": info.get('recent_date'),
+            "recent_ndvi": props.get('recent_ndvi'),
+            "prev_date": info.get('prev_date'),
+            "prev_ndvi": props.get('prev_ndvi'),
+        }
+    return results
+
+def build_tasks(df, batch_size=DEFAULT_BATCH_SIZE, log=None):
+    """
+    Split farms into extraction tasks of (farms, composite), farms being a
+    list of (farm_id, ee.Geometry). Batched tasks hold up to batch_size
+    farms of one spatial cluster and share its composite; with batch_size 1
+    every farm is its own task (composite None, per-farm path). Farms with
+    an invalid geometry are reported to log (default: logger.warning).
+    """
+    log = log or logger.warning
+    if batch_size > 1:
+        clusters = assign_clusters(df)
+        for _, row in df[clusters.isna()].iterrows():
+            log(f"⚠ Invalid geometry for farm {row.get('farm_id')}")
+        groups = df.groupby(clusters, sort=False)
+    else:
+        groups = [(None, df)]
+    tasks = []
+    for _, members in groups:
+        farms = []
+        for _, row in members.iterrows():
+            farm_id = row.get("farm_id")
+            geom = row_to_geometry(row)
+            if geom is None:
+                log(f"⚠ Invalid geometry for farm {farm_id}")
+                continue
+            farms.append((farm_id, geom))
+        if not farms:
             continue
-        delta = res["recent_ndvi"] - res["prev_ndvi"]
-        with open(output_csv, "a") as f:
-            f.write(f"{farm_id},{res['recent_date']},{res['recent_ndvi']},"
-                    f"{res['prev_date']},{res['prev_ndvi']},{delta}\n")
-        print(f"[Thread {thread_id}] Farm {farm_id} NDVI Change={delta:.3f}")
-        local_count += 1
-    return local_count
-
-def main():
+        if batch_size > 1:
+            composite = build_composite(cluster_region(members))
+            tasks.extend((farms[i:i + batch_size], composite) for i in range(0, len(farms), batch_size))
+        else:
+            tasks.extend(([farm], None) for farm in farms)
+    return tasks
+
+def fetch_task(task):
+    """Run one build_tasks task against Earth Engine; returns {farm_id: result dict}"""
+    farms, composite = task
+    if composite is None and len(farms) == 1:
+        farm_id, geom = farms[0]
+        return {str(farm_id): get_recent_and_previous_ndvi(geom)}
+    return get_ndvi_batch(farms, composite=composite)
+
+def run_extraction(df, output, batch_size=DEFAULT_BATCH_SIZE, max_workers=NDVI_MAX_WORKERS,
+                   max_attempts=NDVI_MAX_ATTEMPTS, checkpoint_path=None, on_flush=None,
+                   make_tasks=None, fetch=None, base_backoff=1.0, log=None):
+    """
+    Extract NDVI for every farm of df. Results go through a single
+    ResultWriter to output (a list of row dicts or a CSV path). Tasks go
+    through an AdaptiveScheduler: a shared queue, concurrency adapted to
+    latency and errors, retries with backoff on quota errors.
+
+    With checkpoint_path, finished farms are recorded in a manifest next
+    to it, keyed by the source fingerprint (manifest_path). A rerun over the same farms on the same day resumes from it, and the
+    manifest is removed once no farm was dropped. on_flush(rows, empty
+    ids) sees every written batch, including those restored from the
+    checkpoint. Returns the number of farms with NDVI.
+
+    make_tasks(df, batch_size) and fetch(task) default to build_tasks and
+    fetch_task (Earth Engine); other providers pass their own, with tasks
+    whose first item is the task's list of (farm_id, geometry).
+    base_backoff is the scheduler's first retry delay in seconds.
+    Progress, skipped and dropped farms and scheduler stats go to
+    log(message) (default: logger.info).
+    """
+    log = log or logger.info
+    if df.empty:
+        return 0
+    checkpoint = None
+    resumed = 0
+    if checkpoint_path:
+        fingerprint = source_fingerprint(df, date_windows()[2][:10])
+        checkpoint = Checkpoint(manifest_path(checkpoint_path, fingerprint), fingerprint)
+        rows, done = checkpoint.load()
+        if done:
+            log(f"Resuming from checkpoint: {len(done)} farms already done")
+            if isinstance(output, list):
+                output.extend(rows)
+            if on_flush is not None:
+                on_flush(rows, sorted(done - {str(row["farm_id"]) for row in rows}))
+            resumed = len(rows)
+            df = df[~df["farm_id"].astype(str).isin(done)]
+
+    tasks = (make_tasks or functools.partial(build_tasks, log=log))(df, batch_size)
+    log(f"Extracting {len(df)} farms in {len(tasks)} requests ({batch_size} farms per request)")
+    # A failed write (e.g. on_flush's database update) stops the extraction
+    writer = ResultWriter(output, checkpoint, on_flush=on_flush, on_error=lambda error: scheduler.cancel())
+
+    cloudy = []
+
+    def record(task, results):
+        for farm_id, _ in task[0]:
+            res = results.get(str(farm_id))
+            if not res or not res["recent_ndvi"] or not res["prev_ndvi"]:
+                cloudy.append(farm_id)
+                writer.add_empty(farm_id)
+                continue
+            writer.add(farm_id, res)
+
+    scheduler = AdaptiveScheduler(fetch or fetch_task, max_workers=max_workers, max_attempts=max_attempts,
+                                  base_backoff=base_backoff, on_result=record)
+    try:
+        _, dropped = scheduler.run(tasks)
+    finally:
+        count = writer.close()
+    if cloudy:
+        log(f"⚠ No NDVI for {len(cloudy)} farms (cloudy?)")
+    for task, error in dropped:
+        log(f"❌ Dropped {len(task[0])} farms after {max_attempts} attempts: {error}")
+    stats = scheduler.stats
+    log(f"Scheduler: {stats['requests']} requests, {stats['retries']} retries, "
+          f"{stats['quota_errors']} quota errors, peak concurrency {stats['peak_concurrency']}")
+    if checkpoint is not None and not dropped:
+        checkpoint.remove()
+    return resumed + count
+
+def extract_ndvi(farms, batch_size=DEFAULT_BATCH_SIZE, max_workers=NDVI_MAX_WORKERS, checkpoint_path=None,
+                 on_flush=None, log=None):
+    """
+    In-process extraction for a frame of farms: farm_id plus either the
+    Lang/Long corner columns or a 'geometry' column of shapely polygons.
+    Uses the process-wide Earth Engine session. Returns a DataFrame with
+    the OUTPUT_COLUMNS; farms without NDVI (cloudy, errors) are left out.
+    checkpoint_path makes an interrupted run resumable, and on_flush
+    receives results batch by batch as they arrive and log(message) the
+    progress reports (see run_extraction).
+    """
+    ensure_initialized()
+    rows = []
+    run_extraction(farms, rows, batch_size, max_workers, checkpoint_path=checkpoint_path, on_flush=on_flush,
+                   log=log)
+    return pd.DataFrame(rows, columns=OUTPUT_COLUMNS.split(","))
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) not in (2, 3):
+        print("Usage: python ndvi_extraction.py input_csv output_csv [batch_size]")
+        sys.exit(1)
+    input_csv, output_csv = argv[0], argv[1]
+    batch_size = int(argv[2]) if len(argv) == 3 else DEFAULT_BATCH_SIZE
+
+    try:
+        ensure_initialized()
+    except RuntimeError:
+        sys.exit(1)
+
     print(f"Reading input CSV: {input_csv}")
     try:
         df = pd.read_csv(input_csv)
@@ -150,24 +397,15 @@ def main():
     except Exception as e:
         print(f"ERROR: Failed to read CSV file: {e}", file=sys.stderr)
         sys.exit(1)
-    
+
     if not os.path.exists(output_csv):
         with open(output_csv, "w") as f:
-            f.write("farm_id,recent_date,recent_ndvi,prev_date,prev_ndvi,delta\n")
+            f.write(OUTPUT_COLUMNS + "\n")
         print(f"Created output CSV: {output_csv}")
-    num_threads = 10
-    chunks = np.array_split(df, num_threads)
     import time
     start = time.time()
-    results = []
-    with ThreadPoolExecutor(max_workers=num_threads) as executor:
-        futures = [
-            executor.submit(process_chunk, chunk, i + 1, output_csv)
-            for i, chunk in enumerate(chunks)
-        ]
-        for future in as_completed(futures):
-            results.append(future.result())
-    total = sum(results)
+    # Rerunning after a crash resumes from the checkpoint next to the output
+    total = run_extraction(df, output_csv, batch_size, checkpoint_path=f"{output_csv}.checkpoint", log=print)
     elapsed = (time.time() - start) / 60
     print(f"\n==============================")
     print(f"   Completed NDVI extraction")
@@ -0,0 +1,154 @@
+"""
+NDVI observation history.
+Each ingest records the Sentinel-2 acquisitions its NDVI came from (one
+row per farm and acquisition date) in ndvi_observations, so values are
+kept when the farms table is overwritten. The table is range-partitioned
+by year of acquisition, so per-farm and per-village range scans only read
+the seasons asked for. series() serves one farm's history, averaged into
+a bounded number of time buckets.
+"""
+import os
+from datetime import date
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+TABLE = 'ndvi_observations'
+# Points series() returns by default; longer histories are bucketed
+NDVI_SERIES_MAX_POINTS = int(os.getenv("NDVI_SERIES_MAX_POINTS", "120"))
+
+OBSERVATION_COLUMNS = ['farm_id', 'acquired_on', 'vill_cd', 'ndvi', 'cloud_free']
+
+# (date, NDVI, cloud-free fraction) columns of each acquisition in pipeline output
+ACQUISITIONS = [
+    ('recent_date', 'recent_ndvi', 'recent_cloud_free'),
+    ('prev_date', 'prev_ndvi', 'prev_cloud_free'),
+]
+
+
+def observations(merged: pd.DataFrame) -> pd.DataFrame:
+    """
+    Observation rows for merged pipeline output: farm_id, Vill_Cd and the
+    recent/prev NDVI columns, plus recent_cloud_free / prev_cloud_free if
+    the provider reports them. Acquisitions without a date or NDVI are
+    skipped and each (farm_id, acquired_on) appears once.
+    """
+    def numeric(column):
+        if column in merged.columns:
+            return pd.to_numeric(merged[column], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        return np.full(len(merged), np.nan)
+
+    parts = []
+    for date_column, ndvi_column, cloud_column in ACQUISITIONS:
+        if date_column not in merged.columns:
+            continue
+        acquired = pd.to_datetime(merged[date_column], errors='coerce', format='ISO8601')
+        parts.append(pd.DataFrame({
+            'farm_id': merged['farm_id'].astype(str).to_numpy(),
+            'acquired_on': acquired.dt.date.to_numpy(),
+            'vill_cd': numeric('Vill_Cd'),
+            'ndvi': numeric(ndvi_column),
+            'cloud_free': numeric(cloud_column),
+        }))
+    if not parts:
+        return pd.DataFrame(columns=OBSERVATION_COLUMNS)
+    obs = pd.concat(parts, ignore_index=True)
+    obs = obs[obs['acquired_on'].notna() & obs['ndvi'].notna()]
+    return obs.drop_duplicates(['farm_id', 'acquired_on'], keep='first').reset_index(drop=True)
+
+
+def partition_name(year: int) -> str:
+    return f"{TABLE}_{year}"
+
+
+def ensure_partitions(db, years: Iterable[int]) -> None:
+    """
+    Create the yearly partitions of ndvi_observations that do not exist
+    yet. Concurrent ingests creating the same partition would fail with
+    DuplicateTable despite IF NOT EXISTS, so creation is serialized with a
+    transaction-level advisory lock, taken only when a partition is
+    missing. Does not commit.
+    """
+    missing = db.execute(
+        text(f"SELECT y FROM unnest(CAST(:years AS integer[])) AS y "
+             f"WHERE to_regclass('{TABLE}_' || y) IS NULL ORDER BY y"),
+        {'years': sorted(set(years))},
+    ).scalars().all()
+    if not missing:
+        return
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {'name': TABLE})
+    for year in missing:
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(year)} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+        ))
+
+
+def store(db, obs: pd.DataFrame) -> int:
+    """
+    Upsert observation rows (observations() output) in one statement,
+    creating partitions as needed. A later value for the same farm and
+    date replaces the earlier one. Returns the number of rows written.
+    Does not commit.
+    """
+    if obs.empty:
+        return 0
+    ensure_partitions(db, {d.year for d in obs['acquired_on']})
+    values = obs[OBSERVATION_COLUMNS].astype(object)
+    params = {column: values[column].where(values[column].notnull(), None).tolist() for column in OBSERVATION_COLUMNS}
+    params['vill_cd'] = [None if v is None else int(v) for v in params['vill_cd']]
+    db.execute(
+        text(
+            f"INSERT INTO {TABLE} (farm_id, acquired_on, vill_cd, ndvi, cloud_free) "
+            "SELECT * FROM unnest(CAST(:farm_id AS varchar[]), CAST(:acquired_on AS date[]), "
+            "CAST(:vill_cd AS integer[]), CAST(:ndvi AS real[]), CAST(:cloud_free AS real[])) "
+            "ON CONFLICT (farm_id, acquired_on) DO UPDATE SET "
+            "vill_cd = EXCLUDED.vill_cd, ndvi = EXCLUDED.ndvi, "
+            f"cloud_free = COALESCE(EXCLUDED.cloud_free, {TABLE}.cloud_free)"
+        ),
+        params,
+    )
+    return len(obs)
+
+
+def series(db, farm_id: str, start: Optional[date] = None, end: Optional[date] = None,
+           max_points: int = NDVI_SERIES_MAX_POINTS) -> List[dict]:
+    """
+    NDVI history of one farm between start and end (inclusive, open if
+    None), oldest first. If more than max_points acquisitions fall in the
+    range they are averaged into max_points equal-width time buckets.
+    Each point has the date of its first acquisition, the mean NDVI and
+    cloud-free fraction, and how many acquisitions it covers.
+    """
+    filters = ["farm_id = :farm_id"]
+    params = {'farm_id': farm_id, 'max_points': max(1, max_points)}
+    if start:
+        filters.append("acquired_on >= :start")
+        params['start'] = start
+    if end:
+        filters.append("acquired_on <= :end")
+        params['end'] = end
+    rows = db.execute(
+        text(
+            f"WITH obs AS (SELECT acquired_on, ndvi, cloud_free FROM {TABLE} WHERE {' AND '.join(filters)}), "
+            "span AS (SELECT min(acquired_on) AS first_on, max(acquired_on) - min(acquired_on) + 1 AS days, "
+            "count(*) AS n FROM obs) "
+            "SELECT min(o.acquired_on), avg(o.ndvi), avg(o.cloud_free), count(*) "
+            "FROM obs o CROSS JOIN span s "
+            "GROUP BY CASE WHEN s.n <= :max_points THEN o.acquired_on - s.first_on "
+            "ELSE (o.acquired_on - s.first_on) * :max_points / s.days END "
+            "ORDER BY 1"
+        ),
+        params,
+    ).fetchall()
+    return [
+        {
+            'date': acquired_on.isoformat(),
+            'ndvi': None if ndvi is None else round(float(ndvi), 4),
+            'cloud_free': None if cloud_free is None else round(float(cloud_free), 3),
+            'observations': count,
+        }
+        for acquired_on, ndvi, cloud_free, count in rows
+    ]
@@ -0,0 +1,191 @@
+"""
+NDVI providers.
+The ingest pipeline gets NDVI from the provider named by NDVI_PROVIDER:
+
+    earthengine  Sentinel-2 through Earth Engine (ndvi_extraction); needs EE_PROJECT_ID
+    raster       local Sentinel-2 GeoTIFFs (ndvi_raster); needs rasterio
+    synthetic    deterministic fake NDVI with configurable per-farm latency
+                 and failure rate, for offline load tests of the pipeline
+
+A provider's extract(farms, checkpoint_path, on_flush) takes farm_id plus
+a 'geometry' column of shapely polygons and returns a frame of
+ndvi_extraction's output columns. More providers can be added with
+register_provider().
+"""
+import abc
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+import pandas as pd
+
+from services import ndvi_cache, ndvi_extraction, ndvi_raster
+from services.ndvi_checkpoint import OUTPUT_COLUMNS
+from services.ndvi_scheduler import NDVI_MAX_ATTEMPTS, NDVI_MAX_WORKERS
+
+NDVI_PROVIDER = os.getenv("NDVI_PROVIDER", "earthengine")
+
+# Synthetic provider: seconds per farm of each request, share of requests
+# failing, share of farms without NDVI (cloudy), and the seed of all three
+NDVI_SYNTHETIC_LATENCY = float(os.getenv("NDVI_SYNTHETIC_LATENCY", "0.001"))
+NDVI_SYNTHETIC_FAILURE_RATE = float(os.getenv("NDVI_SYNTHETIC_FAILURE_RATE", "0.0"))
+NDVI_SYNTHETIC_CLOUDY_RATE = float(os.getenv("NDVI_SYNTHETIC_CLOUDY_RATE", "0.0"))
+NDVI_SYNTHETIC_SEED = int(os.getenv("NDVI_SYNTHETIC_SEED", "0"))
+
+
+class NdviProvider(abc.ABC):
+    """Base class; subclasses set name and implement extract()"""
+    name = None
+    # Whether results may be stored in ndvi_cache and served to later uploads.
+    # Cache entries are keyed by polygon and date window only and hold no
+    # cloud-free fractions, so only providers whose NDVI is interchangeable
+    # with Earth Engine's may set this.
+    cacheable = True
+
+    def check(self) -> None:
+        """Raise RuntimeError if the provider is not configured to run"""
+
+    def describe(self) -> str:
+        return self.name
+
+    @abc.abstractmethod
+    def extract(self, farms: pd.DataFrame, checkpoint_path: Optional[str] = None,
+                on_flush: Optional[Callable] = None, log: Optional[Callable[[str], None]] = None) -> pd.DataFrame:
+        """
+        NDVI of farms (farm_id and geometry) as a frame of ndvi_extraction's
+        output columns; progress and warnings go to log(message)
+        """
+
+
+class EarthEngineProvider(NdviProvider):
+    name = 'earthengine'
+
+    def check(self) -> None:
+        if not os.environ.get("EE_PROJECT_ID"):
+            raise RuntimeError("EE_PROJECT_ID environment variable is not set")
+
+    def describe(self) -> str:
+        return f"Earth Engine (EE_PROJECT_ID: {os.environ.get('EE_PROJECT_ID')})"
+
+    def extract(self, farms, checkpoint_path=None, on_flush=None, log=None):
+        return ndvi_extraction.extract_ndvi(farms, checkpoint_path=checkpoint_path, on_flush=on_flush, log=log)
+
+
+class RasterProvider(NdviProvider):
+    name = 'raster'
+    # Scenes differ from Earth Engine's composites and results carry
+    # cloud-free fractions the cache cannot hold; local reads are cheap anyway
+    cacheable = False
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or ndvi_raster.NDVI_RASTER_DIR
+
+    def check(self) -> None:
+        try:
+            import rasterio  # noqa: F401
+        except ImportError:
+            raise RuntimeError("The raster NDVI provider requires rasterio (pip install rasterio)")
+        if not ndvi_raster.find_scenes(self.root):
+            raise RuntimeError(f"No Sentinel-2 scenes (B04/B08/SCL GeoTIFFs) found under {self.root}")
+
+    def describe(self) -> str:
+        return f"local rasters in {self.root}"
+
+    def extract(self, farms, checkpoint_path=None, on_flush=None, log=None):
+        return ndvi_raster.extract_ndvi(farms, checkpoint_path=checkpoint_path, on_flush=on_flush, root=self.root)
+
+
+class SyntheticProvider(NdviProvider):
+    """
+    Fake NDVI through the real extraction machinery (AdaptiveScheduler,
+    ResultWriter, checkpoint) without any network. Farms are sent in
+    requests of batch_size. Each request sleeps latency seconds per farm
+    and fails with probability failure_rate; retries start after
+    base_backoff seconds. Values, cloudy farms and
+    failures depend only on seed, farm_id and attempt, so runs are
+    reproducible whatever the thread timing.
+    """
+    name = 'synthetic'
+    cacheable = False
+
+    def __init__(self, latency: float = NDVI_SYNTHETIC_LATENCY, failure_rate: float = NDVI_SYNTHETIC_FAILURE_RATE,
+                 cloudy_rate: float = NDVI_SYNTHETIC_CLOUDY_RATE, seed: int = NDVI_SYNTHETIC_SEED,
+                 batch_size: int = ndvi_extraction.DEFAULT_BATCH_SIZE, max_workers: int = NDVI_MAX_WORKERS,
+                 max_attempts: int = NDVI_MAX_ATTEMPTS, base_backoff: float = 1.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.cloudy_rate = cloudy_rate
+        self.seed = seed
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.requests = 0
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def describe(self) -> str:
+        return (f"synthetic provider ({self.latency * 1000:g} ms/farm, "
+                f"{self.failure_rate:.0%} failures, seed {self.seed})")
+
+    def _uniform(self, *key) -> float:
+        """Deterministic value in [0, 1) for key"""
+        digest = hashlib.sha1(':'.join(map(str, (self.seed,) + key)).encode()).digest()
+        return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+    def result(self, farm_id) -> Optional[dict]:
+        """The fake NDVI of one farm, or None if it is 'cloudy'"""
+        if self._uniform(farm_id, 'cloudy') < self.cloudy_rate:
+            return None
+        today = datetime.utcnow().date()
+        return {
+            'recent_date': today.isoformat(),
+            'recent_ndvi': round(0.1 + 0.8 * self._uniform(farm_id, 'recent'), 4),
+            'prev_date': (today - timedelta(days=ndvi_cache.NDVI_DAYS_WINDOW)).isoformat(),
+            'prev_ndvi': round(0.1 + 0.8 * self._uniform(farm_id, 'prev'), 4),
+        }
+
+    def make_tasks(self, df: pd.DataFrame, batch_size: int) -> list:
+        farms = [(farm_id, None) for farm_id in df['farm_id']]
+        return [(farms[i:i + batch_size],) for i in range(0, len(farms), batch_size)]
+
+    def fetch(self, task) -> Dict[str, Optional[dict]]:
+        farms = task[0]
+        key = str(farms[0][0])
+        with self._lock:
+            self.requests += 1
+            attempt = self._attempts[key] = self._attempts.get(key, 0) + 1
+        time.sleep(self.latency * len(farms))
+        if self._uniform(key, attempt, 'fail') < self.failure_rate:
+            raise RuntimeError(f"Synthetic NDVI request failed (attempt {attempt})")
+        return {str(farm_id): self.result(farm_id) for farm_id, _ in farms}
+
+    def extract(self, farms, checkpoint_path=None, on_flush=None, log=None):
+        rows = []
+        ndvi_extraction.run_extraction(farms, rows, self.batch_size, self.max_workers, self.max_attempts,
+                                       checkpoint_path=checkpoint_path, on_flush=on_flush,
+                                       make_tasks=self.make_tasks, fetch=self.fetch, base_backoff=self.base_backoff,
+                                       log=log)
+        return pd.DataFrame(rows, columns=OUTPUT_COLUMNS)
+
+
+PROVIDERS: Dict[str, Callable[[], NdviProvider]] = {
+    EarthEngineProvider.name: EarthEngineProvider,
+    RasterProvider.name: RasterProvider,
+    SyntheticProvider.name: SyntheticProvider,
+}
+
+
+def register_provider(name: str, factory: Callable[[], NdviProvider]) -> None:
+    PROVIDERS[name] = factory
+
+
+def get_provider(name: Optional[str] = None) -> NdviProvider:
+    """A new instance of the named provider (default NDVI_PROVIDER); ValueError if unknown"""
+    name = name or NDVI_PROVIDER
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown NDVI provider: {name} (available: {', '.join(sorted(PROVIDERS))})")
+    return PROVIDERS[name]()
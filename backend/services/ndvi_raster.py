@@ -0,0 +1,187 @@
+"""
+Local raster NDVI provider.
+Computes NDVI from Sentinel-2 L2A GeoTIFFs on disk instead of Earth
+Engine. For every acquisition, B4, B8 and SCL are read in windows around
+the farms (SCL resampled to the 10 m band grid), and pixels are masked
+with the same SCL classes as ndvi_extraction.mask_s2_clouds. All farms of
+a window are then reduced in one rasterize + bincount pass. Requires
+rasterio.
+
+Scenes are found under NDVI_RASTER_DIR as <YYYY-MM-DD>/<name>_B04.tif,
+with <name>_B08.tif and <name>_SCL.tif next to it. Inputs are expected on
+the harmonized scale (no BOA offset), as in COPERNICUS/S2_SR_HARMONIZED.
+"""
+import glob
+import os
+import warnings
+from datetime import date, datetime, timedelta
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+try:
+    from services.ndvi_checkpoint import OUTPUT_COLUMNS, ResultWriter
+except ImportError:  # imported from services/
+    from ndvi_checkpoint import OUTPUT_COLUMNS, ResultWriter
+
+NDVI_RASTER_DIR = os.getenv("NDVI_RASTER_DIR", os.path.join(os.path.dirname(__file__), '../../data/s2'))
+# Farms are grouped into blocks of this many pixels per side; one window is read per block
+RASTER_BLOCK_PIXELS = 2048
+# SCL classes kept by mask_s2_clouds: saturated/defective, vegetation, not vegetated, water
+CLEAR_SCL_CLASSES = (1, 4, 5, 6)
+# Must match the days_window ndvi_extraction.py computes NDVI over
+DAYS_WINDOW = 15
+
+CLOUD_FREE_COLUMNS = ['recent_cloud_free', 'prev_cloud_free']
+
+
+class Scene(NamedTuple):
+    acquired_on: date
+    b4: str
+    b8: str
+    scl: str
+
+
+def find_scenes(root: str = NDVI_RASTER_DIR) -> List[Scene]:
+    """Every complete B04/B08/SCL set under root, oldest first"""
+    scenes = []
+    for b4 in sorted(glob.glob(os.path.join(root, '*', '*_B04.tif'))):
+        prefix = b4[:-len('_B04.tif')]
+        b8, scl = f'{prefix}_B08.tif', f'{prefix}_SCL.tif'
+        try:
+            acquired_on = date.fromisoformat(os.path.basename(os.path.dirname(b4)))
+        except ValueError:
+            continue
+        if os.path.exists(b8) and os.path.exists(scl):
+            scenes.append(Scene(acquired_on, b4, b8, scl))
+    return sorted(scenes)
+
+
+def zonal_means(labels: np.ndarray, ndvi: np.ndarray, clear: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-zone statistics of one window. labels holds zone index + 1 for
+    each pixel (0 outside every zone). Returns (mean NDVI over clear
+    pixels, share of the zone's pixels that are clear) for zones 0..n-1,
+    NaN where a zone has no clear pixels / no pixels at all.
+    """
+    labels = labels.ravel()
+    clear = clear.ravel()
+    total = np.bincount(labels, minlength=n + 1)[1:n + 1]
+    counts = np.bincount(labels[clear], minlength=n + 1)[1:n + 1]
+    sums = np.bincount(labels[clear], weights=ndvi.ravel()[clear], minlength=n + 1)[1:n + 1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan)
+        cloud_free = np.where(total > 0, counts / total, np.nan)
+    return means, cloud_free
+
+
+def scene_stats(scene: Scene, polygons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (mean NDVI, cloud-free fraction) of each polygon (EPSG:4326) in one
+    scene, NaN for polygons outside it. Farms are grouped into
+    RASTER_BLOCK_PIXELS blocks and each block is read as one window.
+    """
+    import rasterio
+    from rasterio import features, windows
+    from rasterio.enums import Resampling
+
+    n = len(polygons)
+    means = np.full(n, np.nan)
+    cloud_free = np.full(n, np.nan)
+    with rasterio.open(scene.b4) as b4, rasterio.open(scene.b8) as b8, rasterio.open(scene.scl) as scl:
+        geoms = gpd.GeoSeries(polygons, crs='EPSG:4326').to_crs(b4.crs).to_numpy()
+        bounds = shapely.bounds(geoms)
+        inverse = ~b4.transform
+        cols = inverse.a * bounds[:, [0, 2]] + inverse.b * bounds[:, [3, 1]] + inverse.c
+        rows = inverse.d * bounds[:, [0, 2]] + inverse.e * bounds[:, [3, 1]] + inverse.f
+        with np.errstate(invalid='ignore'):
+            c0, c1 = np.floor(cols.min(axis=1)), np.ceil(cols.max(axis=1))
+            r0, r1 = np.floor(rows.min(axis=1)), np.ceil(rows.max(axis=1))
+            inside = (c1 > 0) & (r1 > 0) & (c0 < b4.width) & (r0 < b4.height)
+        if not inside.any():
+            return means, cloud_free
+        c0, c1 = np.clip(c0, 0, b4.width), np.clip(c1, 0, b4.width)
+        r0, r1 = np.clip(r0, 0, b4.height), np.clip(r1, 0, b4.height)
+        block = (np.nan_to_num(r0) // RASTER_BLOCK_PIXELS) * (b4.width // RASTER_BLOCK_PIXELS + 1) \
+            + np.nan_to_num(c0) // RASTER_BLOCK_PIXELS
+
+        for key in np.unique(block[inside]):
+            idx = np.flatnonzero(inside & (block == key))
+            window = windows.Window.from_slices((int(r0[idx].min()), int(r1[idx].max())),
+                                                (int(c0[idx].min()), int(c1[idx].max())))
+            red = b4.read(1, window=window).astype('float32')
+            nir = b8.read(1, window=window).astype('float32')
+            scl_window = windows.from_bounds(*windows.bounds(window, b4.transform), transform=scl.transform)
+            classes = scl.read(1, window=scl_window, out_shape=red.shape, resampling=Resampling.nearest,
+                               boundless=True, fill_value=0)
+            clear = np.isin(classes, CLEAR_SCL_CLASSES) & (red + nir > 0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                ndvi = (nir - red) / (nir + red)
+            labels = features.rasterize(
+                zip(geoms[idx], range(1, len(idx) + 1)), out_shape=red.shape,
+                transform=windows.transform(window, b4.transform), fill=0, dtype='int32'
+            )
+            means[idx], cloud_free[idx] = zonal_means(labels, ndvi, clear, len(idx))
+    return means, cloud_free
+
+
+def compute_ndvi(polygons: Sequence, scenes: List[Scene], today: Optional[date] = None,
+                 days_window: int = DAYS_WINDOW) -> pd.DataFrame:
+    """
+    Recent and previous NDVI of each polygon, windows as in ndvi_extraction
+    ([today - days_window, today] and the days_window before it). Each
+    scene is read once. Per window, NDVI is the median of the per-scene
+    farm means (like the median composite), the date is the newest scene
+    with clear pixels over the farm and the cloud-free fraction is the mean
+    over the window's scenes covering it.
+    """
+    polygons = np.asarray(polygons, dtype=object)
+    today = today or datetime.utcnow().date()
+    recent_start = today - timedelta(days=days_window)
+    prev_start = today - timedelta(days=2 * days_window)
+    result = pd.DataFrame(index=range(len(polygons)))
+    for prefix, start, end in (('recent', recent_start, today + timedelta(days=1)), ('prev', prev_start, recent_start)):
+        window_scenes = [scene for scene in scenes if start <= scene.acquired_on < end]
+        stats = [scene_stats(scene, polygons) for scene in window_scenes]
+        means = np.array([m for m, _ in stats]).reshape(len(stats), len(polygons))
+        fractions = np.array([f for _, f in stats]).reshape(len(stats), len(polygons))
+        has = ~np.isnan(means)
+        latest = len(stats) - 1 - np.argmax(has[::-1], axis=0)
+        dates = np.array([scene.acquired_on.isoformat() for scene in window_scenes] or [None], dtype=object)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # farms no scene covers
+            result[f'{prefix}_ndvi'] = np.nanmedian(means, axis=0) if len(stats) else np.nan
+            result[f'{prefix}_cloud_free'] = np.nanmean(fractions, axis=0) if len(stats) else np.nan
+        result[f'{prefix}_date'] = np.where(has.any(axis=0), dates[np.clip(latest, 0, len(dates) - 1)], None)
+    return result
+
+
+def extract_ndvi(farms: pd.DataFrame, checkpoint_path: Optional[str] = None, on_flush=None,
+                 root: Optional[str] = None, today: Optional[date] = None) -> pd.DataFrame:
+    """
+    NDVI for a frame of farms (farm_id and a 'geometry' column of shapely
+    polygons) from the scenes under root (default NDVI_RASTER_DIR), in the
+    same shape as ndvi_extraction.extract_ndvi plus the cloud-free
+    fractions. Results go through a ResultWriter, so on_flush receives
+    them in batches. checkpoint_path is accepted for the same signature
+    but not used: a local pass is cheap to redo.
+    """
+    root = root or NDVI_RASTER_DIR
+    scenes = find_scenes(root)
+    if not scenes:
+        raise RuntimeError(f"No Sentinel-2 scenes (B04/B08/SCL GeoTIFFs) found under {root}")
+    stats = compute_ndvi(farms['geometry'].to_numpy(dtype=object), scenes, today)
+    rows = []
+    writer = ResultWriter(rows, on_flush=on_flush)
+    try:
+        for farm_id, res in zip(farms['farm_id'], stats.to_dict('records')):
+            if pd.isna(res['recent_ndvi']) or pd.isna(res['prev_ndvi']):
+                writer.add_empty(farm_id)
+            else:
+                writer.add(farm_id, res)
+    finally:
+        writer.close()
+    return pd.DataFrame(rows, columns=OUTPUT_COLUMNS + CLOUD_FREE_COLUMNS)
@@ -0,0 +1,246 @@
+"""
+Adaptive-concurrency scheduler for NDVI extraction requests.
+Workers pull tasks from one shared queue, so a slow batch only holds up
+its own worker. The number of requests in flight follows AIMD: it grows
+by one while latency and error rate stay healthy, drops by one when
+latency degrades and halves on quota (HTTP 429) errors. Failed tasks are
+retried with exponential backoff and only dropped after max_attempts.
+"""
+import heapq
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+NDVI_MAX_WORKERS = int(os.getenv("NDVI_MAX_WORKERS", "16"))
+NDVI_MAX_ATTEMPTS = int(os.getenv("NDVI_MAX_ATTEMPTS", "4"))
+
+QUOTA_STATUS = 429
+# Earth Engine's wording of quota errors, for errors without an HTTP status
+QUOTA_MARKERS = ('quota', 'too many requests', 'too many concurrent', 'rate limit')
+
+
+def http_status(error: BaseException) -> Optional[int]:
+    """
+    HTTP status behind an error: its own (googleapiclient HttpError.resp,
+    requests' response) or that of the error it was raised from, as
+    ee.data translates HttpError into EEException inside its handler
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        for response in (getattr(error, 'resp', None), getattr(error, 'response', None)):
+            status = getattr(response, 'status', None) or getattr(response, 'status_code', None)
+            if isinstance(status, int):
+                return status
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def is_quota_error(error: BaseException) -> bool:
+    """True for Earth Engine quota / rate-limit errors, which need a longer backoff"""
+    status = http_status(error)
+    if status is not None:
+        return status == QUOTA_STATUS
+    message = str(error).lower()
+    return any(marker in message for marker in QUOTA_MARKERS)
+
+
+class AdaptiveScheduler:
+    """
+    Runs fetch(task) for every task on up to max_workers threads.
+
+    The concurrency limit starts at initial_workers and is re-evaluated every
+    `window` completed requests: it is raised by one if the error rate is
+    at most error_threshold and the median latency is within
+    latency_tolerance x the best median seen so far, and lowered by one
+    otherwise. A quota error halves it immediately, once per congestion
+    episode: errors from requests sent before the last decrease are not
+    counted again.
+
+    A failed task is retried after base_backoff * 2**(attempt-1) seconds
+    (x quota_backoff_factor for quota errors, capped at max_backoff, with
+    jitter) until it has been tried max_attempts times.
+    """
+
+    def __init__(self, fetch: Callable[[Any], Any], max_workers: int = NDVI_MAX_WORKERS,
+                 initial_workers: int = 4, min_workers: int = 1, max_attempts: int = NDVI_MAX_ATTEMPTS,
+                 base_backoff: float = 1.0, quota_backoff_factor: float = 4.0, max_backoff: float = 60.0,
+                 window: int = 10, error_threshold: float = 0.1, latency_tolerance: float = 2.0,
+                 on_result: Optional[Callable[[Any, Any], None]] = None, seed: Optional[int] = None):
+        self.fetch = fetch
+        self.max_workers = max(1, max_workers)
+        self.min_workers = max(1, min(min_workers, self.max_workers))
+        self.limit = max(self.min_workers, min(initial_workers, self.max_workers))
+        self.max_attempts = max(1, max_attempts)
+        self.base_backoff = base_backoff
+        self.quota_backoff_factor = quota_backoff_factor
+        self.max_backoff = max_backoff
+        self.window = window
+        self.error_threshold = error_threshold
+        self.latency_tolerance = latency_tolerance
+        self.on_result = on_result
+        self._random = random.Random(seed)
+
+        self._cond = threading.Condition()
+        self._queue = []
+        self._pending = 0
+        self._active = 0
+        self._samples = deque(maxlen=window)
+        self._since_adjust = 0
+        self._best_latency = None
+        self._epoch = 0
+        self._cancelled = False
+
+        self.results = []
+        self.dropped = []
+        self.error = None
+        self.stats = {'requests': 0, 'retries': 0, 'errors': 0, 'quota_errors': 0,
+                      'peak_concurrency': 0, 'limit_changes': []}
+
+    def run(self, tasks: Sequence[Any]) -> Tuple[List[Any], List[Tuple[Any, BaseException]]]:
+        """
+        Process tasks; returns (results in task order with None for dropped
+        tasks, [(task, last error)] of dropped tasks). If on_result raises,
+        the run stops and the error is re-raised here.
+        """
+        self.results = [None] * len(tasks)
+        self.dropped = []
+        self.error = None
+        self._cancelled = False
+        self._queue = [(0.0, i, 1) for i in range(len(tasks))]
+        self._tasks = tasks
+        self._pending = len(tasks)
+        workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(min(self.max_workers, len(tasks)))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if self.error is not None:
+            raise self.error
+        return self.results, self.dropped
+
+    def cancel(self) -> None:
+        """
+        Stop handing out tasks: requests in flight finish, then run()
+        returns with the unfinished tasks' results left None
+        """
+        with self._cond:
+            self._cancelled = True
+            self._cond.notify_all()
+
+    def _next(self) -> Optional[Tuple[Tuple[float, int, int], int]]:
+        """
+        Block until a task is ready and a concurrency slot is free; returns
+        the queue item and the current epoch, or None when all are done
+        or the run is cancelled
+        """
+        with self._cond:
+            while True:
+                if self._pending == 0 or self._cancelled:
+                    return None
+                timeout = None
+                if self._queue and self._active < self.limit:
+                    ready_at = self._queue[0][0]
+                    now = time.monotonic()
+                    if ready_at <= now:
+                        self._active += 1
+                        self.stats['requests'] += 1
+                        self.stats['peak_concurrency'] = max(self.stats['peak_concurrency'], self._active)
+                        return heapq.heappop(self._queue), self._epoch
+                    timeout = ready_at - now
+                self._cond.wait(timeout)
+
+    def _worker(self) -> None:
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            (_, index, attempt), epoch = item
+            task = self._tasks[index]
+            start = time.monotonic()
+            try:
+                result = self.fetch(task)
+            except Exception as e:
+                self._failed(index, attempt, epoch, e, time.monotonic() - start)
+                continue
+            self._succeeded(index, result, time.monotonic() - start)
+            if self.on_result is not None:
+                try:
+                    self.on_result(task, result)
+                except Exception as e:
+                    self._callback_failed(e)
+
+    def _callback_failed(self, error: BaseException) -> None:
+        """on_result raised: keep the first error for run() to raise and stop the run"""
+        logger.error(f"NDVI result handler failed: {error}")
+        with self._cond:
+            if self.error is None:
+                self.error = error
+        self.cancel()
+
+    def _succeeded(self, index: int, result: Any, latency: float) -> None:
+        with self._cond:
+            self.results[index] = result
+            self._pending -= 1
+            self._active -= 1
+            self._samples.append((latency, True))
+            self._adjust()
+            self._cond.notify_all()
+
+    def _failed(self, index: int, attempt: int, epoch: int, error: BaseException, latency: float) -> None:
+        quota = is_quota_error(error)
+        with self._cond:
+            self._active -= 1
+            self.stats['errors'] += 1
+            self._samples.append((latency, False))
+            if quota:
+                self.stats['quota_errors'] += 1
+                if epoch == self._epoch:
+                    self._set_limit(max(self.min_workers, self.limit // 2), 'quota')
+            if attempt >= self.max_attempts:
+                logger.warning(f"Dropping NDVI task after {attempt} attempts: {error}")
+                self.dropped.append((self._tasks[index], error))
+                self._pending -= 1
+            else:
+                self.stats['retries'] += 1
+                heapq.heappush(self._queue, (time.monotonic() + self.backoff(attempt, quota), index, attempt + 1))
+            self._adjust()
+            self._cond.notify_all()
+
+    def backoff(self, attempt: int, quota: bool = False) -> float:
+        """Seconds to wait before retry number `attempt` (1-based), with +/-50% jitter"""
+        delay = self.base_backoff * 2 ** (attempt - 1)
+        if quota:
+            delay *= self.quota_backoff_factor
+        return min(self.max_backoff, delay) * self._random.uniform(0.5, 1.5)
+
+    def _adjust(self) -> None:
+        """AIMD step once per `window` requests; caller holds the lock"""
+        self._since_adjust += 1
+        if self._since_adjust < self.window or not self._samples:
+            return
+        self._since_adjust = 0
+        # Median, so a few slow (large) batches do not read as congestion
+        latencies = sorted(latency for latency, ok in self._samples if ok)
+        error_rate = sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+        latency = latencies[len(latencies) // 2] if latencies else None
+        if latency is not None and (self._best_latency is None or latency < self._best_latency):
+            self._best_latency = latency
+        slow = latency is not None and latency > self._best_latency * self.latency_tolerance
+        if error_rate > self.error_threshold or slow:
+            self._set_limit(max(self.min_workers, self.limit - 1), 'errors' if not slow else 'latency')
+        elif self.limit < self.max_workers:
+            self._set_limit(self.limit + 1, 'healthy')
+
+    def _set_limit(self, limit: int, reason: str) -> None:
+        if limit < self.limit:
+            self._epoch += 1
+        if limit != self.limit:
+            self.stats['limit_changes'].append((round(time.monotonic(), 3), self.limit, limit, reason))
+            self.limit = limit
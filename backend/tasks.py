@@ -3,6 +3,7 @@ import threading
 import uuid
 import os
 import logging
+from services.metrics import StageRecorder
 
 jobs = {}
 lock = threading.Lock()
@@ -13,6 +14,8 @@ class Job:
         self.status = 'pending'
         self.logs = []
         self.result_file = None
+        self.progress = None
+        self.metrics = StageRecorder(job_id)
 
     def log(self, msg):
         self.logs.append(msg)
@@ -24,6 +27,9 @@ class Job:
     def set_result(self, path):
         self.result_file = path
 
+    def set_progress(self, done, total):
+        self.progress = {'done': done, 'total': total}
+
 executor = ThreadPoolExecutor(max_workers=2)
 
 def submit_job(func, *args, **kwargs):
@@ -0,0 +1,90 @@
+import pytest
+
+
+class RecordedResult:
+    """Result of one RecordingSession statement: its rows and rowcount"""
+
+    def __init__(self, rows, rowcount, batch):
+        self.rows = list(rows)
+        self.rowcount = rowcount
+        self.batch = batch
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def fetchall(self):
+        return self.rows
+
+    def all(self):
+        return self.rows
+
+    def one(self):
+        return self.rows[0]
+
+    def scalar(self):
+        return self.rows[0][0] if self.rows else None
+
+    def scalars(self):
+        return RecordedResult([row[0] for row in self.rows], self.rowcount, self.batch)
+
+    def partitions(self):
+        return (self.rows[i:i + self.batch] for i in range(0, len(self.rows), self.batch))
+
+
+class RecordingSession:
+    """
+    Stands in for a Session or Connection: records (sql, params) of every
+    statement and answers it with the rows of the first (SQL substring,
+    rows) of answers it contains, no rows otherwise. rowcount is that of
+    every result (the number of parameter sets of executemany calls if
+    None); partitions() hands out rows batch at a time.
+    """
+
+    def __init__(self, answers=(), rowcount=None, batch=1000):
+        self.answers = list(answers)
+        self.rowcount = rowcount
+        self.batch = batch
+        self.statements = []
+        self.options = None
+        self.commits = 0
+        self.closed = False
+
+    @property
+    def sql(self):
+        return [sql for sql, _ in self.statements]
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append((sql, params))
+        rows = next((rows for marker, rows in self.answers if marker in sql), [])
+        rowcount = self.rowcount if self.rowcount is not None else len(params) if isinstance(params, list) else 0
+        return RecordedResult(rows, rowcount, self.batch)
+
+    def execution_options(self, **options):
+        self.options = options
+        return self
+
+    def connection(self):
+        return self
+
+    def exec_driver_sql(self, sql, params=None):
+        return self.execute(sql, params)
+
+    def get_bind(self):
+        from sqlalchemy.dialects import postgresql
+        return type('Bind', (), {'dialect': postgresql.dialect()})()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def recording_session():
+    """RecordingSession factory; also a stand-in for SessionLocal"""
+    return RecordingSession
@@ -0,0 +1,102 @@
+"""
+Offline stand-in for the earthengine-api module. Every ee call returns a
+lazy object; nothing is computed until getInfo(), which is counted so tests
+can assert how many round-trips an extraction path makes.
+"""
+import threading
+from collections import Counter
+
+
+class _Lazy:
+    def __init__(self, fake, kind, payload=None):
+        self._fake = fake
+        self._kind = kind
+        self._payload = payload
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self._fake.count(name)
+            if name == 'getInfo':
+                return self._fake.evaluate(self)
+            payload = self._payload
+            if name == 'reduceRegions':
+                payload = kwargs['collection']._payload
+            return _Lazy(self._fake, name, payload)
+        return call
+
+
+class _Namespace:
+    def __init__(self, fake, prefix):
+        self._fake = fake
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self._fake._construct(f'{self._prefix}.{name}')
+
+
+class FakeEE:
+    """
+    Module-like fake: assign it to ndvi_extraction.ee. recent/prev map a
+    farm_id to the NDVI returned for it (default 0.6 / 0.4).
+    """
+
+    def __init__(self, recent=None, prev=None, date='2024-03-10'):
+        self.recent = recent or {}
+        self.prev = prev or {}
+        self.date = date
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self.Geometry = _Namespace(self, 'Geometry')
+        self.Reducer = _Namespace(self, 'Reducer')
+        self.Algorithms = _Namespace(self, 'Algorithms')
+
+    @property
+    def getinfo_calls(self):
+        return self.calls['getInfo']
+
+    def count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def _construct(self, kind, payload=None):
+        self.count(kind)
+        return _Lazy(self, kind, payload)
+
+    def Initialize(self, *args, **kwargs):
+        self.count('Initialize')
+
+    def ServiceAccountCredentials(self, *args):
+        return self._construct('ServiceAccountCredentials')
+
+    def ImageCollection(self, *args):
+        return self._construct('ImageCollection')
+
+    def Date(self, *args):
+        return self._construct('Date')
+
+    def Feature(self, geometry, properties):
+        return self._construct('Feature', dict(properties))
+
+    def FeatureCollection(self, features):
+        return self._construct('FeatureCollection', [f._payload['farm_id'] for f in features])
+
+    def Dictionary(self, values):
+        return self._construct('Dictionary', values)
+
+    def evaluate(self, value):
+        if not isinstance(value, _Lazy):
+            return value
+        if value._kind == 'Dictionary':
+            return {key: self.evaluate(item) for key, item in value._payload.items()}
+        if isinstance(value._payload, list):
+            return {'type': 'FeatureCollection', 'features': [
+                {'type': 'Feature', 'geometry': None, 'properties': {
+                    'farm_id': farm_id,
+                    'recent_ndvi': self.recent.get(farm_id, 0.6),
+                    'prev_ndvi': self.prev.get(farm_id, 0.4),
+                }}
+                for farm_id in value._payload
+            ]}
+        if value._kind in ('format', 'Algorithms.If'):
+            return self.date
+        return 0.5
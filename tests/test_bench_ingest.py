@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+from backend.benchmarks import bench_ingest
+
+ingest = bench_ingest.ingest
+
+
+@pytest.fixture
+def scratch_db(monkeypatch, recording_session):
+    monkeypatch.setattr(bench_ingest, 'init_db', lambda: None)
+    monkeypatch.setattr(ingest, 'SessionLocal', recording_session)
+    monkeypatch.setattr(ingest.farm_cache, 'invalidate_farm_caches', lambda: None)
+    monkeypatch.setattr(ingest.bulk_load, 'DEFAULT_LOADER', 'insert')
+    claimed = set()
+
+    def claim_farm_ids(db, farm_ids, table=ingest.bulk_load.UPLOAD_IDS_TABLE):
+        new = set(farm_ids.astype(str)) - claimed
+        claimed.update(new)
+        return new
+    monkeypatch.setattr(ingest.bulk_load, 'claim_farm_ids', claim_farm_ids)
+
+
+@pytest.mark.parametrize('budget', [[], ['--memory-budget', '1']])
+def test_report_is_the_only_stdout_with_synthetic_ndvi(tmp_path, capsys, scratch_db, budget):
+    bench_ingest.main(['--sizes', '60', '--data-dir', str(tmp_path), '--ndvi-latency', '0', '--force'] + budget)
+    captured = capsys.readouterr()
+    report = json.loads(captured.out)
+    [result] = report['results']
+    assert result['rows'] == 60 and result['ndvi_requests'] >= 1
+    stages = [s['stage'] for s in result['stages']]
+    for stage in ['ndvi_cache', 'ndvi_extraction', 'db_staging', 'db_load', 'ndvi_history', 'db_index', 'db_swap']:
+        assert stage in stages
+    assert bench_ingest.ndvi_providers.NDVI_PROVIDER != bench_ingest.BENCH_PROVIDER
+    assert '60 rows' in captured.err
+
+
+def test_farms_table_is_only_replaced_with_force(tmp_path):
+    with pytest.raises(SystemExit):
+        bench_ingest.main(['--sizes', '60', '--data-dir', str(tmp_path)])
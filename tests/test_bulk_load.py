@@ -0,0 +1,138 @@
+import geopandas as gpd
+import pandas as pd
+import shapely
+from shapely.geometry import Polygon
+from backend.services import bulk_load
+
+
+def make_merged():
+    return gpd.GeoDataFrame({
+        'farm_id': [101, 'x2'],
+        'Vill_Cd': ['12', None],
+        'Plot No': [3.0, 'n/a'],
+        'Area': ['1.5', 2],
+        'Vill_Name': ['Rampur', None],
+        'recent_ndvi': [0.4, None],
+        'harvest_flag': [1, None],
+    }, geometry=[Polygon([(0, 0), (1, 0), (1, 1)]), Polygon([(2, 2), (3, 2), (3, 3)])], crs='EPSG:4326')
+
+
+def test_farm_records_coerces_to_farm_columns():
+    records = bulk_load.farm_records(make_merged())
+    assert list(records.columns[:len(bulk_load.FARM_FIELD_MAP)]) == list(bulk_load.FARM_FIELD_MAP)
+    assert records['farm_id'].tolist() == ['101', 'x2']
+    assert records['vill_cd'].tolist()[0] == 12 and pd.isna(records['vill_cd'][1])
+    assert records['plot_no'].tolist()[0] == 3 and pd.isna(records['plot_no'][1])
+    assert records['area'].tolist() == [1.5, 2.0]
+    assert records['harvest_flag'].tolist() == [1, 0]
+    assert records['div_name'].isna().all()
+
+
+def test_farm_records_geometry_is_hex_ewkb():
+    records = bulk_load.farm_records(make_merged())
+    geom = shapely.from_wkb(records['geometry'][0])
+    assert shapely.get_srid(geom) == 4326
+    assert geom.equals(Polygon([(0, 0), (1, 0), (1, 1)]))
+
+
+def test_build_staging_indexes_copies_farms_indexes(recording_session):
+    db = recording_session([('pg_constraint', [('farms_pkey',)]), ('pg_indexes', [
+        ('farms_pkey', 'CREATE UNIQUE INDEX farms_pkey ON public.farms USING btree (id)'),
+        ('ix_farms_farm_id', 'CREATE UNIQUE INDEX ix_farms_farm_id ON public.farms USING btree (farm_id)'),
+        ('idx_farms_geometry', 'CREATE INDEX idx_farms_geometry ON public.farms USING gist (geometry)'),
+    ])])
+    assert bulk_load.build_staging_indexes(db) == 3
+    ddl = [s for s in db.sql if not s.startswith('SELECT')]
+    assert ddl == [
+        'ALTER TABLE farms_staging ADD CONSTRAINT farms_pkey__staging PRIMARY KEY (id)',
+        'CREATE UNIQUE INDEX ix_farms_farm_id__staging ON public.farms_staging USING btree (farm_id)',
+        'CREATE INDEX idx_farms_geometry__staging ON public.farms_staging USING gist (geometry)',
+        'ANALYZE farms_staging',
+    ]
+    # A job's staging table names its indexes after itself
+    db.statements.clear()
+    bulk_load.build_staging_indexes(db, staging='farms_staging_0123abcd')
+    assert 'CREATE INDEX idx_farms_geometry__staging_0123abcd ON public.farms_staging_0123abcd USING gist (geometry)' in db.sql
+
+
+def test_content_hash_ignores_dtype_and_timestamps():
+    merged = make_merged()
+    retyped = merged.assign(Vill_Cd=[12, None], Area=[1.5, 2.0])
+    first = bulk_load.farm_records(merged)
+    second = bulk_load.farm_records(retyped)
+    assert first['content_hash'].tolist() == second['content_hash'].tolist()
+    assert first['content_hash'].nunique() == 2
+
+
+def test_content_hash_changes_with_geometry_and_ndvi():
+    base = bulk_load.farm_records(make_merged())['content_hash']
+    moved = make_merged()
+    moved.loc[0, 'geometry'] = Polygon([(0, 0), (1, 0), (1, 2)])
+    assert bulk_load.farm_records(moved)['content_hash'][0] != base[0]
+    greener = make_merged().assign(recent_ndvi=[0.41, None])
+    changed = bulk_load.farm_records(greener)['content_hash']
+    assert changed[0] != base[0]
+    assert changed[1] == base[1]
+
+
+def test_ndvi_updates_match_full_records():
+    merged = make_merged()
+    ndvi = pd.DataFrame({'farm_id': ['x2', 'missing'], 'recent_date': ['2024-03-10', None],
+                         'recent_ndvi': [0.3, 0.2], 'prev_date': ['2024-02-24', None],
+                         'prev_ndvi': [0.6, 0.1], 'delta': [-0.3, 0.1], 'harvest_flag': [1, 0]})
+    records = bulk_load.farm_records(merged.drop(columns=['recent_ndvi', 'harvest_flag'])).set_index('farm_id', drop=False)
+    updates = bulk_load.ndvi_updates(records, ndvi)
+    assert updates.columns.tolist() == ['farm_id'] + bulk_load.NDVI_UPDATE_FIELDS + ['content_hash']
+    assert updates['farm_id'].tolist() == ['x2']
+
+    full = make_merged().assign(recent_date=[None, '2024-03-10'], recent_ndvi=[None, 0.3],
+                                prev_date=[None, '2024-02-24'], prev_ndvi=[None, 0.6],
+                                delta=[None, -0.3], harvest_flag=[0, 1])
+    assert updates['content_hash'][0] == bulk_load.farm_records(full)['content_hash'][1]
+    assert records.loc['x2', 'harvest_flag'] == 1
+
+
+def test_update_ndvi_is_one_set_based_update(recording_session):
+    db = recording_session()
+    updates = pd.DataFrame({'farm_id': ['1', '2']} | {f: [None, None] for f in bulk_load.NDVI_UPDATE_FIELDS}
+                           | {'content_hash': ['a', 'b']})
+    assert bulk_load.update_ndvi(db, updates, method='insert') == 0
+    assert bulk_load.update_ndvi(db, updates.iloc[:0]) == 0
+    updates_sql = [s for s in db.sql if s.startswith('UPDATE')]
+    assert len(updates_sql) == 1
+    assert 'FROM farms_ndvi_update u WHERE f.farm_id = u.farm_id' in updates_sql[0]
+    assert any(s.startswith('INSERT INTO farms_ndvi_update') for s in db.sql)
+
+
+def test_update_ndvi_reports_farms_not_found(recording_session):
+    db = recording_session([('WHERE NOT EXISTS', [('2',)])])
+    updates = pd.DataFrame({'farm_id': ['1', '2'], 'recent_ndvi': [0.3, 0.4], 'content_hash': [None, None]})
+    not_found = []
+    bulk_load.update_ndvi(db, updates, method='insert', not_found=not_found)
+    assert not_found == ['2']
+    update_sql = next(s for s in db.sql if s.startswith('UPDATE'))
+    assert 'SET recent_ndvi = u.recent_ndvi, content_hash = u.content_hash, updated_at' in update_sql
+    assert db.sql[-1] == 'DROP TABLE farms_ndvi_update'
+
+
+def test_upsert_stages_updates_without_the_id_default(recording_session):
+    db = recording_session([('SELECT farm_id, content_hash', [('101', 'stale')])])
+    counts = bulk_load.upsert_farms(db, make_merged(), method='insert')
+    assert counts == {'inserted': 1, 'updated': 1, 'unchanged': 0}
+    create = next(s for s in db.sql if s.startswith('CREATE TEMP TABLE farms_upsert'))
+    assert 'LIKE' not in create and '"id"' not in create
+    assert create.endswith('FROM farms WITH NO DATA')
+    assert 'UPDATE farms f SET' in next(s for s in db.sql if s.startswith('UPDATE'))
+
+
+def test_remove_missing_farms_is_set_based(recording_session):
+    db = recording_session()
+    bulk_load.remove_missing_farms(db, ['2', '1', '2'], archive=True, method='insert')
+    assert not any(s.startswith('SELECT farm_id FROM farms') for s in db.sql)
+    insert_ids = next(s for s in db.sql if s.startswith('INSERT INTO farms_keep_ids'))
+    assert 'VALUES (:farm_id)' in insert_ids
+    archive, delete = [s for s in db.sql if 'NOT EXISTS (SELECT' in s]
+    assert archive.startswith('INSERT INTO farms_archive') and 'SELECT "id"' in archive
+    assert delete == ('DELETE FROM farms f WHERE NOT EXISTS '
+                      '(SELECT 1 FROM farms_keep_ids k WHERE k.farm_id = f.farm_id)')
+    assert db.sql[-1] == 'DROP TABLE farms_keep_ids'
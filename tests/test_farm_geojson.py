@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from backend.services import farm_geojson
+
+
+def feature_rows(n):
+    """Answer of every statement: (id, feature text) rows"""
+    return [('', [(i, json.dumps({'type': 'Feature', 'geometry': None, 'properties': {'farm_id': f'F{i}'}}))
+                  for i in range(1, n + 1)])]
+
+
+def test_stream_pages_through_server_side_cursor(recording_session):
+    connection = recording_session(feature_rows(6), batch=4)
+    chunks = list(farm_geojson.stream_feature_collection(None, 5, {'total': 9}, connect=lambda: connection))
+    body = json.loads(b''.join(chunks))
+    assert [f['properties']['farm_id'] for f in body['features']] == ['F1', 'F2', 'F3', 'F4', 'F5']
+    assert body['metadata']['total'] == 9
+    assert farm_geojson.farm_pagination.decode_cursor(body['metadata']['next']) == 5
+    assert connection.options['stream_results'] and connection.closed
+
+
+def test_stream_last_page_has_no_next(recording_session):
+    connection = recording_session(feature_rows(3), batch=2)
+    body = json.loads(b''.join(farm_geojson.stream_feature_collection(None, 5, {}, connect=lambda: connection)))
+    assert len(body['features']) == 3
+    assert body['metadata']['next'] is None
+    body = json.loads(b''.join(farm_geojson.stream_feature_collection(None, 5, {}, connect=recording_session)))
+    assert body['features'] == [] and body['metadata']['next'] is None
+
+
+def test_stream_runs_query_before_the_response_starts(recording_session):
+    connection = recording_session(feature_rows(3), batch=2)
+    chunks = farm_geojson.stream_feature_collection('statement', 5, {}, connect=lambda: connection)
+    assert connection.sql == ['statement']
+
+    def failing(statement):
+        raise RuntimeError('relation "farms" does not exist')
+    broken = recording_session()
+    broken.execute = failing
+    with pytest.raises(RuntimeError):
+        farm_geojson.stream_feature_collection(None, 5, {}, connect=lambda: broken)
+    assert broken.closed
+    assert len(json.loads(b''.join(chunks))['features']) == 3
+
+
+def test_orm_feature_uses_property_columns():
+    from backend.routers.farms import farm_to_geojson_feature
+    from backend.database import Farm
+    farm = Farm(**{column: f'value of {column}' for column in farm_geojson.PROPERTY_COLUMNS.values()})
+    properties = farm_to_geojson_feature(farm, 'null')['properties']
+    assert properties == {name: f'value of {column}' for name, column in farm_geojson.PROPERTY_COLUMNS.items()}
+    assert list(properties) == list(farm_geojson.PROPERTY_COLUMNS)
+    assert farm_to_geojson_feature(farm, 'null', ['recent_ndvi'])['properties'] == {'recent_ndvi': 'value of recent_ndvi'}
+
+
+def test_parse_fields():
+    assert farm_geojson.parse_fields(None) == list(farm_geojson.PROPERTY_COLUMNS)
+    assert farm_geojson.parse_fields('harvest_flag, farm_id,Plot No') == ['farm_id', 'Plot No', 'harvest_flag']
+    with pytest.raises(ValueError, match='geometry, wkt'):
+        farm_geojson.parse_fields('farm_id,wkt,geometry')
+
+
+def test_feature_select_projects_columns_and_precision():
+    from sqlalchemy.dialects import postgresql
+    from backend.database import Farm
+    statement = farm_geojson.feature_select(Farm.geometry, [], 11, fields=['farm_id', 'recent_ndvi'], precision=6)
+    sql = str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+    assert "json_build_object('farm_id', farms.farm_id, 'recent_ndvi', farms.recent_ndvi)" in sql
+    assert 'ST_AsGeoJSON(farms.geometry, 6)' in sql
+    assert 'farms.wkt' not in sql and 'OFFSET' not in sql
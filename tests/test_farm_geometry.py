@@ -0,0 +1,95 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import Polygon
+
+from backend.services import bulk_load
+
+farm_geometry = bulk_load.farm_geometry
+
+
+def test_parse_tiers():
+    tiers = farm_geometry.parse_tiers('5:0.002,10:0.0005,15:0.00005')
+    assert [t.column for t in tiers] == farm_geometry.TIER_COLUMNS
+    assert tiers[1] == farm_geometry.GeometryTier('geometry_mid', 10, 0.0005)
+    for spec in ['6:0.001,11:0.0005', '6:0.001,11:x,14:0.0001', '11:0.001,6:0.0005,14:0.0001']:
+        with pytest.raises(ValueError):
+            farm_geometry.parse_tiers(spec)
+
+
+def test_tier_for_zoom():
+    tiers = farm_geometry.parse_tiers('6:0.001,11:0.0005,14:0.0001')
+    assert farm_geometry.tier_for_zoom(None, tiers) is None
+    assert farm_geometry.tier_for_zoom(3, tiers).column == 'geometry_low'
+    assert farm_geometry.tier_for_zoom(6, tiers).column == 'geometry_mid'
+    assert farm_geometry.tier_for_zoom(13, tiers).column == 'geometry_high'
+    assert farm_geometry.tier_for_zoom(14, tiers) is None
+
+
+def test_derived_geometries():
+    # A square with a 0.00005° notch: kept only by the finest tier
+    square = Polygon([(0, 0), (0.01, 0), (0.01, 0.005), (0.00995, 0.00505), (0.01, 0.0051), (0.01, 0.01), (0, 0.01)])
+    derived = farm_geometry.derived_geometries(np.array([square], dtype=object),
+                                               farm_geometry.parse_tiers('6:0.001,11:0.0005,14:0.00001'))
+    assert list(derived) == farm_geometry.DERIVED_COLUMNS
+    assert shapely.get_num_coordinates(derived['geometry_low'][0]) == 5
+    assert shapely.get_num_coordinates(derived['geometry_high'][0]) == shapely.get_num_coordinates(square)
+    assert derived['bbox'][0].equals(shapely.box(0, 0, 0.01, 0.01))
+    assert derived['centroid'][0].geom_type == 'Point'
+    # Plots smaller than the tolerance keep their shape instead of vanishing
+    tiny = shapely.box(0, 0, 0.0001, 0.0001)
+    assert farm_geometry.derived_geometries(np.array([tiny], dtype=object))['geometry_low'][0].equals(tiny)
+
+
+def test_farm_records_store_derived_geometries_outside_the_hash():
+    merged = gpd.GeoDataFrame({'farm_id': ['F1']}, geometry=[Polygon([(0, 0), (1, 0), (1, 1)])], crs='EPSG:4326')
+    records = bulk_load.farm_records(merged)
+    for column in farm_geometry.DERIVED_COLUMNS:
+        geom = shapely.from_wkb(records[column][0])
+        assert shapely.get_srid(geom) == 4326
+    assert shapely.from_wkb(records['centroid'][0]).equals(Polygon([(0, 0), (1, 0), (1, 1)]).centroid)
+    assert records['content_hash'][0] == bulk_load.content_hashes(records.drop(columns=farm_geometry.DERIVED_COLUMNS))[0]
+
+
+def test_backfill_updates_in_committed_id_batches(recording_session):
+    # Farm ids 1..12, two farms updated per statement
+    db = recording_session([('min(id)', [(1, 12)])], rowcount=2)
+    assert farm_geometry.backfill(db, batch_rows=5) == 6
+    updates = db.statements[1:]
+    assert [params for _, params in updates] == [{'start': 1, 'end': 6}, {'start': 6, 'end': 11}, {'start': 11, 'end': 16}]
+    assert db.commits == 3
+    sql = updates[0][0]
+    assert ('geometry_low = CASE WHEN coalesce(ST_IsEmpty(ST_Simplify(geometry, 0.001)), true) '
+            'THEN geometry ELSE ST_Simplify(geometry, 0.001) END') in sql
+    assert 'centroid = ST_Centroid(geometry)' in sql and 'bbox IS NULL' in sql
+    db = recording_session([('min(id)', [(1, 12)])])
+    farm_geometry.backfill(db, recompute=True, batch_rows=20)
+    assert 'IS NULL' not in db.statements[1][0]
+
+
+def _sql(expression):
+    from sqlalchemy.dialects import postgresql
+    return str(expression.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+
+
+def test_zoom_fallback_simplifies_like_ingest():
+    tolerance = farm_geometry.tier_for_zoom(5).tolerance
+    assert _sql(farm_geometry.geometry_for_zoom(5)) == (f'coalesce(farms.geometry_low, CASE WHEN coalesce(ST_IsEmpty(ST_Simplify(farms.geometry, {tolerance})), '
+                   f'true) THEN farms.geometry ELSE ST_Simplify(farms.geometry, {tolerance}) END)')
+
+
+def test_centroids_below_centroid_zoom(monkeypatch):
+    monkeypatch.setattr(farm_geometry, 'FARM_CENTROID_ZOOM', 4)
+    assert _sql(farm_geometry.geometry_for_zoom(3)) == 'coalesce(farms.centroid, ST_Centroid(farms.geometry))'
+    assert 'geometry_low' in _sql(farm_geometry.geometry_for_zoom(4))
+
+
+def test_viewport_filter_reads_the_polygon_only_where_it_is_served():
+    from geoalchemy2.functions import ST_MakeEnvelope
+    envelope = ST_MakeEnvelope(73, 19, 74, 20, 4326)
+    overlaps = ('(farms.bbox && ST_MakeEnvelope(73, 19, 74, 20, 4326)) OR '
+                'farms.bbox IS NULL AND (farms.geometry && ST_MakeEnvelope(73, 19, 74, 20, 4326))')
+    assert _sql(farm_geometry.viewport_filter(envelope, 8)) == overlaps
+    assert _sql(farm_geometry.viewport_filter(envelope, None)) == (
+        f'({overlaps}) AND ST_Intersects(farms.geometry, ST_MakeEnvelope(73, 19, 74, 20, 4326))')
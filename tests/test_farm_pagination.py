@@ -0,0 +1,60 @@
+import json
+
+import pytest
+from sqlalchemy.orm import Session
+
+from backend.services import farm_pagination
+
+farm_cache = farm_pagination.farm_cache
+
+
+def test_cursor_round_trip():
+    token = farm_pagination.encode_cursor(123456)
+    assert '=' not in token
+    assert farm_pagination.decode_cursor(token) == 123456
+
+
+@pytest.mark.parametrize('token', ['', 'not base64!', 'eyJpZCI6IDF9', farm_pagination.encode_cursor('5')])
+def test_decode_cursor_rejects_other_tokens(token):
+    with pytest.raises(ValueError):
+        farm_pagination.decode_cursor(token)
+
+
+class CountQuery:
+    def __init__(self, n):
+        self.n = n
+        self.calls = 0
+
+    def count(self):
+        self.calls += 1
+        return self.n
+
+
+def test_cached_counts_last_until_farms_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(farm_cache, 'FARM_TILE_CACHE_DIR', str(tmp_path))
+    query = CountQuery(42)
+    assert farm_pagination.count_rows(None, query, 'cached', '["v1"]') == 42
+    assert farm_pagination.count_rows(None, query, 'cached', '["v1"]') == 42
+    assert farm_pagination.count_rows(None, query, 'exact', '["v1"]') == 42
+    assert query.calls == 2
+    farm_cache.invalidate_farm_caches()
+    assert farm_pagination.count_rows(None, query, 'cached', '["v1"]') == 42
+    assert query.calls == 3
+    with pytest.raises(ValueError):
+        farm_pagination.count_rows(None, query, 'approximate')
+
+
+def test_viewport_counts_are_not_cached():
+    assert farm_pagination.count_mode_for('cached', viewport=True) == 'estimated'
+    assert farm_pagination.count_mode_for('cached', viewport=False) == 'cached'
+    assert farm_pagination.count_mode_for('exact', viewport=True) == 'exact'
+
+
+def test_estimated_count_reads_the_plan(recording_session):
+    from backend.database import Farm
+    db = recording_session([('EXPLAIN', [(json.dumps([{'Plan': {'Plan Rows': 1234}}]),)])])
+    query = Session().query(Farm.id).filter(Farm.vill_name == 'Rampur')
+    assert farm_pagination.estimated_count(db, query) == 1234
+    [(sql, params)] = db.statements
+    assert sql.startswith('EXPLAIN (FORMAT JSON) SELECT farms.id')
+    assert list(params.values()) == ['Rampur']
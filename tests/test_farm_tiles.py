@@ -0,0 +1,58 @@
+import os
+
+from backend.services import farm_tiles
+
+farm_cache = farm_tiles.farm_cache
+
+
+def tile_answer(data):
+    """Answer of the tile query"""
+    return [('ST_AsMVT', [(data,)])]
+
+
+def test_valid_tile():
+    assert farm_tiles.valid_tile(0, 0, 0)
+    assert farm_tiles.valid_tile(14, 16383, 0)
+    assert not farm_tiles.valid_tile(14, 16384, 0)
+    assert not farm_tiles.valid_tile(2, 0, -1)
+    assert not farm_tiles.valid_tile(farm_tiles.FARM_TILE_MAX_ZOOM + 1, 0, 0)
+
+
+def test_tiles_are_cached_until_invalidated(tmp_path, monkeypatch, recording_session):
+    monkeypatch.setattr(farm_cache, 'FARM_TILE_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(farm_cache, 'FARM_TILE_CACHE', True)
+    db = recording_session(tile_answer(memoryview(b'tile')))
+
+    assert farm_tiles.get_tile(db, 12, 2900, 1700) == b'tile'
+    assert farm_tiles.get_tile(db, 12, 2900, 1700) == b'tile'
+    [(_, params)] = db.statements
+    assert params['z'] == 12 and params['margin'] > 0
+    old = farm_cache.current_generation()
+
+    farm_cache.invalidate_farm_caches()
+    assert not os.path.exists(tmp_path / old)
+    db.answers = tile_answer(None)
+    assert farm_tiles.get_tile(db, 12, 2900, 1700) == b''
+    assert len(db.statements) == 2
+    assert farm_cache.current_generation() != old
+
+
+def test_tiles_below_min_zoom_carry_centroids(monkeypatch, recording_session):
+    monkeypatch.setattr(farm_cache, 'FARM_TILE_CACHE', False)
+    db = recording_session(tile_answer(memoryview(b'points')))
+    assert farm_tiles.get_tile(db, farm_tiles.FARM_TILE_MIN_ZOOM - 1, 0, 0) == b'points'
+    assert farm_tiles.get_tile(db, farm_tiles.FARM_TILE_MIN_ZOOM, 0, 0) == b'points'
+    low, polygons = db.sql
+    assert 'COALESCE(f.centroid, ST_Centroid(f.geometry))' in low
+    assert 'centroid' not in polygons
+    assert 'f.bbox && b.search' in polygons
+
+
+def test_tile_is_served_when_its_generation_is_gone(tmp_path, monkeypatch, recording_session):
+    monkeypatch.setattr(farm_cache, 'FARM_TILE_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(farm_cache, 'FARM_TILE_CACHE', True)
+    # An invalidation deleted the generation directory while the tile rendered
+    (tmp_path / 'stale').write_text('not a directory')
+    assert not farm_cache.write_tile(12, 1, 1, 'stale', b'tile')
+    monkeypatch.setattr(farm_cache, 'current_generation', lambda root=None: 'stale')
+    assert farm_tiles.get_tile(recording_session(tile_answer(memoryview(b'tile'))), 12, 1, 1) == b'tile'
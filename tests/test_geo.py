@@ -35,3 +35,36 @@ def test_polygon_all_corners_missing():
     row = make_row()
     poly = ingest.row_to_polygon(row)
     assert poly is None
+
+def test_polygons_from_frame_matches_row_to_polygon():
+    rows = [
+        make_row(Lang1=10, Long1=20, Lang2=10, Long2=21, Lang3=11, Long3=21, Lang4=11, Long4=20),
+        make_row(Lang1=10, Long1=20, Lang2=10, Long2=21, Lang3=11, Long3=21),
+        make_row(Lang1=10, Long1=20, Lang3=10, Long3=21, Lang4=11, Long4=21),
+        make_row(Lang1=10, Long1=20, Lang2=10, Long2=21, Lang3=10, Long3=20),
+        make_row(Lang1=10, Long1=20, Lang2=11, Long2=21, Lang3=10, Long3=21, Lang4=11, Long4=20),
+        make_row(Lang1='bad', Long1=20, Lang2=10, Long2=21, Lang3=11, Long3=21),
+        make_row(Lang1=10, Long1=20, Lang2=10),
+        make_row(),
+    ]
+    df = pd.DataFrame(rows)
+    polygons = ingest.polygons_from_frame(df)
+    assert len(polygons) == len(rows)
+    for row, poly in zip(rows, polygons):
+        expected = ingest.row_to_polygon(row)
+        if expected is None:
+            assert poly is None
+        else:
+            assert poly.equals_exact(expected, 0)
+
+def test_csv_to_geojson_rejected_count(tmp_path):
+    rows = [
+        make_row(farm_id='a', Lang1=10, Long1=20, Lang2=10, Long2=21, Lang3=11, Long3=21, Lang4=11, Long4=20),
+        make_row(farm_id='a', Lang1=10, Long1=20, Lang2=10, Long2=21, Lang3=11, Long3=21),
+        make_row(farm_id='b', Lang1=10, Long1=20, Lang2=10, Long2=21, Lang3=11, Long3=21),
+        make_row(farm_id='c', Lang1=10, Long1=20),
+    ]
+    csv_path = tmp_path / 'farms.csv'
+    pd.DataFrame(rows).to_csv(csv_path, index=False)
+    n_ok, n_rej = ingest.csv_to_geojson(str(csv_path), str(tmp_path / 'farms.geojson'))
+    assert (n_ok, n_rej) == (2, 1)
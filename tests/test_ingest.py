@@ -0,0 +1,142 @@
+import pandas as pd
+from backend.services import ingest
+
+
+def test_dedupe_farms_across_chunks():
+    seen = set()
+    first = ingest.dedupe_farms(pd.DataFrame({'farm_id': [1, 2, 2, 3]}), seen)
+    second = ingest.dedupe_farms(pd.DataFrame({'farm_id': ['3', 4, 1, 5]}), seen)
+    assert first['farm_id'].tolist() == [1, 2, 3]
+    assert second['farm_id'].tolist() == [4, 5]
+    assert seen == {'1', '2', '3', '4', '5'}
+
+
+def test_dedupe_matches_whole_file(tmp_path):
+    df = pd.DataFrame({'farm_id': [i % 7 for i in range(50)], 'n': range(50)})
+    seen = set()
+    chunks = [ingest.dedupe_farms(df.iloc[i:i + 6], seen) for i in range(0, 50, 6)]
+    assert pd.concat(chunks)['n'].tolist() == ingest.dedupe_farms(df)['n'].tolist()
+
+
+def test_chunk_rows_for_budget_scales_with_budget(tmp_path):
+    csv_path = tmp_path / 'farms.csv'
+    pd.DataFrame({'farm_id': range(5000), 'Vill_Name': ['village'] * 5000}).to_csv(csv_path, index=False)
+    small = ingest.chunk_rows_for_budget(str(csv_path), 1)
+    large = ingest.chunk_rows_for_budget(str(csv_path), 64)
+    assert small >= ingest.MIN_CHUNK_ROWS
+    assert large > small
+
+
+def test_chunk_rows_floor_is_reported(tmp_path):
+    csv_path = tmp_path / 'farms.csv'
+    pd.DataFrame({'farm_id': range(50), 'Vill_Name': ['village'] * 50}).to_csv(csv_path, index=False)
+    log_path = tmp_path / 'ingest.log'
+    assert ingest.chunk_rows_for_budget(str(csv_path), 0.01, log_path=str(log_path)) == ingest.MIN_CHUNK_ROWS
+    assert 'memory budget of 0.01 MB fits only' in log_path.read_text()
+    assert ingest.chunk_rows_for_budget(str(csv_path), 64, log_path=str(log_path)) > ingest.MIN_CHUNK_ROWS
+    assert log_path.read_text().count('WARNING') == 1
+
+
+def test_ndvi_stream_updater_applies_batches_and_reports_progress(monkeypatch, recording_session):
+    from shapely.geometry import Polygon
+    merged = pd.DataFrame({'farm_id': ['F0', 'F1', 'F2'], 'recent_ndvi': [0.6, None, None],
+                           'geometry': [Polygon([(i, 0), (i + 1, 0), (i + 1, 1)]) for i in range(3)]})
+    applied = []
+    progress = []
+    monkeypatch.setattr(ingest, 'SessionLocal', recording_session)
+    invalidations = []
+    monkeypatch.setattr(ingest.farm_cache, 'invalidate_farm_caches', lambda: invalidations.append(1))
+    monkeypatch.setattr(ingest.bulk_load, 'update_ndvi', lambda db, updates, method: applied.append(updates) or len(updates))
+    recorded = []
+    monkeypatch.setattr(ingest.ndvi_history, 'store', lambda db, obs: recorded.append(obs) or len(obs))
+    converted = []
+    farm_records = ingest.bulk_load.farm_records
+    monkeypatch.setattr(ingest.bulk_load, 'farm_records',
+                        lambda farms, **kwargs: converted.append(farms['farm_id'].tolist()) or farm_records(farms, **kwargs))
+
+    on_flush = ingest.ndvi_stream_updater(merged, 1, 3, progress=lambda done, total: progress.append((done, total)))
+    on_flush([{'farm_id': 'F1', 'recent_date': '2024-03-10', 'recent_ndvi': 0.3, 'prev_date': '2024-02-24',
+               'prev_ndvi': 0.6, 'delta': -0.3}], [])
+    on_flush([], ['F2'])
+
+    assert progress == [(2, 3), (3, 3)]
+    assert converted == [['F1']]
+    assert invalidations == []
+    assert len(applied) == 1
+    assert applied[0]['farm_id'].tolist() == ['F1']
+    assert applied[0]['harvest_flag'].tolist() == [1]
+    assert [(o.farm_id, o.acquired_on.isoformat()) for o in recorded[0].itertuples()] == [
+        ('F1', '2024-03-10'), ('F1', '2024-02-24')]
+
+
+def _farms_csv(path, farm_ids):
+    """Upload CSV of square farms, one per farm_id (None corners for 'bad')"""
+    rows = []
+    for i, farm_id in enumerate(farm_ids):
+        row = {column: f'{farm_id}-{i}' for column in ingest.REQUIRED_COLUMNS}
+        row['farm_id'] = farm_id
+        corners = [] if farm_id == 'bad' else [(19 + i * 0.01, 73), (19 + i * 0.01, 73.005),
+                                               (19.005 + i * 0.01, 73.005), (19.005 + i * 0.01, 73)]
+        for n in range(4):
+            row[f'Lang{n + 1}'], row[f'Long{n + 1}'] = corners[n] if corners else (None, None)
+        row['WKT'] = None
+        rows.append(row)
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def test_chunked_pipeline_loads_a_multi_chunk_file(tmp_path, monkeypatch, recording_session):
+    bulk_load, ndvi_providers = ingest.bulk_load, ingest.ndvi_providers
+    claimed = set()
+
+    class UploadSession(recording_session):
+        def execute(self, statement, params=None):
+            result = super().execute(statement, params)
+            if f'INSERT INTO {bulk_load.UPLOAD_IDS_TABLE}' in str(statement):
+                result.rows = [(farm_id,) for farm_id in params['ids'] if farm_id not in claimed]
+                claimed.update(farm_id for farm_id, in result.rows)
+            return result
+
+    sessions = []
+    monkeypatch.setattr(ingest, 'SessionLocal', lambda: sessions.append(UploadSession()) or sessions[-1])
+    monkeypatch.setattr(ingest, 'chunk_rows_for_budget', lambda *args, **kwargs: 4)
+    monkeypatch.setattr(ingest.farm_cache, 'invalidate_farm_caches', lambda: None)
+    monkeypatch.setattr(bulk_load, 'DEFAULT_LOADER', 'insert')
+    provider = ndvi_providers.SyntheticProvider(latency=0, batch_size=2)
+    extracted = []
+    extract = provider.extract
+    monkeypatch.setattr(provider, 'extract', lambda farms, **kwargs: extracted.append(len(farms)) or extract(farms, **kwargs))
+    monkeypatch.setattr(ndvi_providers, 'get_provider', lambda: provider)
+
+    # F1 comes back in the third chunk, the bad row has no polygon
+    farm_ids = [f'F{i}' for i in range(8)] + ['F1', 'bad'] + [f'F{i}' for i in range(8, 10)]
+    csv_path = tmp_path / 'farms.csv'
+    _farms_csv(csv_path, farm_ids)
+    log_path = tmp_path / 'ingest.log'
+
+    assert ingest.chunked_pipeline(str(csv_path), None, 1, log_path=str(log_path)) == (10, 1)
+    assert claimed == {f'F{i}' for i in range(10)}
+    assert extracted == [4, 4, 2]
+    db = sessions[0]
+    loaded = [params for sql, params in db.statements if 'INSERT INTO farms_staging' in sql]
+    rows = [row for params in loaded for row in (params if isinstance(params, list) else [params])]
+    assert [row['farm_id'] for row in rows] == [f'F{i}' for i in range(10)]
+    assert rows[1]['vill_name'] == 'F1-1'
+    # Work tables are the job's own
+    [staging] = {sql.split()[2] for sql in db.sql if sql.startswith('CREATE TABLE farms_staging_')}
+    assert f'ALTER TABLE {staging} RENAME TO farms' in db.sql
+    assert db.sql[-1].startswith(f'DROP TABLE IF EXISTS {bulk_load.UPLOAD_IDS_TABLE}_')
+    assert 'Saved 10 farms' in log_path.read_text()
+
+
+def test_reloads_get_their_own_staging_table(monkeypatch, recording_session):
+    monkeypatch.setattr(ingest.bulk_load, 'DEFAULT_LOADER', 'copy')
+    db = recording_session()
+    first = ingest.begin_farm_reload(db)
+    created = len(db.sql)
+    second = ingest.begin_farm_reload(db)
+    assert first != second and first.startswith(ingest.bulk_load.STAGING_TABLE + '_')
+    assert not any(first in sql for sql in db.sql[created:])
+
+    ingest.drop_job_tables(db, [first, None, 'farms'])
+    assert db.sql[-1] == f'DROP TABLE IF EXISTS {first}'
+    assert not any(sql.endswith(' farms') for sql in db.sql)
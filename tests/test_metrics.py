@@ -0,0 +1,54 @@
+import json
+import time
+from backend.services.metrics import StageRecorder
+
+
+def test_stage_records_rows_and_throughput():
+    metrics = StageRecorder('job-1')
+    with metrics.stage('parse', rows_in=100) as stage:
+        time.sleep(0.01)
+        stage.rows_out = 90
+    [parse] = metrics.as_list()
+    assert parse['stage'] == 'parse'
+    assert (parse['rows_in'], parse['rows_out']) == (100, 90)
+    assert parse['seconds'] > 0
+    assert parse['rows_per_sec'] > 0
+    assert parse['started_at'] <= parse['finished_at']
+    assert parse['peak_rss_mb'] > 0
+
+
+def test_repeated_stages_are_aggregated():
+    metrics = StageRecorder()
+    for rows in (10, 20, 30):
+        with metrics.stage('db_load', rows_in=rows) as stage:
+            stage.rows_out = rows - 1
+    with metrics.stage('harvest_flag', rows_in=5):
+        pass
+    stages = metrics.as_list()
+    assert [s['stage'] for s in stages] == ['db_load', 'harvest_flag']
+    assert (stages[0]['rows_in'], stages[0]['rows_out']) == (60, 57)
+
+
+def test_stage_is_recorded_when_it_fails(tmp_path):
+    log_path = tmp_path / 'metrics.jsonl'
+    metrics = StageRecorder('job-2', str(log_path))
+    try:
+        with metrics.stage('ndvi_extraction'):
+            raise RuntimeError('quota')
+    except RuntimeError:
+        pass
+    [entry] = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert entry['job_id'] == 'job-2'
+    assert entry['stage'] == 'ndvi_extraction'
+
+
+def test_stage_without_rss_sources(monkeypatch):
+    # Neither /proc nor getrusage, as on Windows
+    from backend.services import metrics as metrics_module
+    monkeypatch.setattr(metrics_module, 'current_rss_bytes', lambda: None)
+    monkeypatch.setattr(metrics_module, 'resource', None)
+    metrics = StageRecorder()
+    with metrics.stage('parse', rows_in=1):
+        pass
+    [parse] = metrics.as_list()
+    assert parse['peak_rss_mb'] is None
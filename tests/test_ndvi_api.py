@@ -0,0 +1,38 @@
+from datetime import datetime
+
+from backend.routers import ndvi
+from backend.services import bulk_load
+
+
+def make_payload(farm_id, recent_ndvi, prev_ndvi, day=10):
+    return ndvi.NDVIData(farm_id=farm_id, recent_date=datetime(2024, 3, day), recent_ndvi=recent_ndvi,
+                         prev_date=datetime(2024, 2, 24), prev_ndvi=prev_ndvi,
+                         delta=recent_ndvi - prev_ndvi, harvest=0)
+
+
+def test_ndvi_update_frame_dedupes_and_flags_harvest():
+    updates = ndvi.ndvi_update_frame([
+        make_payload('A', 0.7, 0.6), make_payload('B', 0.3, 0.6), make_payload('A', 0.4, 0.6, day=11),
+    ])
+    assert updates.columns.tolist() == ['farm_id'] + bulk_load.NDVI_UPDATE_FIELDS + ['content_hash']
+    assert updates['farm_id'].tolist() == ['B', 'A']
+    assert updates['recent_date'].tolist() == ['2024-03-10', '2024-03-11']
+    assert updates['harvest_flag'].tolist() == [1, 1]
+    assert updates['content_hash'].isna().all()
+
+
+def test_bulk_update_returns_not_found(monkeypatch, recording_session):
+    calls = []
+
+    def update_ndvi(db, updates, method, not_found):
+        calls.append(updates)
+        not_found.extend(updates['farm_id'][updates['farm_id'] == 'missing'])
+        return len(updates) - len(not_found)
+
+    monkeypatch.setattr(ndvi.bulk_load, 'update_ndvi', update_ndvi)
+    monkeypatch.setattr(ndvi.farm_cache, 'invalidate_farm_caches', lambda: None)
+    db = recording_session()
+    result = ndvi.bulk_update_ndvi([make_payload('A', 0.7, 0.6), make_payload('missing', 0.3, 0.6)], db=db)
+    assert result['updated'] == 1
+    assert result['not_found'] == ['missing']
+    assert len(calls) == 1 and db.commits == 1
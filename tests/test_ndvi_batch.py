@@ -0,0 +1,96 @@
+import pandas as pd
+import pytest
+from shapely.geometry import Polygon
+from backend.services import ndvi_extraction
+from fake_ee import FakeEE
+
+
+@pytest.fixture
+def fake_ee(monkeypatch):
+    fake = FakeEE(recent={'F2': 0.7}, prev={'F2': 0.2})
+    monkeypatch.setattr(ndvi_extraction, 'ee', fake)
+    return fake
+
+
+def _farms(n):
+    rows = []
+    for i in range(n):
+        lat, lon = 28.0 + i * 0.001, 80.0
+        rows.append({'farm_id': f'F{i}', 'Lang1': lat, 'Long1': lon, 'Lang2': lat, 'Long2': lon + 0.0005,
+                     'Lang3': lat + 0.0005, 'Long3': lon + 0.0005, 'Lang4': lat + 0.0005, 'Long4': lon})
+    return pd.DataFrame(rows)
+
+
+def _output(path):
+    with open(path, 'w') as f:
+        f.write(ndvi_extraction.OUTPUT_COLUMNS + '\n')
+    return path
+
+
+def test_batch_uses_one_getinfo_per_batch(fake_ee, tmp_path):
+    out = _output(tmp_path / 'ndvi.csv')
+    count = ndvi_extraction.run_extraction(_farms(25), out, batch_size=10)
+    assert count == 25
+    assert fake_ee.getinfo_calls == 3
+    assert fake_ee.calls['reduceRegions'] == 3
+    assert fake_ee.calls['reduceRegion'] == 0
+
+
+def test_batch_results_match_farms(fake_ee, tmp_path):
+    out = _output(tmp_path / 'ndvi.csv')
+    ndvi_extraction.run_extraction(_farms(5), out, batch_size=200)
+    result = pd.read_csv(out)
+    assert sorted(result['farm_id']) == ['F0', 'F1', 'F2', 'F3', 'F4']
+    row = result.set_index('farm_id').loc['F2']
+    assert row['recent_ndvi'] == 0.7 and row['prev_ndvi'] == 0.2
+    assert row['delta'] == pytest.approx(0.5)
+    assert row['recent_date'] == '2024-03-10'
+
+
+def test_per_farm_path_round_trips(fake_ee, tmp_path):
+    out = _output(tmp_path / 'ndvi.csv')
+    count = ndvi_extraction.run_extraction(_farms(3), out, batch_size=1)
+    assert count == 3
+    assert fake_ee.getinfo_calls == 3
+    assert fake_ee.calls['aggregate_max'] == 6
+    assert pd.read_csv(out)['prev_date'].tolist() == ['2024-03-10'] * 3
+
+
+def test_assign_clusters_groups_neighbours():
+    farms = _farms(3)
+    far = _farms(1).assign(farm_id='FAR', Lang1=21.0, Lang2=21.0, Lang3=21.0005, Lang4=21.0005)
+    df = pd.concat([farms, far, farms.iloc[:1].assign(farm_id='BAD', Lang1='N/A', Lang2=None,
+                                                    Lang3=None, Lang4=None)], ignore_index=True)
+    clusters = ndvi_extraction.assign_clusters(df)
+    assert clusters[0] == clusters[1] == clusters[2]
+    assert clusters[3] != clusters[0]
+    assert clusters[4] is None
+
+
+def test_composite_built_once_per_cluster(fake_ee, tmp_path):
+    out = _output(tmp_path / 'ndvi.csv')
+    far = _farms(4).assign(farm_id=lambda d: 'G' + d['farm_id'], Lang1=21.0, Lang2=21.0,
+                           Lang3=21.0005, Lang4=21.0005)
+    count = ndvi_extraction.run_extraction(pd.concat([_farms(6), far]), out, batch_size=2)
+    assert count == 10
+    # Two clusters: one composite (median pair) each, five reduceRegions batches
+    assert fake_ee.calls['median'] == 4
+    assert fake_ee.calls['reduceRegions'] == 5
+    assert fake_ee.getinfo_calls == 5
+
+
+def test_extract_ndvi_in_process_from_polygons(fake_ee, monkeypatch):
+    monkeypatch.setattr(ndvi_extraction, '_ee_initialized', False)
+    monkeypatch.setenv('EE_PROJECT_ID', 'test-project')
+    farms = pd.DataFrame({
+        'farm_id': ['F1', 'F2'],
+        'geometry': [Polygon([(80.0, 28.0), (80.001, 28.0), (80.001, 28.001)]),
+                     Polygon([(80.0, 28.002), (80.001, 28.002), (80.001, 28.003)])],
+    })
+    first = ndvi_extraction.extract_ndvi(farms, batch_size=10, max_workers=2)
+    second = ndvi_extraction.extract_ndvi(farms, batch_size=10, max_workers=2)
+    assert fake_ee.calls['Initialize'] == 1
+    assert list(first.columns) == ndvi_extraction.OUTPUT_COLUMNS.split(',')
+    assert sorted(first['farm_id']) == ['F1', 'F2']
+    assert first.set_index('farm_id').loc['F2', 'delta'] == pytest.approx(0.5)
+    assert len(second) == 2
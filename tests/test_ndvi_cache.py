@@ -0,0 +1,98 @@
+import pandas as pd
+from shapely.geometry import Polygon
+from backend.services import ingest, ndvi_cache
+
+SQUARE = [(80.0, 28.0), (80.0005, 28.0), (80.0005, 28.0005), (80.0, 28.0005)]
+
+
+def test_geometry_hash_is_canonical():
+    base = Polygon(SQUARE)
+    rotated = Polygon(SQUARE[2:] + SQUARE[:2])
+    reversed_ring = Polygon(SQUARE[::-1])
+    noisy = Polygon([(x + 1e-10, y - 1e-10) for x, y in SQUARE])
+    moved = Polygon([(x + 0.001, y) for x, y in SQUARE])
+    hashes = ndvi_cache.geometry_hashes([base, rotated, reversed_ring, noisy, moved])
+    assert len(set(hashes[:4])) == 1
+    assert hashes[4] != hashes[0]
+
+
+def _farms(n):
+    """n farms with corner columns, as a CSV chunk is prepared for the pipeline"""
+    rows = []
+    for i in range(n):
+        lat = 28.0 + i * 0.001
+        rows.append({'farm_id': f'F{i}', 'Lang1': lat, 'Long1': 80.0, 'Lang2': lat, 'Long2': 80.0005,
+                     'Lang3': lat + 0.0005, 'Long3': 80.0005, 'Lang4': lat + 0.0005, 'Long4': 80.0})
+    return pd.DataFrame(rows)
+
+
+def _hashes(farms):
+    return ingest.farm_geometry_hashes(farms['farm_id'], ingest.polygons_from_frame(farms))
+
+
+def test_only_cache_misses_are_extracted(tmp_path, monkeypatch, recording_session):
+    farms = _farms(3)
+    hashes = _hashes(farms)
+    assert hashes.index.tolist() == ['F0', 'F1', 'F2']
+
+    stored = {}
+    cached = pd.DataFrame({'recent_date': ['2024-03-10'], 'recent_ndvi': [0.3], 'prev_date': ['2024-02-24'],
+                           'prev_ndvi': [0.6], 'delta': [-0.3]}, index=[hashes['F1']])
+    extracted = []
+
+    def fake_extract_ndvi(farms, checkpoint_path=None, on_flush=None, log=None):
+        assert {'Lang1', 'Long4'} <= set(farms.columns)
+        ids = farms['farm_id'].tolist()
+        extracted.extend(ids)
+        return pd.DataFrame({'farm_id': ids, 'recent_date': '2024-03-10', 'recent_ndvi': 0.7,
+                             'prev_date': '2024-02-24', 'prev_ndvi': 0.5, 'delta': 0.2})
+
+    monkeypatch.setattr(ingest, 'SessionLocal', recording_session)
+    monkeypatch.setenv('EE_PROJECT_ID', 'test-project')
+    monkeypatch.setattr(ingest.ndvi_providers.ndvi_extraction, 'extract_ndvi', fake_extract_ndvi)
+    monkeypatch.setattr(ingest.ndvi_cache, 'evict_expired', lambda db: 0)
+    monkeypatch.setattr(ingest.ndvi_cache, 'lookup', lambda db, keys, window: cached)
+    monkeypatch.setattr(ingest.ndvi_cache, 'store', lambda db, results, window: stored.update(
+        zip(results['farm_id'], results['geometry_hash'])))
+
+    log_path = str(tmp_path / 'ingest.log')
+    ndvi = ingest.extract_ndvi_cached(hashes, farms, log_path=log_path)
+
+    assert extracted == ['F0', 'F2']
+    assert stored == {'F0': hashes['F0'], 'F2': hashes['F2']}
+    assert sorted(ndvi['farm_id']) == ['F0', 'F1', 'F2']
+    assert ndvi.set_index('farm_id').loc['F1', 'recent_ndvi'] == 0.3
+    assert '1 hits, 2 misses (33.3% hit rate)' in open(log_path).read()
+
+
+def test_cloudy_farms_are_cached_without_ndvi(tmp_path, monkeypatch, recording_session):
+    farms = _farms(3)
+    hashes = _hashes(farms)
+    stored = []
+
+    def fake_extract_ndvi(farms, checkpoint_path=None, on_flush=None, log=None):
+        # F0 has NDVI, F1 is cloudy and F2 failed (neither written nor reported)
+        row = {'farm_id': 'F0', 'recent_date': '2024-03-10', 'recent_ndvi': 0.7,
+               'prev_date': '2024-02-24', 'prev_ndvi': 0.5, 'delta': 0.2}
+        on_flush([row], ['F1'])
+        return pd.DataFrame([row])
+
+    monkeypatch.setattr(ingest, 'SessionLocal', recording_session)
+    monkeypatch.setenv('EE_PROJECT_ID', 'test-project')
+    monkeypatch.setattr(ingest.ndvi_providers.ndvi_extraction, 'extract_ndvi', fake_extract_ndvi)
+    monkeypatch.setattr(ingest.ndvi_cache, 'store', lambda db, results, window: stored.append(results))
+    flushed = []
+    fresh = ingest.extract_ndvi_misses(hashes, farms, on_flush=lambda rows, empty: flushed.append(empty))
+
+    assert fresh['farm_id'].tolist() == ['F0']
+    assert flushed == [['F1']]
+    [entries] = stored
+    assert entries['geometry_hash'].tolist() == [hashes['F0'], hashes['F1']]
+    assert entries['recent_ndvi'].isna().tolist() == [False, True]
+
+    # A negative entry is a hit, but yields no NDVI
+    monkeypatch.setattr(ingest.ndvi_cache, 'evict_expired', lambda db: 0)
+    monkeypatch.setattr(ingest.ndvi_cache, 'lookup', lambda db, keys, window: entries.set_index('geometry_hash'))
+    cached, misses = ingest.lookup_cached_ndvi(hashes)
+    assert cached['farm_id'].tolist() == ['F0']
+    assert misses.index.tolist() == ['F2']
@@ -0,0 +1,96 @@
+import json
+import time
+import pandas as pd
+import pytest
+from backend.services import ndvi_extraction
+from backend.services.ndvi_checkpoint import Checkpoint, ResultWriter, source_fingerprint
+from fake_ee import FakeEE
+from test_ndvi_batch import _farms, _output
+
+RESULT = {'recent_date': '2024-03-10', 'recent_ndvi': 0.6, 'prev_date': '2024-02-24', 'prev_ndvi': 0.4}
+
+
+def test_writer_flushes_in_batches_to_checkpoint(tmp_path):
+    out = _output(tmp_path / 'ndvi.csv')
+    checkpoint = Checkpoint(str(tmp_path / 'ndvi.checkpoint'), 'abc')
+    checkpoint.load()
+    writer = ResultWriter(out, checkpoint, batch_rows=2, flush_seconds=60)
+    for i in range(5):
+        writer.add(f'F{i}', RESULT)
+    writer.add_empty('F9')
+    assert writer.close() == 5
+    assert pd.read_csv(out)['farm_id'].tolist() == ['F0', 'F1', 'F2', 'F3', 'F4']
+    lines = open(checkpoint.path).read().splitlines()
+    assert json.loads(lines[0])['fingerprint'] == 'abc'
+    assert len(lines) == 4
+    rows, done = Checkpoint(checkpoint.path, 'abc').load()
+    assert len(rows) == 5 and done == {'F0', 'F1', 'F2', 'F3', 'F4', 'F9'}
+
+
+def test_checkpoint_for_other_source_is_reset(tmp_path):
+    path = str(tmp_path / 'ndvi.checkpoint')
+    first = Checkpoint(path, source_fingerprint(_farms(3)))
+    first.load()
+    first.append([{'farm_id': 'F0', **RESULT, 'delta': 0.2}], [])
+    assert Checkpoint(path, source_fingerprint(_farms(3))).load()[1] == {'F0'}
+    assert Checkpoint(path, source_fingerprint(_farms(4))).load() == ([], set())
+
+
+def test_restarted_extraction_resumes(tmp_path, monkeypatch):
+    fake = FakeEE()
+    monkeypatch.setattr(ndvi_extraction, 'ee', fake)
+    out = _output(tmp_path / 'ndvi.csv')
+    checkpoint_path = str(tmp_path / 'ndvi.checkpoint')
+    farms = _farms(6)
+
+    real_fetch = ndvi_extraction.fetch_task
+
+    def failing_fetch(task):
+        if any(farm_id in ('F4', 'F5') for farm_id, _ in task[0]):
+            raise RuntimeError('Earth Engine unavailable')
+        return real_fetch(task)
+
+    monkeypatch.setattr(ndvi_extraction, 'fetch_task', failing_fetch)
+    first = ndvi_extraction.run_extraction(farms, out, batch_size=2, max_attempts=1, checkpoint_path=checkpoint_path)
+    assert first == 4
+    # Another job's farms get a manifest of their own and leave this one alone
+    other = ndvi_extraction.run_extraction(_farms(3), [], batch_size=2, max_attempts=1, checkpoint_path=checkpoint_path)
+    assert other == 3
+    assert len(list(tmp_path.glob('ndvi_*.checkpoint'))) == 1
+
+    monkeypatch.setattr(ndvi_extraction, 'fetch_task', real_fetch)
+    calls = fake.calls['reduceRegions']
+    flushed = []
+    second = ndvi_extraction.run_extraction(farms, out, batch_size=2, checkpoint_path=checkpoint_path,
+                                            on_flush=lambda rows, empty: flushed.extend(r['farm_id'] for r in rows))
+    assert second == 6
+    assert sorted(flushed) == [f'F{i}' for i in range(6)]
+    assert fake.calls['reduceRegions'] - calls == 1
+    assert sorted(pd.read_csv(out)['farm_id']) == [f'F{i}' for i in range(6)]
+    assert not list(tmp_path.glob('ndvi*.checkpoint'))
+
+
+def test_manifest_path_is_keyed_by_fingerprint():
+    from backend.services.ndvi_checkpoint import manifest_path
+    assert manifest_path('data/ndvi_checkpoint.jsonl', 'ab' * 20) == f"data/ndvi_checkpoint_{'ab' * 8}.jsonl"
+
+
+def test_failed_flush_cancels_extraction(tmp_path, monkeypatch):
+    from backend.services import ndvi_checkpoint
+    monkeypatch.setattr(ndvi_extraction, 'ee', FakeEE())
+    monkeypatch.setattr(ndvi_extraction, 'ResultWriter',
+                        lambda *args, **kwargs: ndvi_checkpoint.ResultWriter(*args, batch_rows=1, **kwargs))
+    fetched = []
+
+    def fetch(task):
+        fetched.append(task)
+        time.sleep(0.005)
+        return {str(farm_id): RESULT for farm_id, _ in task[0]}
+
+    def on_flush(rows, empty):
+        raise RuntimeError('database down')
+
+    with pytest.raises(RuntimeError, match='database down'):
+        ndvi_extraction.run_extraction(_farms(200), [], batch_size=1, max_workers=1, on_flush=on_flush,
+                                       fetch=fetch, checkpoint_path=str(tmp_path / 'ndvi.checkpoint'))
+    assert len(fetched) < 200
@@ -0,0 +1,64 @@
+import pandas as pd
+from backend.services import ndvi_history
+
+
+def _merged():
+    return pd.DataFrame({
+        'farm_id': [1, 'F2', 'F3'],
+        'Vill_Cd': ['12', None, '7'],
+        'recent_date': ['2024-03-10', '2025-01-04', None],
+        'recent_ndvi': [0.61, 0.42, None],
+        'prev_date': ['2024-02-24', '2024-12-20', '2024-03-10'],
+        'prev_ndvi': [0.55, None, 0.3],
+        'recent_cloud_free': [0.9, 1.0, None],
+    })
+
+
+def test_observations_one_row_per_acquisition():
+    obs = ndvi_history.observations(_merged())
+    assert obs.columns.tolist() == ndvi_history.OBSERVATION_COLUMNS
+    rows = [(o.farm_id, o.acquired_on.isoformat(), o.ndvi) for o in obs.itertuples()]
+    assert rows == [('1', '2024-03-10', 0.61), ('F2', '2025-01-04', 0.42),
+                    ('1', '2024-02-24', 0.55), ('F3', '2024-03-10', 0.3)]
+    assert obs.loc[0, 'vill_cd'] == 12 and pd.isna(obs.loc[1, 'vill_cd'])
+    assert obs.loc[0, 'cloud_free'] == 0.9
+    assert pd.isna(obs.loc[2, 'cloud_free'])
+
+
+def test_store_creates_yearly_partitions_and_upserts_once(recording_session):
+    # Both years' partitions are missing
+    db = recording_session([('to_regclass', [(2024,), (2025,)])])
+    assert ndvi_history.store(db, ndvi_history.observations(_merged())) == 4
+    sql = db.sql
+    assert 'to_regclass' in sql[0] and db.statements[0][1] == {'years': [2024, 2025]}
+    assert sql[1] == "SELECT pg_advisory_xact_lock(hashtext(:name))"
+    assert sql[2].startswith("CREATE TABLE IF NOT EXISTS ndvi_observations_2024 PARTITION OF ndvi_observations "
+                             "FOR VALUES FROM ('2024-01-01') TO ('2025-01-01')")
+    assert sql[3].startswith("CREATE TABLE IF NOT EXISTS ndvi_observations_2025")
+    assert len(sql) == 5 and 'ON CONFLICT (farm_id, acquired_on)' in sql[4]
+    params = db.statements[4][1]
+    assert params['vill_cd'] == [12, None, 12, 7]
+    assert ndvi_history.store(db, ndvi_history.observations(_merged().iloc[:0])) == 0
+
+
+def test_existing_partitions_take_no_lock(recording_session):
+    db = recording_session()
+    ndvi_history.ensure_partitions(db, [2024, 2024])
+    assert len(db.statements) == 1
+
+
+def test_series_buckets_in_sql_and_formats_points(recording_session):
+    from datetime import date
+    from decimal import Decimal
+    db = recording_session([('WITH obs', [(date(2024, 3, 10), Decimal('0.612345'), 0.9, 3),
+                                          (date(2024, 4, 1), None, None, 1)])])
+    points = ndvi_history.series(db, 'F1', start=date(2024, 1, 1), max_points=0)
+    [(sql, params)] = db.statements
+    assert params == {'farm_id': 'F1', 'max_points': 1, 'start': date(2024, 1, 1)}
+    assert 'WHERE farm_id = :farm_id AND acquired_on >= :start)' in sql
+    assert ("GROUP BY CASE WHEN s.n <= :max_points THEN o.acquired_on - s.first_on "
+            "ELSE (o.acquired_on - s.first_on) * :max_points / s.days END") in sql
+    assert points == [
+        {'date': '2024-03-10', 'ndvi': 0.6123, 'cloud_free': 0.9, 'observations': 3},
+        {'date': '2024-04-01', 'ndvi': None, 'cloud_free': None, 'observations': 1},
+    ]
@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+from shapely.geometry import box
+from backend.services import ingest
+
+ndvi_providers = ingest.ndvi_providers
+
+
+def _farms(n):
+    return pd.DataFrame({'farm_id': [f'F{i}' for i in range(n)],
+                         'geometry': [box(80 + i * 0.001, 28, 80.0005 + i * 0.001, 28.0005) for i in range(n)]})
+
+
+def test_unknown_provider_is_rejected():
+    with pytest.raises(ValueError, match='Unknown NDVI provider'):
+        ndvi_providers.get_provider('nope')
+    assert isinstance(ndvi_providers.get_provider('synthetic'), ndvi_providers.SyntheticProvider)
+
+
+def test_providers_implement_extract():
+    with pytest.raises(TypeError):
+        ndvi_providers.NdviProvider()
+    assert ndvi_providers.EarthEngineProvider.cacheable
+    assert not ndvi_providers.RasterProvider.cacheable
+
+
+def test_earth_engine_provider_needs_project(monkeypatch):
+    monkeypatch.delenv('EE_PROJECT_ID', raising=False)
+    with pytest.raises(RuntimeError, match='EE_PROJECT_ID'):
+        ndvi_providers.EarthEngineProvider().check()
+
+
+def test_synthetic_provider_is_deterministic_and_retries_failures():
+    def run():
+        provider = ndvi_providers.SyntheticProvider(latency=0, failure_rate=0.3, cloudy_rate=0.1, seed=7,
+                                                    batch_size=5, max_workers=4, max_attempts=20,
+                                                    base_backoff=0.001)
+        return provider, provider.extract(_farms(100)).sort_values('farm_id').reset_index(drop=True)
+
+    first, ndvi = run()
+    _, again = run()
+    pd.testing.assert_frame_equal(ndvi, again)
+    assert first.requests > 20
+    assert 80 <= len(ndvi) < 100  # cloudy farms are left out
+    assert ndvi['delta'].tolist() == pytest.approx((ndvi['recent_ndvi'] - ndvi['prev_ndvi']).tolist())
+
+
+def test_synthetic_failures_drop_farms_after_max_attempts():
+    provider = ndvi_providers.SyntheticProvider(latency=0, failure_rate=1.0, batch_size=10, max_attempts=1)
+    assert provider.extract(_farms(30)).empty
+    assert provider.requests == 3
+
+
+def test_synthetic_results_are_not_cached(monkeypatch):
+    provider = ndvi_providers.SyntheticProvider(latency=0, batch_size=2)
+    monkeypatch.setattr(ndvi_providers, 'get_provider', lambda name=None: provider)
+    monkeypatch.setattr(ingest.ndvi_cache, 'store', lambda *args: pytest.fail('synthetic NDVI was cached'))
+    misses = pd.Series(['h0', 'h1', 'h2'], index=['F0', 'F1', 'F2'])
+    fresh = ingest.extract_ndvi_misses(misses, farms=_farms(3).drop(columns='geometry').assign(
+        Lang1=28.0, Long1=80.0, Lang2=28.0, Long2=80.0005, Lang3=28.0005, Long3=80.0005, Lang4=28.0005, Long4=80.0))
+    assert sorted(fresh['farm_id']) == ['F0', 'F1', 'F2']
+
+
+def test_cloudy_farms_are_reported_once(capsys):
+    provider = ndvi_providers.SyntheticProvider(latency=0, cloudy_rate=1.0, batch_size=2)
+    messages = []
+    assert provider.extract(_farms(5), log=messages.append).empty
+    assert sum('No NDVI' in message for message in messages) == 1
+    assert any('No NDVI for 5 farms' in message for message in messages)
+    assert capsys.readouterr().out == ''
+
+
+def test_extraction_reports_go_to_the_ingest_log(tmp_path, monkeypatch):
+    provider = ndvi_providers.SyntheticProvider(latency=0, cloudy_rate=1.0, batch_size=2)
+    log_path = str(tmp_path / 'ingest.log')
+    ingest.run_ndvi_extraction(_farms(3), log_path, provider=provider)
+    log = open(log_path).read()
+    assert 'Extracting 3 farms in 2 requests' in log and 'No NDVI for 3 farms' in log and 'Scheduler:' in log
@@ -0,0 +1,86 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import box
+from backend.services import ndvi_raster
+
+
+def test_zonal_means_masks_clouds_and_counts_cover():
+    labels = np.array([[1, 1, 2, 2],
+                       [1, 1, 2, 2],
+                       [0, 0, 0, 0]])
+    ndvi = np.array([[0.2, 0.4, 0.9, 0.9],
+                     [0.6, 0.8, 0.1, 0.1],
+                     [0.5, 0.5, 0.5, 0.5]])
+    clear = np.array([[True, True, False, False],
+                      [True, True, False, False],
+                      [True, True, True, True]])
+    means, cloud_free = ndvi_raster.zonal_means(labels, ndvi, clear, 3)
+    assert means[0] == pytest.approx(0.5)
+    assert np.isnan(means[1]) and np.isnan(means[2])
+    assert cloud_free.tolist()[:2] == [1.0, 0.0]
+    assert np.isnan(cloud_free[2])
+
+
+def test_find_scenes_needs_all_three_bands(tmp_path):
+    for day, bands in (('2024-03-01', ('B04', 'B08', 'SCL')), ('2024-03-06', ('B04', 'B08')),
+                       ('notadate', ('B04', 'B08', 'SCL'))):
+        (tmp_path / day).mkdir()
+        for band in bands:
+            (tmp_path / day / f'T43RFM_{band}.tif').write_bytes(b'')
+    scenes = ndvi_raster.find_scenes(str(tmp_path))
+    assert [scene.acquired_on for scene in scenes] == [date(2024, 3, 1)]
+
+
+def _write_scene(root, day, red, nir, scl):
+    rasterio = pytest.importorskip('rasterio')
+    from rasterio.transform import from_origin
+    folder = root / day
+    folder.mkdir()
+    transform = from_origin(80.0, 28.01, 0.001, 0.001)
+    for band, data in (('B04', red), ('B08', nir), ('SCL', scl)):
+        with rasterio.open(folder / f'T43RFM_{band}.tif', 'w', driver='GTiff', height=data.shape[0],
+                           width=data.shape[1], count=1, dtype='uint16', crs='EPSG:4326',
+                           transform=transform) as dst:
+            dst.write(data.astype('uint16'), 1)
+
+
+def test_extract_ndvi_from_synthetic_rasters(tmp_path):
+    pytest.importorskip('rasterio')
+    shape = (10, 10)
+    vegetation = np.full(shape, 4)
+    cloudy = vegetation.copy()
+    cloudy[:, 5:] = 9  # cloud high probability over the east farm
+    _write_scene(tmp_path, '2024-03-02', np.full(shape, 1000), np.full(shape, 3000), vegetation)
+    _write_scene(tmp_path, '2024-03-12', np.full(shape, 1000), np.full(shape, 1000), cloudy)
+    farms = pd.DataFrame({'farm_id': ['W', 'E', 'OUT'], 'geometry': [
+        box(80.001, 28.002, 80.004, 28.008), box(80.006, 28.002, 80.009, 28.008), box(81.0, 29.0, 81.001, 29.001)]})
+    flushed = []
+    ndvi = ndvi_raster.extract_ndvi(farms, root=str(tmp_path), today=date(2024, 3, 15),
+                                    on_flush=lambda rows, empty: flushed.append((len(rows), list(empty))))
+    result = ndvi.set_index('farm_id')
+    assert result.index.tolist() == ['W']
+    assert result.loc['W', 'recent_ndvi'] == pytest.approx(0.0)
+    assert result.loc['W', 'prev_ndvi'] == pytest.approx(0.5)
+    assert result.loc['W', 'recent_date'] == '2024-03-12'
+    assert result.loc['W', 'recent_cloud_free'] == pytest.approx(1.0)
+    assert flushed == [(1, ['E', 'OUT'])]
+
+
+def test_compute_ndvi_combines_scenes_per_window(monkeypatch):
+    stats = {
+        date(2024, 2, 20): ([0.6, np.nan], [1.0, 0.0]),
+        date(2024, 3, 4): ([0.4, 0.7], [0.5, 1.0]),
+        date(2024, 3, 12): ([0.2, np.nan], [1.0, 0.0]),
+        date(2024, 1, 1): ([0.9, 0.9], [1.0, 1.0]),  # outside both windows
+    }
+    scenes = [ndvi_raster.Scene(day, 'b4', 'b8', 'scl') for day in sorted(stats)]
+    monkeypatch.setattr(ndvi_raster, 'scene_stats', lambda scene, polygons: tuple(map(np.array, stats[scene.acquired_on])))
+    result = ndvi_raster.compute_ndvi([box(0, 0, 1, 1), box(1, 0, 2, 1)], scenes, today=date(2024, 3, 15))
+    assert result['recent_ndvi'].tolist() == pytest.approx([0.3, 0.7])
+    assert result['recent_date'].tolist() == ['2024-03-12', '2024-03-04']
+    assert result['recent_cloud_free'].tolist() == pytest.approx([0.75, 0.5])
+    assert result.loc[0, 'prev_ndvi'] == pytest.approx(0.6) and result.loc[0, 'prev_date'] == '2024-02-20'
+    assert np.isnan(result.loc[1, 'prev_ndvi']) and pd.isna(result.loc[1, 'prev_date'])
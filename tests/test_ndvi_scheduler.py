@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+from backend.services.ndvi_scheduler import AdaptiveScheduler, is_quota_error
+
+
+def test_is_quota_error():
+    assert is_quota_error(Exception('HttpError 429: Too Many Requests'))
+    assert is_quota_error(Exception('User memory limit exceeded. Quota exceeded'))
+    assert not is_quota_error(Exception('Geometry is invalid'))
+    assert not is_quota_error(Exception('Farm 14290 has no pixels'))
+
+
+class HttpError(Exception):
+    def __init__(self, status, reason):
+        super().__init__(reason)
+        self.resp = type('Response', (), {'status': status})()
+
+
+def test_quota_error_uses_the_http_status():
+    assert is_quota_error(HttpError(429, 'Resource exhausted'))
+    assert not is_quota_error(HttpError(500, 'Quota service unavailable'))
+    # ee.data raises EEException while handling the HttpError
+    try:
+        try:
+            raise HttpError(429, 'Too many concurrent aggregations.')
+        except HttpError as e:
+            raise RuntimeError('Computation failed')
+    except RuntimeError as e:
+        assert is_quota_error(e)
+
+
+def test_all_tasks_processed_in_order():
+    seen = []
+    scheduler = AdaptiveScheduler(lambda n: n * n, max_workers=4, on_result=lambda task, result: seen.append(task))
+    results, dropped = scheduler.run(list(range(50)))
+    assert results == [n * n for n in range(50)]
+    assert dropped == []
+    assert sorted(seen) == list(range(50))
+
+
+def test_quota_errors_are_retried_with_backoff():
+    failures = {3: 2, 7: 1}
+    lock = threading.Lock()
+
+    def fetch(n):
+        with lock:
+            if failures.get(n):
+                failures[n] -= 1
+                raise RuntimeError('429 Too Many Requests')
+        return n
+
+    scheduler = AdaptiveScheduler(fetch, max_workers=4, initial_workers=4, base_backoff=0.001, max_attempts=3)
+    results, dropped = scheduler.run(list(range(10)))
+    assert results == list(range(10))
+    assert dropped == []
+    assert scheduler.stats['retries'] == 3
+    assert scheduler.stats['quota_errors'] == 3
+    assert scheduler.limit < 4
+
+
+def test_task_dropped_after_max_attempts():
+    attempts = []
+
+    def fetch(n):
+        if n == 2:
+            attempts.append(n)
+            raise RuntimeError('Computation timed out')
+        return n
+
+    scheduler = AdaptiveScheduler(fetch, max_workers=2, base_backoff=0.001, max_attempts=3)
+    results, dropped = scheduler.run(list(range(5)))
+    assert results == [0, 1, None, 3, 4]
+    assert [task for task, _ in dropped] == [2]
+    assert len(attempts) == 3
+
+
+def test_concurrency_grows_while_healthy_and_respects_limit():
+    active = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def fetch(n):
+        with lock:
+            active.append(n)
+            peak[0] = max(peak[0], len(active))
+        time.sleep(0.002)
+        with lock:
+            active.remove(n)
+        return n
+
+    scheduler = AdaptiveScheduler(fetch, max_workers=6, initial_workers=1, window=5, latency_tolerance=10)
+    scheduler.run(list(range(120)))
+    assert scheduler.limit > 1
+    assert peak[0] <= 6
+    assert peak[0] <= scheduler.stats['peak_concurrency'] <= 6
+
+
+def test_cancel_stops_handing_out_tasks():
+    scheduler = AdaptiveScheduler(lambda n: n, max_workers=1, initial_workers=1,
+                                  on_result=lambda task, result: task == 4 and scheduler.cancel())
+    results, dropped = scheduler.run(list(range(20)))
+    assert results[:5] == list(range(5))
+    assert results[5:] == [None] * 15
+    assert dropped == []
+
+
+def test_failing_result_handler_stops_the_run():
+    def on_result(task, result):
+        if task == 2:
+            raise ValueError('disk full')
+
+    scheduler = AdaptiveScheduler(lambda n: n, max_workers=1, initial_workers=1, on_result=on_result)
+    with pytest.raises(ValueError, match='disk full'):
+        scheduler.run(list(range(10)))
+    assert scheduler.results[3:] == [None] * 7
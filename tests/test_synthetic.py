@@ -0,0 +1,24 @@
+import pandas as pd
+from backend.benchmarks import synthetic
+from backend.services import ingest
+
+
+def test_generated_csv_matches_reported_counts(tmp_path):
+    path = tmp_path / 'farms.csv'
+    stats = synthetic.generate_farm_csv(str(path), 3000, bad_rate=0.05, dup_rate=0.03, seed=1)
+    df = pd.read_csv(path)
+    assert list(df.columns) == ingest.REQUIRED_COLUMNS
+    assert len(df) == stats['rows'] == 3000
+    assert df['farm_id'].duplicated().sum() == stats['duplicates'] > 0
+
+    gdf, rejected = ingest.load_farm_polygons(str(path))
+    assert rejected == stats['bad'] > 0
+    assert len(gdf) == stats['valid']
+
+
+def test_stub_ndvi_covers_every_farm(tmp_path):
+    farms = tmp_path / 'farms.csv'
+    ndvi = tmp_path / 'ndvi.csv'
+    synthetic.generate_farm_csv(str(farms), 500, seed=2)
+    assert synthetic.generate_ndvi_csv(str(farms), str(ndvi)) == pd.read_csv(farms)['farm_id'].nunique()
+    assert list(pd.read_csv(ndvi).columns) == ['farm_id', 'recent_date', 'recent_ndvi', 'prev_date', 'prev_ndvi', 'delta']